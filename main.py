@@ -3,9 +3,16 @@ from modules.maintenence import *
 from modules.stream_data import *
 from modules.ssvep_handler import *
 from modules.stim_pres import *
+from modules.recorder import *
+from modules.dynamic_stopping import *
+from modules.ensemble import *
+from modules.lock_in import *
+from modules.instrumentation import *
+from modules.persistence import *
 
 from brainflow.board_shim import BoardShim, BrainFlowInputParams, BoardIds, BrainFlowPresets
 from pynput import keyboard
+import os
 
 ## Adjust As Necessary
 serial_port = 'COM7' # Insert port where Cyton Dongle is inserted. This looks different on MAC/Linux -> "/dev/tty*"
@@ -15,7 +22,16 @@ frequencies = [9.25, 13.25, 17.25, 21.25]
 # buttons = ['Right', 'Left', 'Up', 'Down'] # Adds custom text to each box - must be same length as frequencies 
 button_pos = [0, 2, 3, 1] # Assigns positions to custom text - must be same length as buttons
 segment_duration = 5 # seconds
+hop_duration = 0.25 # seconds between overlapping windows (decision rate)
+dynamic_stopping = False # True --> FBCCA commits as soon as it is confident (checked every 0.5 s, at most segment_duration)
 display = 0 # Which screen to display the stimulus paradigm on --> 0 is default
+replay_file = None # e.g. 'tinkering/sim_ssvep_data.npy' --> replays a saved recording instead of streaming from the board (no stimulus)
+replay_speed = 1.0 # 1.0 = real time, None = as fast as the classifiers can keep up (load testing)
+record_file = None # e.g. 'session.rec' --> records the raw board data (all rows) to a binary session file
+ensemble_executor = 'thread' # 'thread' or 'process' --> how the classifiers run concurrently on each window
+lock_in_gate = None # e.g. 3.0 --> only run the CCA classifiers when the lock-in detector sees a target with this SNR (dB)
+model_dir = None # e.g. 'models' --> saves the classifiers there on the first run and loads them (near-instant) afterwards
+latency_log = None # e.g. 'latency.json' --> times every pipeline stage and dumps latency histograms every minute and on exit
 
 # Static Variables - Probably don't need to touch :)
 harmonics = np.arange(1, 6) # Generates the 1st, 2nd, & 3rd Harmonics
@@ -31,6 +47,21 @@ print(f"Sampling Rate: {sampling_rate}")
 print(f"Default Channels: {eeg_channels}")
 print(f"Channel Mapping: {channel_mapping}")
 
+def load_or_build(name, cls, *args, **kwargs):
+    """
+    Loads a classifier saved in model_dir, or builds cls(*args, **kwargs) and saves it there when model_dir is set.
+    A saved classifier is rebuilt if any of its constructor parameters differs from args/kwargs, see bundle_matches().
+    """
+    if model_dir is None:
+        return cls(*args, **kwargs)
+    path = os.path.join(model_dir, name + CLASSIFIER_EXTENSION)
+    if os.path.exists(path) and bundle_matches(path, cls, *args, **kwargs):
+        return cls.load(path)
+    classifier = cls(*args, **kwargs)
+    os.makedirs(model_dir, exist_ok=True)
+    classifier.save(path)
+    return classifier
+
 def run_stimulus():
     stimulus = SSVEPStimulus(frequencies, box_text_indices=button_pos, show_both=True, display_index=display) # box_texts=buttons,
     stimulus.run()
@@ -42,13 +73,36 @@ def main():
     key_listener.run_listener()
 
     ## Initializing Board  
-    board = BrainFlowBoardSetup(board_id, serial_port)
+    if replay_file is not None:
+        board = ReplayBoard(replay_file, board_id, speed=replay_speed)
+    else:
+        board = BrainFlowBoardSetup(board_id, serial_port)
     # board.show_params() # Logger shows this info by default - this is another method to show
     board.setup()
+
+    # Optionally record the raw board data on a background thread
+    recorder = None
+    if record_file is not None:
+        recorder = SessionRecorder(record_file, board_id, sampling_rate, channel_mapping, eeg_channels=board.eeg_channels,
+                                   timestamp_channel=board.timestamp_channel, marker_channel=board.marker_channel)
+        board.add_listener(recorder.write)
+
+    # Filter new samples as they arrive (filter state carries over between chunks) into a filtered ring buffer
+    stream_filter = StreamingFilter(len(board.eeg_channels), sampling_rate, lowcut=0.5, highcut=30.0)
+
+    # Per-stage latency histograms (no-op unless latency_log is set)
+    monitor = LatencyMonitor(enabled=latency_log is not None, dump_file=latency_log)
+    stream_filter.process = monitor.timed('filter_data', stream_filter.process) # Runs on the acquisition thread
+
+    # Cheap always-on detector fed with every filtered chunk on the acquisition thread
+    lock_in = LockInDetector(frequencies, harmonics, sampling_rate, len(board.eeg_channels))
+    board.add_listener(lock_in.process, filtered=True)
+    board.start_acquisition(buffer_duration=30, stream_filter=stream_filter) # Background thread that keeps the EEG rows in a ring buffer
     
     # Letting 5 seconds of data accumulate
-    print(f"....Warming up....")
-    time.sleep(5)
+    if replay_file is None:
+        print(f"....Warming up....")
+        time.sleep(5)
     
     # Reading Data
     # data = board.get_board_data()
@@ -57,60 +111,120 @@ def main():
     # print(f"(Channels, Samples)")
     
     ## Initializing Segmenter Class
-    segmenter = PreProcess(board, segment_duration=segment_duration)
+    segmenter = PreProcess(board, segment_duration=segment_duration, hop_duration=hop_duration)
     
     # Initialize the SSVEP Classification & Harmonics handler
-    classifier = ClassifySSVEP(frequencies, harmonics, sampling_rate, n_samples, stack_harmonics=False)
-    classifier_stacked = ClassifySSVEP(frequencies, harmonics, sampling_rate, n_samples, stack_harmonics=True)
-    fbcca_classifier = FBCCA(frequencies, harmonics, sampling_rate, n_samples)
+    classifier = load_or_build('cca', ClassifySSVEP, frequencies, harmonics, sampling_rate, n_samples, stack_harmonics=False)
+    classifier_stacked = load_or_build('stacked', ClassifySSVEP, frequencies, harmonics, sampling_rate, n_samples, stack_harmonics=True)
+    fbcca_classifier = load_or_build('fbcca', FBCCA, frequencies, harmonics, sampling_rate, n_samples)
+    decoder = DynamicStoppingDecoder(fbcca_classifier, sampling_rate, step_duration=0.5, max_duration=segment_duration)
+
+    # Run the classifiers (and the SNR check) concurrently on each window; the fused detection is a majority vote
+    ensemble = ClassifierEnsemble(executor=ensemble_executor, fusion='vote')
+    ensemble.register('cca', classifier, 'cca_analysis')
+    ensemble.register('stacked', classifier_stacked, 'cca_analysis')
+    ensemble.register('fbcca', fbcca_classifier, 'fbcca_analysis')
+    ensemble.register('snr', classifier_stacked, 'check_snr', vote=False)
     
     # Start the stimulus presentation in a separate thread
-    stimulus_thread = threading.Thread(target=run_stimulus)
-    stimulus_thread.start()
+    if replay_file is None:
+        stimulus_thread = threading.Thread(target=run_stimulus)
+        stimulus_thread.start()
     
+    reported_drops = 0
+    n_windows = 0
+    n_decisions = 0
+    start_time = time.perf_counter()
     try:
         while not key_listener.stop_flag:
-            # Step 1: Get a segment of data
-            segment = segmenter.get_segment()
-            if segment is not None:
-                
-                # print(f"Segment shape: {segment.shape}")
-
-                # Only the first 8 channels are EEG data, so we slice out the remaining channels (9-24)    
-                eeg_segment = segment[:8, :]
-
-                # Step 2: Filter the data
-                filtered_segment = segmenter.filter_data(eeg_segment)
+            if dynamic_stopping:
+                # Grow the trial every hop until the decoder is confident, then start a new trial
+                with monitor.stage('get_trial'):
+                    trial = segmenter.get_trial(filtered=True)
+                if trial is None and replay_file is not None and board.exhausted:
+                    break
+                with monitor.stage('dynamic_stopping'):
+                    decision = decoder.update(trial) if trial is not None else None
+                if decision is not None:
+                    if replay_file is None: # Replayed timestamps are from the original session
+                        monitor.record_decision(board.sample_timestamp(segmenter.segment_end - 1))
+                    detected_freq, score, decision_time = decision
+                    print(f"Dynamic stopping: Detected frequency: {detected_freq} Hz (score {score:.3f}) after {decision_time:.2f} s")
+                    segmenter.start_trial()
+                continue
+
+            # Step 1: Wait for the next sliding window (one every hop_duration seconds)
+            # Step 2: Windows come from the streaming-filtered ring buffer, so they are already bandpass filtered
+            with monitor.stage('get_segment'):
+                filtered_segment = segmenter.get_next_segment(filtered=True)
+            if filtered_segment is None and replay_file is not None and board.exhausted:
+                break
+            if filtered_segment is not None:
                 print("Filtered data shape:", filtered_segment.shape)
+                lock_in_freq, lock_in_snr = lock_in.detect(lock_in_gate if lock_in_gate is not None else -np.inf)
+                print(f"Lock-in: Detected frequency: {lock_in_freq} Hz with SNR: {lock_in_snr:.2f} dB")
+                if lock_in_gate is not None and lock_in_freq is None:
+                    continue # No target stands out; skip the CCA classifiers for this window
+                n_windows += 1
 
-                # Step 3: Use CCA to match the EEG & Reference (harmonic) signals
+                # Step 3: Use CCA to match the EEG & Reference (harmonic) signals, running all classifiers at once
                     # Unstacked Harmonics (testing)
-                detected_freq, correlation = classifier.cca_analysis(filtered_segment)
+                results = ensemble.run(filtered_segment)
+                n_decisions += len(ensemble.voters) # Every voting classifier made a decision on this window
+                for name, seconds in ensemble.last_timings.items():
+                    monitor.record(name, seconds)
+                monitor.record('ensemble', ensemble.last_wall_time)
+                if replay_file is None: # Replayed timestamps are from the original session
+                    monitor.record_decision(board.sample_timestamp(segmenter.segment_end - 1))
+                detected_freq, correlation = results['cca']
                 print(f"Detected frequency: {detected_freq} Hz with correlation: {correlation}")
                 
-                detected_freq_stacked, correlation_stacked = classifier_stacked.cca_analysis(filtered_segment)
+                detected_freq_stacked, correlation_stacked = results['stacked']
                 print(f"Stacked CCA: Detected frequency: {detected_freq_stacked} Hz with correlation: {correlation_stacked}")
 
-                detected_freq_fbcca, correlation_fbcca = fbcca_classifier.fbcca_analysis(filtered_segment)
+                detected_freq_fbcca, correlation_fbcca = results['fbcca']
                 print(f"FBCCA: Detected frequency: {detected_freq_fbcca} Hz with correlation: {correlation_fbcca}")
 
+                fused_freq, votes = results['fused']
+                print(f"Fused: Detected frequency: {fused_freq} Hz with {votes}/{len(ensemble.voters)} votes")
+
                 # Check SNR for each target frequency
-                snr_results = classifier_stacked.check_snr(filtered_segment)
+                snr_results = results['snr']
                 for freq, snr in snr_results.items():
                     print(f"Frequency: {freq} Hz, SNR: {snr:.2f} dB")
 
+                timings = ", ".join(f"{name} {1000 * seconds:.1f} ms" for name, seconds in ensemble.last_timings.items())
+                print(f"Window took {1000 * ensemble.last_wall_time:.1f} ms ({timings})")
+
                 # Optionally save or process the data further
                 # segmenter.save_data(filtered_data, "filtered_data.csv")
                 # segmenter.save_data(features, "features.csv")
 
-            # Sleep for a while to collect new data
-            time.sleep(segmenter.segment_duration)
+                if segmenter.dropped_windows > reported_drops:
+                    print(f"Classifiers falling behind: {segmenter.dropped_windows - reported_drops} window(s) dropped ({segmenter.dropped_windows} total)")
+                    reported_drops = segmenter.dropped_windows
 
     except KeyboardInterrupt:
         pass
 
     finally:
         board.stop()
+        ensemble.close()
+        if recorder is not None:
+            recorder.close()
+        elapsed = time.perf_counter() - start_time
+        if monitor.enabled:
+            for name, stats in monitor.summary().items():
+                print(f"Latency {name}: p50 {stats['p50_ms']:.1f} ms, p90 {stats['p90_ms']:.1f} ms, "
+                      f"p99 {stats['p99_ms']:.1f} ms, max {stats['max_ms']:.1f} ms ({stats['count']} samples)")
+        if dynamic_stopping:
+            # Trials grow until the decoder commits, so report committed decisions rather than windows
+            stats = decoder.summary()
+            print(f"Dynamic stopping: {stats['n_decisions']} decisions in {elapsed:.1f} s "
+                  f"({stats['n_decisions'] / elapsed:.2f} decisions/s), mean decision time {stats['mean_decision_time']:.2f} s")
+        else:
+            print(f"Processed {n_windows} windows in {elapsed:.1f} s ({n_windows / elapsed:.2f} windows/s, "
+                  f"{n_decisions / elapsed:.2f} decisions/s), dropped windows: {segmenter.dropped_windows}")
         print("\nSession Exited Successfully\n")
         
         
@@ -0,0 +1,53 @@
+from multiprocessing import shared_memory
+import numpy as np
+
+# Per-process state of the process-pool workers used by ensemble.py and evaluation.py
+_worker_classifiers = {}
+_worker_memory = {}
+
+
+def init_worker(classifiers):
+    """
+    Stores the classifiers in a process-pool worker (pass as the pool initializer; runs once per worker).
+    """
+    _worker_classifiers.clear()
+    _worker_classifiers.update(classifiers)
+
+
+def worker_classifier(name):
+    """
+    Returns the classifier (or whatever was registered under name) stored by init_worker().
+    """
+    return _worker_classifiers[name]
+
+
+def attach_shared_array(memory_name, shape, dtype):
+    """
+    Returns a view of an array held in a shared-memory block, attaching the block in this worker on first use.
+
+    Only the most recently used block stays attached: blocks from previous windows or recordings are closed
+    when a new one arrives, so workers do not keep freed memory mapped.
+
+    Args:
+        memory_name (str): The name of the shared-memory block.
+        shape (tuple): The shape of the array.
+        dtype (str): The dtype of the array.
+
+    Returns:
+        np.ndarray: The array, backed by the shared-memory block.
+    """
+    memory = _worker_memory.get(memory_name)
+    if memory is None:
+        for stale in _worker_memory.values():
+            stale.close()
+        _worker_memory.clear()
+        memory = _worker_memory[memory_name] = shared_memory.SharedMemory(name=memory_name)
+    return np.ndarray(shape, dtype=dtype, buffer=memory.buf)
+
+
+def release_shared_memory(memory):
+    """
+    Closes and frees a shared-memory block created by this process.
+    """
+    memory.close()
+    memory.unlink()
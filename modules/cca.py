@@ -0,0 +1,119 @@
+import numpy as np
+
+CCA_BACKENDS = ('mvlearn', 'qr', 'batched')
+
+
+def orthonormal_basis(data):
+    """
+    Computes an orthonormal basis of the column space of mean-centred data, robust to rank deficiency.
+
+    The data is QR-decomposed and R is split by a small SVD, so directions whose singular value falls below a relative
+    tolerance (flat, railed or duplicated channels) get a zero column instead of an arbitrary unit vector; an
+    unpivoted QR alone would let those directions correlate with the references. All-zero data gives a zero basis.
+
+    Args:
+        data (np.ndarray): The data, shape (..., n_samples, n_features). Leading axes are treated as a stack.
+
+    Returns:
+        np.ndarray: The basis, shape (..., n_samples, min(n_samples, n_features)), with orthonormal columns
+            spanning the data and zero columns for the missing rank.
+    """
+    centered = data - data.mean(axis=-2, keepdims=True)
+    q, r = np.linalg.qr(centered)
+    u, s, _ = np.linalg.svd(r)
+    tolerance = s[..., :1] * max(data.shape[-2:]) * np.finfo(s.dtype).eps  # As np.linalg.matrix_rank
+    return q @ (u * (s > tolerance)[..., None, :])
+
+
+def canonical_correlations(x_basis, y_basis):
+    """
+    Computes the canonical correlations between two data sets from their orthonormal bases.
+
+    The canonical correlations are the singular values of Qx.T @ Qy, which gives the same values as
+    fitting a CCA model and correlating the projected variates, without any iterative solver.
+
+    Args:
+        x_basis (np.ndarray): The orthonormal basis of the first data set, shape (..., n_samples, n_x).
+        y_basis (np.ndarray): The orthonormal basis of the second data set, shape (..., n_samples, n_y).
+
+    Returns:
+        np.ndarray: The canonical correlations in descending order, shape (..., min(n_x, n_y)).
+    """
+    return np.linalg.svd(np.swapaxes(x_basis, -1, -2) @ y_basis, compute_uv=False)
+
+
+def canonical_weights(x, y):
+    """
+    Computes the weights of the first (most correlated) pair of canonical variates of two data sets.
+
+    Args:
+        x (np.ndarray): The first data set, shape (n_samples, n_x).
+        y (np.ndarray): The second data set, shape (n_samples, n_y).
+
+    Returns:
+        tuple: The weights for x, shape (n_x,), and for y, shape (n_y,). x @ x_weights and y @ y_weights
+            are the first canonical variates.
+    """
+    qx, rx = np.linalg.qr(x - x.mean(axis=0))
+    qy, ry = np.linalg.qr(y - y.mean(axis=0))
+    u, _, vt = np.linalg.svd(qx.T @ qy)
+    x_weights = np.linalg.lstsq(rx, u[:, 0], rcond=None)[0]
+    y_weights = np.linalg.lstsq(ry, vt[0], rcond=None)[0]
+    return x_weights, y_weights
+
+
+def covariance_canonical_correlations(cxx, cyy, cxy, regularization=1e-10):
+    """
+    Computes the largest canonical correlation from (cross-)covariance matrices instead of the data.
+
+    The squared canonical correlations are the eigenvalues of Wx @ Cxy @ Cyy^-1 @ Cyx @ Wx.T, where Wx whitens Cxx
+    (the inverse of its Cholesky factor). This is the generalized eigenproblem of CCA solved on (n_x x n_x)
+    matrices, so its cost does not depend on the number of samples.
+
+    Args:
+        cxx (np.ndarray): The covariance of the first data set, shape (n_x, n_x).
+        cyy (np.ndarray): The covariances of the reference sets, shape (..., n_y, n_y).
+        cxy (np.ndarray): The cross-covariances, shape (..., n_x, n_y).
+        regularization (float): Ridge added to each diagonal, relative to its mean, so singular covariances (e.g. flat
+            channels) stay solvable. A covariance that is not positive semi-definite (e.g. all zero up to rounding)
+            cannot be regularized and raises LinAlgError.
+
+    Returns:
+        np.ndarray: The largest canonical correlation for each reference set, shape (...).
+    """
+    def ridged(cov):
+        trace = np.maximum(np.trace(cov, axis1=-2, axis2=-1), 0)[..., None, None]  # Rounding can leave it below zero
+        ridge = regularization * trace / cov.shape[-1] + np.finfo(float).tiny
+        return cov + ridge * np.eye(cov.shape[-1])
+
+    whitened = np.linalg.inv(np.linalg.cholesky(ridged(cxx))) @ cxy
+    product = whitened @ np.linalg.solve(ridged(cyy), np.swapaxes(whitened, -1, -2))
+    return np.sqrt(np.clip(np.linalg.eigvalsh(product)[..., -1], 0, 1))
+
+
+def stacked_max_canonical_correlations(data, reference_bases, regularization=1e-14):
+    """
+    Computes the largest canonical correlation between each data set of a stack and every reference set.
+
+    Same result as the first of canonical_correlations(orthonormal_basis(data), basis) for every reference basis, but a
+    stack of small QR decompositions is slow (one LAPACK call per data set), so the data is whitened through the Cholesky
+    factor of its Gram matrix instead, which only takes large matrix products. The data is centred before the Gram
+    product: expanding it as X.T @ X - n * mean @ mean.T cancels catastrophically for channels with a large DC offset
+    (e.g. a railed channel in a raw window), leaving a Gram matrix that is not positive definite.
+
+    Args:
+        data (np.ndarray): The data sets, shape (n_sets, n_samples, n_x).
+        reference_bases (np.ndarray): The stacked orthonormal reference bases, shape (n_targets, n_samples, n_y).
+        regularization (float): Ridge added to the Gram diagonal, relative to its mean, so flat data sets score 0.
+
+    Returns:
+        np.ndarray: The largest canonical correlation for each data set and reference set, shape (n_sets, n_targets).
+    """
+    data = data - data.mean(axis=-2, keepdims=True)
+    gram = np.swapaxes(data, -1, -2) @ data
+    ridge = regularization * np.trace(gram, axis1=-2, axis2=-1)[..., None, None] / gram.shape[-1] + np.finfo(float).tiny
+    whitener = np.linalg.inv(np.linalg.cholesky(gram + ridge * np.eye(gram.shape[-1])))  # (n_sets, n_x, n_x)
+    projections = np.tensordot(data, reference_bases, axes=([-2], [-2]))  # (n_sets, n_x, n_targets, n_y)
+    whitened = whitener[:, None] @ np.moveaxis(projections, -2, -3)  # (n_sets, n_targets, n_x, n_y)
+    squared = np.linalg.eigvalsh(np.swapaxes(whitened, -1, -2) @ whitened)[..., -1]
+    return np.sqrt(np.clip(squared, 0, 1))
@@ -0,0 +1,159 @@
+import numpy as np
+from .metrics import information_transfer_rate
+
+
+class DynamicStoppingDecoder:
+    """
+    Wraps a classifier (ClassifySSVEP, FBCCA, ...) so each decision uses only as much data as it needs.
+
+    The current trial is scored at increasing lengths (e.g. 0.5 s, 1.0 s, 1.5 s, ...), and a decision is
+    committed as soon as the stopping criterion is met, or at max_duration as a fallback.
+
+    Stopping criteria:
+        - 'margin': (best - second best) / best >= threshold
+        - 'probability': the softmax of the scores (scaled by 1 / temperature) of the best target >= threshold
+
+    Attributes:
+        classifier: Any classifier with a `frequencies` list and a `score(eeg_data)` method.
+        sampling_rate (int): The sampling rate of the EEG data.
+        checkpoints (list): The trial lengths, in samples, at which the trial is scored.
+        decision_times (list): The duration in seconds of every committed decision.
+        outcomes (list): Whether each decision was correct, for decisions with a known label.
+    """
+
+    def __init__(self, classifier, sampling_rate, step_duration=0.5, min_duration=0.5, max_duration=4.0,
+                 criterion='margin', threshold=0.2, temperature=0.05):
+        """
+        Initializes the DynamicStoppingDecoder.
+
+        Args:
+            classifier: Any classifier with a `frequencies` list and a `score(eeg_data)` method.
+            sampling_rate (int): The sampling rate of the EEG data.
+            step_duration (float): The time in seconds between consecutive checkpoints.
+            min_duration (float): The length in seconds of the first checkpoint.
+            max_duration (float): The length in seconds at which a decision is always committed.
+            criterion (str): 'margin' or 'probability'.
+            threshold (float): The margin or probability needed to stop early.
+            temperature (float): The softmax temperature used by the 'probability' criterion.
+        """
+        if criterion not in ('margin', 'probability'):
+            raise ValueError(f"Unknown stopping criterion '{criterion}', expected 'margin' or 'probability'")
+        self.classifier = classifier
+        self.sampling_rate = sampling_rate
+        self.criterion = criterion
+        self.threshold = threshold
+        self.temperature = temperature
+        step = max(1, int(step_duration * sampling_rate))
+        first = max(1, int(min_duration * sampling_rate))
+        last = int(max_duration * sampling_rate)
+        self.checkpoints = list(range(first, last, step)) + [last]
+        self.decision_times = []
+        self.outcomes = []
+        self._next_checkpoint = 0
+
+    def confidence(self, scores):
+        """
+        Returns the stopping statistic (margin or probability) for a vector of target scores.
+
+        Args:
+            scores (np.ndarray): The score of every target.
+
+        Returns:
+            float: The margin or probability of the best target.
+        """
+        scores = np.asarray(scores, dtype=float)
+        if self.criterion == 'probability':
+            exponents = np.exp((scores - scores.max()) / self.temperature)
+            return float(exponents.max() / exponents.sum())
+        if len(scores) < 2:
+            return 1.0
+        second, best = np.partition(scores, -2)[-2:]
+        return float((best - second) / best) if best > 0 else 0.0
+
+    def _commit(self, scores, n_samples, label):
+        """
+        Records and returns a decision.
+        """
+        best = int(np.argmax(scores))
+        target_freq = self.classifier.frequencies[best]
+        decision_time = n_samples / self.sampling_rate
+        self.decision_times.append(decision_time)
+        if label is not None:
+            self.outcomes.append(target_freq == label)
+        self._next_checkpoint = 0
+        return target_freq, float(scores[best]), decision_time
+
+    def decide(self, trial_data, label=None):
+        """
+        Decodes a complete trial offline, stopping at the first checkpoint that meets the criterion.
+
+        Args:
+            trial_data (np.ndarray): The trial from stimulus onset, shape (n_channels, >= max_duration samples).
+            label (float): The true target frequency, if known, for the accuracy metrics.
+
+        Returns:
+            tuple: The detected frequency, its score, and the decision time in seconds. A trial shorter than
+                max_duration is decided at its last complete checkpoint at the latest.
+
+        Raises:
+            ValueError: If the trial is shorter than the first checkpoint, so there is nothing to score.
+        """
+        checkpoints = [n for n in self.checkpoints if n <= trial_data.shape[1]]
+        if not checkpoints:
+            raise ValueError(f"The trial has {trial_data.shape[1]} samples, fewer than the first checkpoint "
+                             f"({self.checkpoints[0]} samples)")
+        for n_samples in checkpoints:
+            scores = self.classifier.score(trial_data[:, :n_samples])
+            if self.confidence(scores) >= self.threshold or n_samples == checkpoints[-1]:
+                return self._commit(scores, n_samples, label)
+
+    def update(self, trial_data, label=None):
+        """
+        Feeds the data of the ongoing trial (all samples since onset) and commits a decision when possible.
+
+        Only the longest checkpoint reached since the previous call is scored, so falling behind does not
+        queue up work. After a decision, the next call is treated as the start of a new trial.
+
+        Args:
+            trial_data (np.ndarray): All samples since the trial started, shape (n_channels, n_samples).
+            label (float): The true target frequency, if known, for the accuracy metrics.
+
+        Returns:
+            tuple: The detected frequency, its score, and the decision time in seconds, or None if undecided.
+        """
+        reached = self._next_checkpoint
+        while reached < len(self.checkpoints) and self.checkpoints[reached] <= trial_data.shape[1]:
+            reached += 1
+        if reached == self._next_checkpoint:
+            return None
+        n_samples = self.checkpoints[reached - 1]
+        scores = self.classifier.score(trial_data[:, :n_samples])
+        if self.confidence(scores) >= self.threshold or reached == len(self.checkpoints):
+            return self._commit(scores, n_samples, label)
+        self._next_checkpoint = reached
+        return None
+
+    def reset(self):
+        """
+        Abandons the ongoing trial.
+        """
+        self._next_checkpoint = 0
+
+    def summary(self, accuracy=None, inter_trial_interval=0.0):
+        """
+        Summarizes the committed decisions.
+
+        Args:
+            accuracy (float): The accuracy to use for the ITR if no labelled decisions were recorded.
+            inter_trial_interval (float): Time in seconds between trials (e.g. gaze shifts) added to each decision for the ITR.
+
+        Returns:
+            dict: The number of decisions, mean decision time (s), accuracy and ITR (bits/min).
+        """
+        if self.outcomes:
+            accuracy = float(np.mean(self.outcomes))
+        mean_time = float(np.mean(self.decision_times)) if self.decision_times else float('nan')
+        itr = None
+        if accuracy is not None and self.decision_times:
+            itr = information_transfer_rate(len(self.classifier.frequencies), accuracy, mean_time + inter_trial_interval)
+        return {'n_decisions': len(self.decision_times), 'mean_decision_time': mean_time, 'accuracy': accuracy, 'itr': itr}
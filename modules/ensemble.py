@@ -0,0 +1,188 @@
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+from ._shared import init_worker, worker_classifier, attach_shared_array, release_shared_memory
+
+EXECUTORS = ('thread', 'process')
+FUSION_RULES = (None, 'vote')
+
+
+def _run_in_worker(name, memory_name, shape, dtype):
+    """
+    Runs one registered classifier in a process-pool worker on the window held in shared memory.
+
+    Returns:
+        tuple: The classifier's result and the time in seconds it took.
+    """
+    eeg_data = attach_shared_array(memory_name, shape, dtype)
+    classifier, method = worker_classifier(name)
+    start = time.perf_counter()
+    result = getattr(classifier, method)(eeg_data)
+    return result, time.perf_counter() - start
+
+
+def _run_timed(function, eeg_data):
+    """
+    Runs one registered classifier in the calling process.
+
+    Returns:
+        tuple: The classifier's result and the time in seconds it took.
+    """
+    start = time.perf_counter()
+    result = function(eeg_data)
+    return result, time.perf_counter() - start
+
+
+class ClassifierEnsemble:
+    """
+    Runs several classifiers on the same window concurrently and gathers their results.
+
+    With the default thread pool, the classifiers share the window directly (the NumPy/SciPy kernels release the GIL).
+    With a process pool, the classifiers are sent to each worker once and every window is passed through shared memory,
+    so only the results are pickled. Registering a classifier after the pool has started restarts the pool.
+
+    Attributes:
+        executor (str): 'thread' or 'process'.
+        fusion (str): None, or 'vote' to fuse the voting classifiers' detections by majority vote.
+        last_timings (dict): The time in seconds each classifier took on the last window.
+        last_wall_time (float): The wall-clock time in seconds of the last run().
+        total_timings (dict): The cumulative time in seconds of each classifier over all windows.
+    """
+
+    def __init__(self, executor='thread', max_workers=None, fusion=None):
+        """
+        Initializes the ClassifierEnsemble.
+
+        Args:
+            executor (str): 'thread' or 'process'.
+            max_workers (int): The number of workers. Defaults to one per registered classifier.
+            fusion (str): None, or 'vote' to fuse the voting classifiers' detections by majority vote.
+        """
+        if executor not in EXECUTORS:
+            raise ValueError(f"Unknown executor '{executor}', expected one of {EXECUTORS}")
+        if fusion not in FUSION_RULES:
+            raise ValueError(f"Unknown fusion rule '{fusion}', expected one of {FUSION_RULES}")
+        self.executor = executor
+        self.max_workers = max_workers
+        self.fusion = fusion
+        self._classifiers = {}  # name -> (classifier, method name)
+        self._voters = []
+        self._pool = None
+        self._memory = None
+        self.last_timings = {}
+        self.last_wall_time = 0.0
+        self.total_timings = {}
+
+    def register(self, name, classifier, method, vote=True):
+        """
+        Registers a classifier method to run on every window.
+
+        Args:
+            name (str): The name the result is reported under.
+            classifier: The classifier object (must be picklable for the process pool).
+            method (str): The name of the method called with the window, e.g. 'cca_analysis'.
+            vote (bool): Whether the method returns a (frequency, score) detection that takes part in the fusion.
+        """
+        self._classifiers[name] = (classifier, method)
+        if vote and name not in self._voters:
+            self._voters.append(name)
+        self.total_timings.setdefault(name, 0.0)
+        self._shutdown_pool()
+
+    @property
+    def voters(self):
+        """
+        The names of the registered classifiers whose detections take part in the fusion, in registration order.
+        """
+        return tuple(self._voters)
+
+    def _start_pool(self):
+        """
+        Starts the worker pool for the registered classifiers.
+        """
+        workers = self.max_workers or len(self._classifiers)
+        if self.executor == 'thread':
+            self._pool = ThreadPoolExecutor(max_workers=workers)
+        else:
+            self._pool = ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(self._classifiers,))
+
+    def _share(self, eeg_data):
+        """
+        Copies the window into the shared-memory block (reallocated when the window grows).
+
+        Returns:
+            str: The name of the shared-memory block.
+        """
+        if self._memory is None or self._memory.size < eeg_data.nbytes:
+            self._release_memory()
+            self._memory = shared_memory.SharedMemory(create=True, size=max(eeg_data.nbytes, 1))
+        np.ndarray(eeg_data.shape, dtype=eeg_data.dtype, buffer=self._memory.buf)[...] = eeg_data
+        return self._memory.name
+
+    def run(self, eeg_data):
+        """
+        Runs every registered classifier on a window and waits for all of them.
+
+        Args:
+            eeg_data (np.ndarray): The window, shape (n_channels, n_samples).
+
+        Returns:
+            dict: The result of each classifier, by name (plus 'fused' when a fusion rule is set).
+        """
+        if self._pool is None:
+            self._start_pool()
+        start = time.perf_counter()
+        if self.executor == 'thread':
+            futures = {name: self._pool.submit(_run_timed, getattr(classifier, method), eeg_data)
+                       for name, (classifier, method) in self._classifiers.items()}
+        else:
+            eeg_data = np.ascontiguousarray(eeg_data)
+            memory_name = self._share(eeg_data)
+            futures = {name: self._pool.submit(_run_in_worker, name, memory_name, eeg_data.shape, eeg_data.dtype.str)
+                       for name in self._classifiers}
+        results = {}
+        for name, future in futures.items():
+            results[name], self.last_timings[name] = future.result()
+            self.total_timings[name] += self.last_timings[name]
+        self.last_wall_time = time.perf_counter() - start
+        if self.fusion == 'vote':
+            results['fused'] = self.vote(results)
+        return results
+
+    def vote(self, results):
+        """
+        Fuses the detections of the voting classifiers by majority vote.
+
+        Ties go to the frequency detected by the earliest registered classifier.
+
+        Args:
+            results (dict): The results of run(), by name.
+
+        Returns:
+            tuple: The winning frequency and the number of votes it got, or (None, 0) if nothing was detected.
+        """
+        detections = [results[name][0] for name in self._voters if results[name][0] is not None]
+        if not detections:
+            return None, 0
+        votes = Counter(detections)
+        most = max(votes.values())
+        return next((freq, most) for freq in detections if votes[freq] == most)
+
+    def _shutdown_pool(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    def _release_memory(self):
+        if self._memory is not None:
+            release_shared_memory(self._memory)
+            self._memory = None
+
+    def close(self):
+        """
+        Stops the worker pool and frees the shared memory.
+        """
+        self._shutdown_pool()
+        self._release_memory()
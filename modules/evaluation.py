@@ -0,0 +1,184 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from .metrics import information_transfer_rate
+from ._shared import init_worker, worker_classifier, attach_shared_array, release_shared_memory
+
+def window_recording(data, labels, window_samples, hop_samples):
+    """
+    Cuts a recording into overlapping windows without copying it.
+
+    Windows whose samples do not all share one label (transitions between targets, or unlabelled rest with NaN)
+    are left out.
+
+    Args:
+        data (np.ndarray): The recording, shape (n_channels, n_samples).
+        labels (np.ndarray): The target frequency of every sample (NaN where there is no target), shape (n_samples,).
+        window_samples (int): The window length in samples.
+        hop_samples (int): The number of samples between the starts of consecutive windows.
+
+    Returns:
+        tuple: The indices of the kept windows (in the hop grid), a read-only view of all windows,
+            shape (n_windows, n_channels, window_samples), and the label of each kept window.
+    """
+    windows = sliding_window_view(data, window_samples, axis=1)[:, ::hop_samples].transpose(1, 0, 2)
+    labels = np.asarray(labels, dtype=float)
+    label_windows = sliding_window_view(labels, window_samples)[::hop_samples]
+    first = label_windows[:, 0]
+    constant = ~np.isnan(first) & (label_windows == first[:, None]).all(axis=1)
+    indices = np.flatnonzero(constant)
+    return indices, windows, first[indices]
+
+
+def _classify(classifier, windows):
+    """
+    Returns the predicted frequency of each window (NaN for no detection), using classify_batch when available.
+    """
+    if hasattr(classifier, 'classify_batch'):
+        return classifier.classify_batch(windows)[0]
+    predictions = np.full(len(windows), np.nan)
+    for i, window in enumerate(windows):
+        scores = classifier.score(window)
+        best = int(np.argmax(scores))
+        if scores[best] > 0:
+            predictions[i] = classifier.frequencies[best]
+    return predictions
+
+
+def _evaluate_in_worker(name, memory_name, shape, dtype, window_samples, hop_samples, indices):
+    """
+    Classifies the given windows of the recording held in shared memory in a process-pool worker.
+
+    Returns:
+        tuple: The predictions and the time in seconds they took.
+    """
+    data = attach_shared_array(memory_name, shape, dtype)
+    windows = sliding_window_view(data, window_samples, axis=1)[:, ::hop_samples].transpose(1, 0, 2)
+    start = time.perf_counter()
+    predictions = _classify(worker_classifier(name), windows[indices])
+    return predictions, time.perf_counter() - start
+
+
+class Evaluator:
+    """
+    Measures the offline accuracy, ITR, confusion matrix and latency of classifiers over labelled recordings.
+
+    Each recording is cut into sliding windows (zero-copy views). With n_workers > 1 the windows are classified by a
+    process pool: the classifiers are sent to each worker once, and each recording is put in shared memory once so
+    only window indices and predictions are pickled. The pool is kept between recordings, so many sessions can be
+    evaluated in a row; use it as a context manager or call close() at the end.
+
+    Attributes:
+        classifiers (dict): The classifiers to evaluate, by name. Each needs `frequencies` and `classify_batch()` or `score()`.
+        sampling_rate (int): The sampling rate of the recordings.
+        window_samples (int): The window length in samples.
+        hop_samples (int): The number of samples between the starts of consecutive windows.
+        n_workers (int): The number of worker processes (0 or 1 evaluates in the calling process).
+    """
+
+    def __init__(self, classifiers, sampling_rate, window_duration, hop_duration, n_workers=None, chunks_per_worker=4,
+                 chunk_size=256):
+        """
+        Initializes the Evaluator.
+
+        Args:
+            classifiers (dict): The classifiers to evaluate, by name.
+            sampling_rate (int): The sampling rate of the recordings.
+            window_duration (float): The window length in seconds.
+            hop_duration (float): The time in seconds between the starts of consecutive windows.
+            n_workers (int): The number of worker processes. Defaults to the number of CPUs.
+            chunks_per_worker (int): The minimum number of tasks each classifier's windows are split into per worker.
+            chunk_size (int): The maximum number of windows classified at once, which bounds the memory used.
+        """
+        self.classifiers = classifiers
+        self.sampling_rate = sampling_rate
+        self.window_duration = window_duration
+        self.window_samples = int(window_duration * sampling_rate)
+        self.hop_samples = max(1, int(hop_duration * sampling_rate))
+        self.n_workers = n_workers if n_workers is not None else os.cpu_count()
+        self.chunks_per_worker = chunks_per_worker
+        self.chunk_size = chunk_size
+        self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _predict(self, data, indices, windows):
+        """
+        Returns the predictions of every classifier for the windows at indices, and the time each classifier took.
+        """
+        if self.n_workers <= 1:
+            # Windows are only copied chunk by chunk, so long recordings do not need a copy of every window at once
+            chunks = np.array_split(indices, max(1, -(-len(indices) // self.chunk_size)))
+            predictions, elapsed = {}, {}
+            for name, classifier in self.classifiers.items():
+                start = time.perf_counter()
+                predictions[name] = np.concatenate([_classify(classifier, windows[chunk]) for chunk in chunks])
+                elapsed[name] = time.perf_counter() - start
+            return predictions, elapsed
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.n_workers, initializer=init_worker, initargs=(self.classifiers,))
+        data = np.ascontiguousarray(data)
+        memory = shared_memory.SharedMemory(create=True, size=max(data.nbytes, 1))
+        try:
+            np.ndarray(data.shape, dtype=data.dtype, buffer=memory.buf)[...] = data
+            n_chunks = max(self.n_workers * self.chunks_per_worker, -(-len(indices) // self.chunk_size))
+            chunks = np.array_split(indices, max(1, min(len(indices), n_chunks)))
+            futures = {name: [self._pool.submit(_evaluate_in_worker, name, memory.name, data.shape, data.dtype.str,
+                                                self.window_samples, self.hop_samples, chunk) for chunk in chunks]
+                       for name in self.classifiers}
+            predictions, elapsed = {}, {}
+            for name, name_futures in futures.items():
+                results = [future.result() for future in name_futures]
+                predictions[name] = np.concatenate([result[0] for result in results])
+                elapsed[name] = sum(result[1] for result in results)
+        finally:
+            release_shared_memory(memory)
+        return predictions, elapsed
+
+    def evaluate(self, data, labels, inter_trial_interval=0.0):
+        """
+        Classifies every fully labelled window of a recording with every classifier.
+
+        Args:
+            data (np.ndarray): The (filtered) recording, shape (n_channels, n_samples).
+            labels (np.ndarray): The target frequency of every sample (NaN where there is no target), shape (n_samples,).
+            inter_trial_interval (float): Time in seconds between selections added to the window length for the ITR.
+
+        Returns:
+            dict: For each classifier name, a dict with the number of windows, the accuracy, the ITR (bits/min),
+                the confusion matrix (rows: true target, columns: predicted target then 'no detection'),
+                and the mean classification time per window in seconds.
+        """
+        indices, windows, window_labels = window_recording(data, labels, self.window_samples, self.hop_samples)
+        predictions, elapsed = self._predict(data, indices, windows)
+        report = {}
+        for name, classifier in self.classifiers.items():
+            frequencies = list(classifier.frequencies)
+            confusion = np.zeros((len(frequencies), len(frequencies) + 1), dtype=int)
+            for label, prediction in zip(window_labels, predictions[name]):
+                column = len(frequencies) if np.isnan(prediction) else frequencies.index(prediction)
+                confusion[frequencies.index(label), column] += 1
+            accuracy = float(np.trace(confusion) / len(indices)) if len(indices) else float('nan')
+            report[name] = {
+                'n_windows': len(indices),
+                'accuracy': accuracy,
+                'itr': information_transfer_rate(len(frequencies), accuracy, self.window_duration + inter_trial_interval),
+                'confusion': confusion,
+                'latency': elapsed[name] / len(indices) if len(indices) else float('nan'),
+            }
+        return report
+
+    def close(self):
+        """
+        Stops the worker pool.
+        """
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
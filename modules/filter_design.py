@@ -0,0 +1,42 @@
+import functools
+import numpy as np
+from scipy.signal import butter
+
+
+def design_filter(fs, band, order=5, btype='band', output='ba'):
+    """
+    Returns Butterworth filter coefficients from a process-wide cache.
+
+    Filters are designed once per (fs, band edges, order, type, output) and shared by every caller
+    (PreProcess, StreamingFilter, FBCCA, ...), so creating classifiers or filtering many windows
+    never repeats the design. The returned arrays are shared and must not be modified in place.
+
+    Args:
+        fs (float): The sampling rate of the data in Hz.
+        band (float or sequence): The cutoff frequency, or [low, high] band edges, in Hz.
+        order (int): The order of the filter.
+        btype (str): The filter type ('band', 'low', 'high' or 'bandstop').
+        output (str): 'ba' for numerator/denominator coefficients or 'sos' for second-order sections.
+
+    Returns:
+        tuple or np.ndarray: (b, a) for output='ba', or the sos array for output='sos'.
+    """
+    band = tuple(float(edge) for edge in np.atleast_1d(band))
+    return _design_filter(float(fs), band, int(order), btype, output)
+
+
+@functools.lru_cache(maxsize=None)
+def _design_filter(fs, band, order, btype, output):
+    """
+    Designs a filter for design_filter(). Arguments must be hashable.
+    """
+    nyquist = 0.5 * fs
+    wn = [edge / nyquist for edge in band]
+    return butter(order, wn if len(wn) > 1 else wn[0], btype=btype, output=output)
+
+
+def clear_filter_cache():
+    """
+    Empties the filter design cache.
+    """
+    _design_filter.cache_clear()
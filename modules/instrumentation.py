@@ -0,0 +1,258 @@
+import atexit
+import contextlib
+import json
+import math
+import os
+import threading
+import time
+
+# Percentiles reported by LatencyMonitor.summary()
+PERCENTILES = (50, 90, 99)
+
+
+class LatencyHistogram:
+    """
+    Streaming histogram of latencies with logarithmically spaced buckets.
+
+    Recording a latency is O(1) and uses constant memory, so the histogram can stay on for a whole session.
+    Percentiles are accurate to the bucket width (about 12% with the default 20 buckets per decade).
+
+    Attributes:
+        min_latency (float): The upper edge in seconds of the first bucket (shorter latencies fall into it).
+        buckets_per_decade (int): The number of buckets per factor of 10.
+        counts (list): The number of latencies in each bucket; the last bucket holds everything above the range.
+        count (int): The number of latencies recorded.
+        total (float): The sum of the latencies recorded, in seconds.
+        minimum (float): The shortest latency recorded, in seconds.
+        maximum (float): The longest latency recorded, in seconds.
+    """
+
+    def __init__(self, min_latency=1e-6, max_latency=100.0, buckets_per_decade=20):
+        """
+        Initializes the LatencyHistogram.
+
+        Args:
+            min_latency (float): The shortest latency in seconds resolved by the buckets.
+            max_latency (float): The longest latency in seconds resolved by the buckets.
+            buckets_per_decade (int): The number of buckets per factor of 10.
+        """
+        self.min_latency = min_latency
+        self.buckets_per_decade = buckets_per_decade
+        self._log_min = math.log10(min_latency)
+        n_buckets = int(math.ceil((math.log10(max_latency) - self._log_min) * buckets_per_decade)) + 1
+        self.counts = [0] * (n_buckets + 1)
+        self.count = 0
+        self.total = 0.0
+        self.minimum = math.inf
+        self.maximum = -math.inf
+
+    def _bucket(self, latency):
+        if latency <= self.min_latency:
+            return 0
+        index = int(math.ceil((math.log10(latency) - self._log_min) * self.buckets_per_decade))
+        return min(index, len(self.counts) - 1)
+
+    def upper_edge(self, bucket):
+        """
+        Returns the upper edge in seconds of a bucket.
+        """
+        return 10 ** (self._log_min + bucket / self.buckets_per_decade)
+
+    def add(self, latency):
+        """
+        Records one latency.
+
+        Args:
+            latency (float): The latency in seconds.
+        """
+        self.counts[self._bucket(latency)] += 1
+        self.count += 1
+        self.total += latency
+        self.minimum = min(self.minimum, latency)
+        self.maximum = max(self.maximum, latency)
+
+    def percentile(self, percent):
+        """
+        Returns an estimate of a percentile of the recorded latencies.
+
+        Args:
+            percent (float): The percentile, between 0 and 100.
+
+        Returns:
+            float: The upper edge of the bucket holding the percentile (clipped to the observed range), in seconds,
+                or NaN if nothing was recorded.
+        """
+        if self.count == 0:
+            return math.nan
+        rank = max(1, math.ceil(percent / 100 * self.count))
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(max(self.upper_edge(bucket), self.minimum), self.maximum)
+        return self.maximum
+
+    @property
+    def mean(self):
+        """
+        The mean of the recorded latencies in seconds (NaN if nothing was recorded).
+        """
+        return self.total / self.count if self.count else math.nan
+
+
+class _Stage:
+    """
+    Context manager that times one pass through a pipeline stage.
+    """
+    __slots__ = ('_monitor', '_name', '_start')
+
+    def __init__(self, monitor, name):
+        self._monitor = monitor
+        self._name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._monitor.record(self._name, time.perf_counter() - self._start)
+
+
+class LatencyMonitor:
+    """
+    Collects per-stage latency histograms of the online loop and the latency from sample acquisition to decision.
+
+    Stages are timed with the monotonic perf_counter clock. The sample-to-decision latency compares the wall clock
+    with the BrainFlow timestamp (UNIX time) of the newest sample in the classified window, so it includes the
+    board, dongle and driver delays as well as the processing. When a dump file is given, the summary is written
+    to it every dump_interval seconds and when the program exits.
+
+    When disabled, stage() returns a shared no-op context manager, timed() returns the function unchanged and
+    record() returns immediately, so the instrumentation can stay in the loop at negligible cost.
+
+    Attributes:
+        enabled (bool): Whether latencies are recorded.
+        dump_file (str): The JSON file the summary is written to, or None.
+        dump_interval (float): The time in seconds between periodic dumps.
+        histograms (dict): The LatencyHistogram of each stage, by name ('decision' for sample-to-decision).
+    """
+
+    def __init__(self, enabled=True, dump_file=None, dump_interval=60.0):
+        """
+        Initializes the LatencyMonitor.
+
+        Args:
+            enabled (bool): Whether latencies are recorded.
+            dump_file (str): The JSON file the summary is written to periodically and on exit, or None.
+            dump_interval (float): The time in seconds between periodic dumps.
+        """
+        self.enabled = enabled
+        self.dump_file = dump_file
+        self.dump_interval = dump_interval
+        self.histograms = {}
+        self._lock = threading.Lock()
+        self._dump_lock = threading.Lock()
+        self._null_stage = contextlib.nullcontext()
+        self._next_dump = time.monotonic() + dump_interval
+        if enabled and dump_file is not None:
+            atexit.register(self.dump)
+
+    def stage(self, name):
+        """
+        Returns a context manager that records the time spent in its block under the given stage name.
+
+        Args:
+            name (str): The name of the stage, e.g. 'get_segment'.
+        """
+        if not self.enabled:
+            return self._null_stage
+        return _Stage(self, name)
+
+    def timed(self, name, function):
+        """
+        Wraps a function so that every call is recorded under the given stage name.
+
+        Args:
+            name (str): The name of the stage, e.g. 'filter_data'.
+            function (callable): The function to time.
+
+        Returns:
+            callable: The wrapped function, or the function itself when the monitor is disabled.
+        """
+        if not self.enabled:
+            return function
+
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.record(name, time.perf_counter() - start)
+        return wrapper
+
+    def record(self, name, latency):
+        """
+        Records one latency of a stage (thread-safe), and dumps the summary if the dump interval has passed.
+
+        Args:
+            name (str): The name of the stage.
+            latency (float): The latency in seconds.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = LatencyHistogram()
+            histogram.add(latency)
+        if self.dump_file is not None and time.monotonic() >= self._next_dump:
+            self.dump()
+
+    def record_decision(self, sample_timestamp):
+        """
+        Records the latency from the acquisition of a sample to the decision made on it.
+
+        Args:
+            sample_timestamp (float): The BrainFlow timestamp (UNIX time in seconds) of the newest sample in the
+                classified window, or None if it is unknown (nothing is recorded).
+        """
+        if not self.enabled or sample_timestamp is None:
+            return
+        self.record('decision', time.time() - sample_timestamp)
+
+    def summary(self):
+        """
+        Returns the count, mean, minimum, maximum and percentiles of every stage, in milliseconds.
+
+        Returns:
+            dict: A dict of statistics for each stage, by name.
+        """
+        with self._lock:
+            summary = {}
+            for name, histogram in self.histograms.items():
+                stats = {
+                    'count': histogram.count,
+                    'mean_ms': 1000 * histogram.mean,
+                    'min_ms': 1000 * histogram.minimum,
+                    'max_ms': 1000 * histogram.maximum,
+                }
+                for percent in PERCENTILES:
+                    stats[f'p{percent}_ms'] = 1000 * histogram.percentile(percent)
+                stats['histogram'] = [[1000 * histogram.upper_edge(bucket), count]
+                                      for bucket, count in enumerate(histogram.counts) if count]
+                summary[name] = stats
+            return summary
+
+    def dump(self):
+        """
+        Writes the summary to the dump file (replaced atomically, so readers never see a partial file).
+        """
+        if self.dump_file is None:
+            return
+        with self._dump_lock:
+            self._next_dump = time.monotonic() + self.dump_interval
+            report = {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'stages': self.summary()}
+            temporary = f"{self.dump_file}.tmp"
+            with open(temporary, 'w') as f:
+                json.dump(report, f, indent=2)
+            os.replace(temporary, self.dump_file)
@@ -0,0 +1,141 @@
+import threading
+import numpy as np
+
+
+class LockInDetector:
+    """
+    Always-on SSVEP detector that demodulates each (channel, target, harmonic) with an exponentially weighted lock-in.
+
+    Every accumulator holds the exponentially weighted average of x[t] * exp(-i * omega * t) for one frequency, so each
+    new sample costs O(1) per accumulator and the power and SNR of every target are available at any moment. The noise
+    floor of each target comes from the same kind of accumulators at neighbouring frequencies (noise_offsets), like the
+    neighbouring-bin SNR of SSVEP_SNR but without computing a spectrum.
+
+    It expects bandpass-filtered EEG, e.g. registered with board.add_listener(detector.process, filtered=True),
+    and can be read from another thread while it is being fed.
+
+    Attributes:
+        frequencies (list): The target frequencies in Hz.
+        harmonics (list): The harmonics demodulated for each target.
+        sampling_rate (int): The sampling rate of the EEG data.
+        time_constant (float): The time constant in seconds of the exponential averaging (its memory).
+        noise_offsets (tuple): The offsets in Hz of the neighbouring frequencies used for the noise floor.
+        n_seen (int): The number of samples processed since the last reset.
+    """
+
+    def __init__(self, frequencies, harmonics, sampling_rate, n_channels, time_constant=1.0,
+                 noise_offsets=(-1.0, -0.5, 0.5, 1.0)):
+        """
+        Initializes the LockInDetector.
+
+        Args:
+            frequencies (list): The target frequencies in Hz.
+            harmonics (list): The harmonics demodulated for each target.
+            sampling_rate (int): The sampling rate of the EEG data.
+            n_channels (int): The number of EEG channels.
+            time_constant (float): The time constant in seconds of the exponential averaging.
+            noise_offsets (tuple): The offsets in Hz of the neighbouring frequencies used for the noise floor.
+        """
+        self.frequencies = frequencies
+        self.harmonics = harmonics
+        self.sampling_rate = sampling_rate
+        self.time_constant = time_constant
+        self.noise_offsets = tuple(noise_offsets)
+        signal = np.outer(frequencies, harmonics)  # (n_targets, n_harmonics)
+        noise = signal[:, :, None] + np.asarray(self.noise_offsets)  # (n_targets, n_harmonics, n_offsets)
+        self._bins = np.concatenate([signal.ravel(), noise.ravel()])
+        self._omega = 2 * np.pi * self._bins / sampling_rate
+        self._decay = np.exp(-1 / (time_constant * sampling_rate))
+        self._table = np.empty((0, len(self._bins)), dtype=complex)  # exp(-i * omega * k) for k = 0, 1, ...
+        self._state = np.zeros((n_channels, len(self._bins)), dtype=complex)
+        self._lock = threading.Lock()
+        self.n_seen = 0
+
+    def _phasors(self, n_samples):
+        """
+        Returns exp(-i * omega * k) for k < n_samples, growing the cached table (at least doubling it) when needed.
+        """
+        if n_samples > len(self._table):
+            k = np.arange(max(n_samples, 2 * len(self._table)))
+            self._table = np.exp(-1j * np.multiply.outer(k, self._omega))
+        return self._table[:n_samples]
+
+    def process(self, chunk):
+        """
+        Feeds new samples to every accumulator.
+
+        Args:
+            chunk (np.ndarray): The new (filtered) EEG samples, shape (n_channels, n_new).
+        """
+        n_new = chunk.shape[1]
+        if n_new == 0:
+            return
+        weights = (1 - self._decay) * self._decay ** np.arange(n_new - 1, -1, -1)
+        with self._lock:
+            # exp(-i * omega * (n_seen + k)) = exp(-i * omega * n_seen) * exp(-i * omega * k), with the phase reduced first
+            cycles = (self._bins * self.n_seen / self.sampling_rate) % 1
+            demodulated = (chunk @ (self._phasors(n_new) * weights[:, None])) * np.exp(-2j * np.pi * cycles)
+            self._state = self._decay ** n_new * self._state + demodulated
+            self.n_seen += n_new
+
+    def reset(self):
+        """
+        Clears every accumulator (e.g. at the start of a trial).
+        """
+        with self._lock:
+            self._state[:] = 0
+            self.n_seen = 0
+
+    def _powers(self):
+        """
+        Returns the signal power, shape (n_channels, n_targets, n_harmonics), and the mean neighbouring noise power,
+        same shape, of every accumulator.
+        """
+        with self._lock:
+            power = np.abs(self._state) ** 2
+        n_channels = power.shape[0]
+        n_signal = len(self.frequencies) * len(self.harmonics)
+        signal = power[:, :n_signal].reshape(n_channels, len(self.frequencies), len(self.harmonics))
+        noise = power[:, n_signal:].reshape(n_channels, len(self.frequencies), len(self.harmonics), -1).mean(axis=-1)
+        return signal, noise
+
+    def amplitude(self):
+        """
+        Returns the current amplitude of every (channel, target, harmonic), in the units of the EEG data.
+
+        Returns:
+            np.ndarray: The amplitudes, shape (n_channels, n_targets, n_harmonics).
+        """
+        with self._lock:
+            state = self._state[:, :len(self.frequencies) * len(self.harmonics)]
+            return 2 * np.abs(state).reshape(len(state), len(self.frequencies), len(self.harmonics))
+
+    def snr(self):
+        """
+        Returns the current SNR of every target: its summed harmonic power over the summed neighbouring noise power,
+        both averaged over channels.
+
+        Returns:
+            np.ndarray: The SNR in dB of every target, in self.frequencies order.
+        """
+        signal, noise = self._powers()
+        signal = signal.mean(axis=0).sum(axis=-1)
+        noise = noise.mean(axis=0).sum(axis=-1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return 10 * np.log10(signal / noise)
+
+    def detect(self, threshold=3.0):
+        """
+        Returns the target with the highest SNR if it reaches the threshold, e.g. to gate the CCA classifiers.
+
+        Args:
+            threshold (float): The SNR in dB a target needs to be detected.
+
+        Returns:
+            tuple: The detected frequency (None if no target reaches the threshold or no data was seen) and its SNR in dB.
+        """
+        snr = np.nan_to_num(self.snr(), nan=-np.inf)
+        best = int(np.argmax(snr))
+        if np.isfinite(snr[best]) and snr[best] >= threshold:
+            return self.frequencies[best], float(snr[best])
+        return None, float(snr[best])
@@ -0,0 +1,21 @@
+import numpy as np
+
+
+def information_transfer_rate(n_targets, accuracy, decision_time):
+    """
+    Computes the Wolpaw information transfer rate (ITR) of a BCI.
+
+    Args:
+        n_targets (int): The number of selectable targets.
+        accuracy (float): The classification accuracy, between 0 and 1.
+        decision_time (float): The mean time per selection in seconds (including any gaps between selections).
+
+    Returns:
+        float: The ITR in bits per minute. Accuracies at or below chance level give 0.
+    """
+    if n_targets < 2 or decision_time <= 0 or accuracy <= 1 / n_targets:
+        return 0.0
+    bits = np.log2(n_targets) + accuracy * np.log2(accuracy)
+    if accuracy < 1:
+        bits += (1 - accuracy) * np.log2((1 - accuracy) / (n_targets - 1))
+    return float(bits * 60 / decision_time)
@@ -0,0 +1,122 @@
+import inspect
+import json
+import os
+import numpy as np
+
+CLASSIFIER_EXTENSION = '.clf'
+CLASSIFIER_MAGIC = b'SSVEPCLF'
+CLASSIFIER_VERSION = 1
+ALIGNMENT = 64  # Byte alignment of every array in the bundle, so memory-mapped arrays are aligned
+MMAP_THRESHOLD = 1 << 16  # Arrays of at least this many bytes are memory-mapped on load
+
+
+def _aligned(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def bundle_params(**params):
+    """
+    Returns constructor parameters as JSON-serializable values for save_bundle() (NumPy arrays become lists).
+    """
+    return {name: np.asarray(value).tolist() for name, value in params.items()}
+
+
+def save_bundle(path, kind, params, arrays):
+    """
+    Saves a classifier's constructor parameters and arrays to one uncompressed binary bundle.
+
+    File layout:
+        - CLASSIFIER_MAGIC, then the length of the JSON header as a little-endian uint64.
+        - The JSON header: the format version, the classifier kind, its parameters, and the dtype,
+          shape and byte offset (from the start of the data section) of every array.
+        - The data section, starting at the first multiple of ALIGNMENT bytes after the header: the raw C-ordered
+          arrays, each starting at a multiple of ALIGNMENT bytes.
+
+    The bundle is written to a temporary file and moved into place, so a crash never leaves a partial bundle.
+
+    Args:
+        path (str): The path of the bundle (conventionally ending in CLASSIFIER_EXTENSION).
+        kind (str): The classifier class name, checked on load.
+        params (dict): JSON-serializable constructor parameters.
+        arrays (dict): The arrays to store, by name.
+    """
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+    table, offset = {}, 0
+    for name, array in arrays.items():
+        table[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset = _aligned(offset + array.nbytes)
+    encoded = json.dumps({'version': CLASSIFIER_VERSION, 'kind': kind, 'params': params, 'arrays': table}).encode()
+    data_start = _aligned(len(CLASSIFIER_MAGIC) + 8 + len(encoded))
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, 'wb') as f:
+        f.write(CLASSIFIER_MAGIC + len(encoded).to_bytes(8, 'little') + encoded)
+        for name, array in arrays.items():
+            f.seek(data_start + table[name]['offset'])
+            f.write(array.tobytes())
+    os.replace(temporary, path)
+
+
+def _read_header(f, path, kind=None):
+    """
+    Reads and checks the JSON header of an open bundle, and returns it with the offset of the data section.
+    """
+    magic = f.read(len(CLASSIFIER_MAGIC))
+    if magic != CLASSIFIER_MAGIC:
+        raise ValueError(f"{path} is not a saved classifier")
+    header_size = int.from_bytes(f.read(8), 'little')
+    header = json.loads(f.read(header_size).decode())
+    if header['version'] > CLASSIFIER_VERSION:
+        raise ValueError(f"Unsupported classifier version {header['version']}")
+    if kind is not None and header['kind'] != kind:
+        raise ValueError(f"{path} holds a {header['kind']}, not a {kind}")
+    return header, _aligned(len(CLASSIFIER_MAGIC) + 8 + header_size)
+
+
+def load_bundle(path, kind=None, mmap=True):
+    """
+    Loads a bundle written by save_bundle().
+
+    Args:
+        path (str): The path of the bundle.
+        kind (str): The expected classifier class name, or None to accept any.
+        mmap (bool): Whether to memory-map (read-only) arrays of at least MMAP_THRESHOLD bytes instead of reading them.
+
+    Returns:
+        tuple: The classifier kind, its parameters, and its arrays by name.
+    """
+    with open(path, 'rb') as f:
+        header, data_start = _read_header(f, path, kind)
+        arrays = {}
+        for name, entry in header['arrays'].items():
+            dtype, shape = np.dtype(entry['dtype']), tuple(entry['shape'])
+            nbytes = dtype.itemsize * int(np.prod(shape))
+            offset = data_start + entry['offset']
+            if mmap and nbytes >= MMAP_THRESHOLD:
+                arrays[name] = np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=shape)
+            else:
+                f.seek(offset)
+                arrays[name] = np.frombuffer(f.read(nbytes), dtype=dtype).reshape(shape).copy()
+    return header['kind'], header['params'], arrays
+
+
+def bundle_matches(path, cls, *args, **kwargs):
+    """
+    Returns whether the bundle at path holds a cls saved with the given constructor arguments.
+
+    Every saved constructor parameter is compared, with the defaults of cls filling in the arguments not given,
+    so a bundle is stale as soon as any of them differs. Only the header is read.
+
+    Args:
+        path (str): The path of the bundle.
+        cls (type): The classifier class.
+        *args: The positional constructor arguments.
+        **kwargs: The keyword constructor arguments.
+
+    Returns:
+        bool: True if the bundle can be loaded in place of cls(*args, **kwargs).
+    """
+    requested = inspect.signature(cls).bind(*args, **kwargs)
+    requested.apply_defaults()
+    with open(path, 'rb') as f:
+        header, _ = _read_header(f, path)
+    return header['kind'] == cls.__name__ and header['params'] == bundle_params(**requested.arguments)
@@ -1,7 +1,8 @@
 import time
 import numpy as np
 from brainflow.board_shim import BoardShim
-from scipy.signal import butter, lfilter
+from scipy.signal import lfilter, sosfilt, sosfilt_zi
+from .filter_design import design_filter
 
 class PreProcess:
     """
@@ -12,34 +13,86 @@ class PreProcess:
         segment_duration (float): The duration of each data segment in seconds.
         sampling_rate (int): The sampling rate of the EEG data.
         n_samples (int): The number of samples in each data segment.
+        hop_duration (float): The time in seconds between the ends of consecutive sliding windows.
+        hop_samples (int): The number of samples between the ends of consecutive sliding windows.
+        dropped_windows (int): The number of sliding windows skipped because the consumer fell behind.
+        segment_end (int): The absolute sample count at which the last window returned by get_next_segment() or
+            get_trial() ends, e.g. to look up the timestamp of its newest sample.
     """
 
-    def __init__(self, board, segment_duration):
+    def __init__(self, board, segment_duration, hop_duration=None):
         """
         Initializes the PreProcess class with the given parameters.
 
         Args:
             board (BoardShim): The BrainFlow board object for EEG data acquisition.
             segment_duration (float): The duration of each data segment in seconds.
+            hop_duration (float): The time in seconds between consecutive sliding windows.
+                Defaults to segment_duration (no overlap).
         """
         self.board = board
         self.segment_duration = segment_duration
         self.sampling_rate = BoardShim.get_sampling_rate(self.board.board_id)
         self.n_samples = int(self.sampling_rate * self.segment_duration)
+        self.hop_duration = segment_duration if hop_duration is None else hop_duration
+        self.hop_samples = max(1, int(self.sampling_rate * self.hop_duration))
+        self.dropped_windows = 0
+        self.segment_end = None
+        self._next_end = None
+        self._trial_start = None
   
     def get_segment(self):
         """
         Retrieves the latest segment of EEG data.
 
+        If the board's background acquisition is running, the segment is a read-only view of
+        the EEG rows in its ring buffer; otherwise all board rows are copied out of BrainFlow.
+
         Returns:
             np.ndarray: The latest segment of EEG data, or None if insufficient data.
         """
+        if getattr(self.board, 'ring_buffer', None) is not None:
+            return self.board.get_latest_eeg(self.n_samples)
         data = self.board.get_current_board_data(self.n_samples)
         if data.shape[1] >= self.n_samples:
             segment = data[:, -self.n_samples:]
             return segment
         return None
 
+    def get_next_segment(self, timeout=1.0, filtered=False):
+        """
+        Retrieves the next overlapping sliding window from the board's acquisition ring buffer.
+
+        Windows end every hop_samples samples. This call blocks until the samples for the next window
+        have arrived rather than sleeping for a fixed time. If the caller has fallen behind by one or
+        more hops, the stale windows are skipped (and counted in dropped_windows) so the returned
+        window is always the most recent complete one.
+
+        Args:
+            timeout (float): The maximum time in seconds to wait for new samples.
+            filtered (bool): Whether to window the board's streaming-filtered ring buffer instead of the raw one.
+
+        Returns:
+            np.ndarray: A read-only view of the next window of EEG data, shape (n_channels, n_samples),
+            or None if the samples did not arrive within the timeout.
+        """
+        ring = self.board.filtered_buffer if filtered else self.board.ring_buffer
+        if ring is None:
+            print("Acquisition is not running")
+            return None
+        if self._next_end is None:
+            self._next_end = max(self.n_samples, ring.n_written)
+        if not self.board.wait_for_samples(self._next_end, timeout=timeout):
+            return None
+        behind = (ring.n_written - self._next_end) // self.hop_samples
+        if behind > 0:
+            self.dropped_windows += behind
+            self._next_end += behind * self.hop_samples
+        segment = ring.window(self._next_end, self.n_samples)
+        self.segment_end = self._next_end
+        self._next_end += self.hop_samples
+        return segment
+
     # def filter_data(self, data, lowcut=0.5, highcut=30.0, order=5):
     #     """
     #     Applies a bandpass filter to the EEG data using BrainFlow library.
@@ -57,27 +110,63 @@ class PreProcess:
     #         DataFilter.perform_bandpass(data[channel], self.sampling_rate, lowcut, highcut, order, FilterTypes.BUTTERWORTH, 0)
     #     return data
 
-    def filter_data(self, data):
+    def start_trial(self):
+        """
+        Marks the start of a new trial for get_trial(); the trial begins with the next sample to arrive.
+        """
+        self._trial_start = None
+        self._next_end = None
+
+    def get_trial(self, timeout=1.0, filtered=False):
+        """
+        Waits for the next hop of samples and returns everything acquired since the trial started.
+
+        Used by dynamic stopping, where the analysis window grows until a decision is made.
+
+        Args:
+            timeout (float): The maximum time in seconds to wait for new samples.
+            filtered (bool): Whether to read the board's streaming-filtered ring buffer instead of the raw one.
+
+        Returns:
+            np.ndarray: A read-only view of the trial so far, shape (n_channels, n_trial_samples),
+            or None if no new samples arrived within the timeout.
+        """
+        ring = self.board.filtered_buffer if filtered else self.board.ring_buffer
+        if ring is None:
+            print("Acquisition is not running")
+            return None
+        if self._trial_start is None:
+            self._trial_start = ring.n_written
+            self._next_end = self._trial_start + self.hop_samples
+        if not self.board.wait_for_samples(self._next_end, timeout=timeout):
+            return None
+        end = ring.n_written
+        self.segment_end = end
+        self._next_end = end + self.hop_samples
+        return ring.window(end, min(end - self._trial_start, ring.capacity))
+
+    def filter_data(self, data, lowcut=0.5, highcut=30.0):
         """
         Applies a bandpass filter to the EEG data.
 
         Args:
-            data (np.ndarray): The EEG data to be filtered.
+            data (np.ndarray): The EEG data to be filtered, shape (n_channels, n_samples).
+            lowcut (float): The low cut frequency in Hz.
+            highcut (float): The high cut frequency in Hz.
 
         Returns:
             np.ndarray: The filtered EEG data.
         """
-        lowcut = 0.5  # Example low cut frequency in Hz
-        highcut = 30.0  # Example high cut frequency in Hz
-        filtered_data = np.apply_along_axis(self.bandpass_filter, 1, data, lowcut, highcut, self.sampling_rate)
-        return filtered_data
+        return self.bandpass_filter(data, lowcut, highcut, self.sampling_rate)
 
     def bandpass_filter(self, data, lowcut, highcut, fs, order=5):
         """
-        Applies a bandpass filter to a single channel of EEG data.
+        Applies a bandpass filter along the last (sample) axis, so all channels are filtered in one call.
+
+        The filter coefficients come from the shared design cache, so repeated calls do not redesign the filter.
 
         Args:
-            data (np.ndarray): The EEG data for a single channel.
+            data (np.ndarray): The EEG data, shape (..., n_samples).
             lowcut (float): The low cut frequency of the filter in Hz.
             highcut (float): The high cut frequency of the filter in Hz.
             fs (int): The sampling rate of the data in Hz.
@@ -86,11 +175,8 @@ class PreProcess:
         Returns:
             np.ndarray: The bandpass filtered EEG data.
         """
-        nyquist = 0.5 * fs
-        low = lowcut / nyquist
-        high = highcut / nyquist
-        b, a = butter(order, [low, high], btype='band')
-        y = lfilter(b, a, data)
+        b, a = design_filter(fs, [lowcut, highcut], order, btype='band')
+        y = lfilter(b, a, data, axis=-1)
         return y
 
     def extract_features(self, data):
@@ -115,3 +201,58 @@ class PreProcess:
             filename (str): The name of the file to save the data to.
         """
         np.savetxt(filename, data, delimiter=',')
+
+
+class StreamingFilter:
+    """
+    A bandpass filter for streaming EEG data that keeps its state between chunks.
+
+    The Butterworth filter is designed once as second-order sections, and the per-channel filter state (zi)
+    is carried over from one chunk to the next, so each call only filters the newly arrived samples and the
+    output is identical to filtering the whole stream in one go (no start-up transient at every window).
+
+    Attributes:
+        n_channels (int): The number of channels being filtered.
+        sampling_rate (int): The sampling rate of the EEG data.
+        sos (np.ndarray): The second-order sections of the filter.
+    """
+
+    def __init__(self, n_channels, sampling_rate, lowcut=0.5, highcut=30.0, order=5):
+        """
+        Initializes the StreamingFilter and designs the filter.
+
+        Args:
+            n_channels (int): The number of channels being filtered.
+            sampling_rate (int): The sampling rate of the EEG data.
+            lowcut (float): The low cut frequency in Hz.
+            highcut (float): The high cut frequency in Hz.
+            order (int): The order of the filter.
+        """
+        self.n_channels = n_channels
+        self.sampling_rate = sampling_rate
+        self.sos = design_filter(sampling_rate, [lowcut, highcut], order, btype='band', output='sos')
+        self._zi = None
+
+    def process(self, chunk):
+        """
+        Filters newly arrived samples, continuing from the state left by the previous chunk.
+
+        Args:
+            chunk (np.ndarray): The new EEG samples, shape (n_channels, n_new_samples).
+
+        Returns:
+            np.ndarray: The filtered samples, shape (n_channels, n_new_samples).
+        """
+        if chunk.shape[1] == 0:
+            return np.empty(chunk.shape)
+        if self._zi is None:
+            # Start in steady state for the first sample's DC offset rather than from rest
+            self._zi = sosfilt_zi(self.sos)[:, None, :] * chunk[:, 0][None, :, None]
+        filtered, self._zi = sosfilt(self.sos, chunk, axis=-1, zi=self._zi)
+        return filtered
+
+    def reset(self):
+        """
+        Clears the filter state, e.g. after a gap in the data stream.
+        """
+        self._zi = None
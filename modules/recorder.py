@@ -0,0 +1,273 @@
+import json
+import queue
+import threading
+import numpy as np
+
+SESSION_EXTENSION = '.rec'
+SESSION_MAGIC = b'SSVEPREC'
+SESSION_VERSION = 1
+HEADER_SIZE = 4096  # Bytes reserved at the start of the file for the magic string and JSON header
+
+
+class SessionRecorder:
+    """
+    A class to record raw board data to an append-only binary file on a background thread.
+
+    File layout:
+        - A fixed-size header (HEADER_SIZE bytes): SESSION_MAGIC followed by space-padded JSON with the
+          board id, sampling rate, row count, dtype, channel mapping and special channel rows.
+        - The samples, stored sample-major (n_samples, n_rows) so each chunk is a contiguous append.
+        - A JSON index written on close, holding the markers and a timestamp index (sample, timestamp)
+          with one entry per written chunk.
+
+    Attributes:
+        filename (str): The path of the session file.
+        board_id (int): The ID of the BrainFlow board being recorded.
+        sampling_rate (int): The sampling rate of the board.
+        channel_mapping (dict): Mapping of the board's EEG channel names to electrode names.
+        n_samples (int): The number of samples written to disk so far.
+    """
+
+    def __init__(self, filename, board_id, sampling_rate, channel_mapping=None, eeg_channels=None,
+                 timestamp_channel=None, marker_channel=None, chunk_duration=1.0, dtype=np.float64):
+        """
+        Initializes the SessionRecorder and starts its writer thread.
+
+        Args:
+            filename (str): The path of the session file (conventionally ending in SESSION_EXTENSION).
+            board_id (int): The ID of the BrainFlow board being recorded.
+            sampling_rate (int): The sampling rate of the board.
+            channel_mapping (dict): Mapping of the board's EEG channel names to electrode names.
+            eeg_channels (list): The rows holding EEG data.
+            timestamp_channel (int): The row holding BrainFlow timestamps, if any.
+            marker_channel (int): The row holding BrainFlow markers, if any.
+            chunk_duration (float): The duration in seconds of each fixed-size block appended to the file.
+            dtype (np.dtype): The data type used on disk.
+        """
+        self.filename = filename
+        self.board_id = int(board_id)
+        self.sampling_rate = sampling_rate
+        self.channel_mapping = dict(channel_mapping) if channel_mapping else {}
+        self.eeg_channels = list(eeg_channels) if eeg_channels is not None else None
+        self.timestamp_channel = timestamp_channel
+        self.marker_channel = marker_channel
+        self.chunk_samples = max(1, int(chunk_duration * sampling_rate))
+        self.dtype = np.dtype(dtype)
+        self.n_samples = 0
+        self.n_rows = None
+        self._n_received = 0
+        self._markers = []
+        self._timestamps = []
+        self._block = None
+        self._block_fill = 0
+        self._file = open(filename, 'wb')
+        self._write_header(None)  # Reserve the header so the samples and index never start before HEADER_SIZE
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def write(self, chunk):
+        """
+        Queues a chunk of board data to be written. Safe to call from the acquisition thread.
+
+        Args:
+            chunk (np.ndarray): The new samples, shape (n_rows, n_new_samples).
+        """
+        self._queue.put(chunk)
+
+    def add_marker(self, value, sample_index=None):
+        """
+        Adds a marker to the session index.
+
+        Args:
+            value (float): The marker value (e.g. a stimulus/target code).
+            sample_index (int): The sample the marker refers to. Defaults to the latest received sample.
+        """
+        self._queue.put(('marker', value, sample_index))
+
+    def close(self):
+        """
+        Flushes the remaining data, writes the index and final header, and closes the file.
+        """
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        self._flush_block()
+        index_offset = self._file.tell()
+        index = {'markers': sorted(self._markers, key=lambda marker: marker[0]), 'timestamps': self._timestamps}
+        self._file.write(json.dumps(index).encode())
+        self._write_header(index_offset)
+        self._file.close()
+        print(f"Recorded {self.n_samples} samples to {self.filename}")
+
+    def _run(self):
+        """
+        Writer loop run by the background thread.
+        """
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            if isinstance(item, tuple):
+                _, value, sample_index = item
+                self._markers.append([self._n_received if sample_index is None else int(sample_index), float(value)])
+            else:
+                self._append(item)
+
+    def _append(self, chunk):
+        """
+        Copies a chunk into the current fixed-size block, writing each block to disk as it fills up.
+
+        Args:
+            chunk (np.ndarray): The new samples, shape (n_rows, n_new_samples).
+        """
+        if self._block is None:
+            self.n_rows = chunk.shape[0]
+            self._block = np.empty((self.chunk_samples, self.n_rows), dtype=self.dtype)
+            self._write_header(None)
+        if self.timestamp_channel is not None:
+            self._timestamps.append([self._n_received, float(chunk[self.timestamp_channel, 0])])
+        if self.marker_channel is not None:
+            for i in np.flatnonzero(chunk[self.marker_channel]):
+                self._markers.append([self._n_received + int(i), float(chunk[self.marker_channel, i])])
+        self._n_received += chunk.shape[1]
+
+        start = 0
+        while start < chunk.shape[1]:
+            n = min(chunk.shape[1] - start, self.chunk_samples - self._block_fill)
+            self._block[self._block_fill:self._block_fill + n] = chunk[:, start:start + n].T
+            self._block_fill += n
+            start += n
+            if self._block_fill == self.chunk_samples:
+                self._flush_block()
+
+    def _flush_block(self):
+        """
+        Appends the filled part of the current block to the file.
+        """
+        if self._block_fill:
+            self._file.write(self._block[:self._block_fill].tobytes())
+            self.n_samples += self._block_fill
+            self._block_fill = 0
+
+    def _write_header(self, index_offset):
+        """
+        Writes (or rewrites) the fixed-size header at the start of the file.
+
+        Args:
+            index_offset (int): The byte offset of the JSON index, or None while recording.
+        """
+        header = {
+            'version': SESSION_VERSION,
+            'board_id': self.board_id,
+            'sampling_rate': self.sampling_rate,
+            'n_rows': self.n_rows,
+            'n_samples': self.n_samples if index_offset is not None else None,
+            'dtype': self.dtype.str,
+            'channel_mapping': self.channel_mapping,
+            'eeg_channels': self.eeg_channels,
+            'timestamp_channel': self.timestamp_channel,
+            'marker_channel': self.marker_channel,
+            'index_offset': index_offset,
+        }
+        encoded = SESSION_MAGIC + json.dumps(header).encode()
+        if len(encoded) > HEADER_SIZE:
+            raise ValueError("Session header is larger than HEADER_SIZE")
+        position = self._file.tell()
+        self._file.seek(0)
+        self._file.write(encoded.ljust(HEADER_SIZE, b' '))
+        self._file.seek(max(position, HEADER_SIZE))
+
+
+class RecordedSession:
+    """
+    A memory-mapped view of a session file written by SessionRecorder.
+
+    Attributes:
+        header (dict): The JSON header of the session file.
+        board_id (int): The ID of the recorded BrainFlow board.
+        sampling_rate (int): The sampling rate of the recording.
+        channel_mapping (dict): Mapping of EEG channel names to electrode names.
+        eeg_channels (list): The rows holding EEG data.
+        data (np.memmap): The samples, shape (n_rows, n_samples), backed by the file.
+        markers (np.ndarray): Marker (sample_index, value) pairs, shape (n_markers, 2).
+        timestamps (np.ndarray): Timestamp index (sample_index, timestamp) pairs, shape (n_entries, 2).
+    """
+
+    def __init__(self, filename):
+        """
+        Opens a session file without loading its samples into memory.
+
+        Args:
+            filename (str): The path of the session file.
+        """
+        with open(filename, 'rb') as f:
+            raw_header = f.read(HEADER_SIZE)
+            if not raw_header.startswith(SESSION_MAGIC):
+                raise ValueError(f"{filename} is not a recorded session")
+            self.header = json.loads(raw_header[len(SESSION_MAGIC):].decode())
+            if self.header['version'] > SESSION_VERSION:
+                raise ValueError(f"Unsupported session version {self.header['version']}")
+            f.seek(0, 2)
+            file_size = f.tell()
+            index = {'markers': [], 'timestamps': []}
+            index_offset = self.header['index_offset']
+            if index_offset is not None:
+                f.seek(index_offset)
+                index = json.loads(f.read().decode())
+
+        dtype = np.dtype(self.header['dtype'])
+        n_rows = self.header['n_rows'] or 0
+        n_samples = self.header['n_samples']
+        if n_samples is None and n_rows:
+            # The recording was not closed cleanly; recover every complete sample on disk
+            n_samples = (file_size - HEADER_SIZE) // (n_rows * dtype.itemsize)
+        self.board_id = self.header['board_id']
+        self.sampling_rate = self.header['sampling_rate']
+        self.channel_mapping = self.header['channel_mapping']
+        eeg_channels = self.header['eeg_channels']
+        self.eeg_channels = eeg_channels if eeg_channels is not None else list(range(n_rows))
+        if n_rows and n_samples:
+            self.data = np.memmap(filename, dtype=dtype, mode='r', offset=HEADER_SIZE, shape=(n_samples, n_rows)).T
+        else:
+            self.data = np.empty((n_rows, 0), dtype=dtype)
+        self.markers = np.array(index['markers'], dtype=float).reshape(-1, 2)
+        self.timestamps = np.array(index['timestamps'], dtype=float).reshape(-1, 2)
+
+    @property
+    def n_samples(self):
+        """
+        The number of samples in the recording.
+        """
+        return self.data.shape[1]
+
+    def time_slice(self, start, stop, channels=None):
+        """
+        Returns the samples between two times, only reading that range from disk.
+
+        Args:
+            start (float): The start time in seconds from the beginning of the recording.
+            stop (float): The stop time in seconds from the beginning of the recording.
+            channels (list): The rows to return. Defaults to the EEG rows.
+
+        Returns:
+            np.ndarray: The selected samples, shape (n_channels, n_selected_samples).
+        """
+        channels = self.eeg_channels if channels is None else channels
+        window = self.data[:, int(start * self.sampling_rate):int(stop * self.sampling_rate)]
+        return window[channels]
+
+
+def load_session(filename):
+    """
+    Opens a session file written by SessionRecorder as a memory-mapped RecordedSession.
+
+    Args:
+        filename (str): The path of the session file.
+
+    Returns:
+        RecordedSession: The memory-mapped session.
+    """
+    return RecordedSession(filename)
@@ -0,0 +1,225 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+from .cca import orthonormal_basis
+
+MAX_BANKS = 8  # Reference banks kept by get_reference_bank()
+MAX_BASES = 16  # Window lengths whose orthonormal bases each bank keeps
+
+_banks = OrderedDict()
+_banks_lock = threading.Lock()
+
+
+def get_reference_bank(frequencies, harmonics, sampling_rate):
+    """
+    Returns the shared ReferenceBank for a set of targets, creating it if needed.
+
+    Banks are memoized on (frequencies, harmonics, sampling_rate) with least-recently-used eviction,
+    so every classifier built with the same targets shares one set of reference signals.
+
+    Args:
+        frequencies (list): The target frequencies in Hz.
+        harmonics (list): The harmonics generated for each frequency.
+        sampling_rate (float): The sampling rate of the EEG data.
+
+    Returns:
+        ReferenceBank: The shared reference bank.
+    """
+    key = (tuple(float(f) for f in frequencies), tuple(float(h) for h in harmonics), float(sampling_rate))
+    with _banks_lock:
+        bank = _banks.pop(key, None)
+        if bank is None:
+            bank = ReferenceBank(key[0], key[1], key[2])
+        _banks[key] = bank
+        while len(_banks) > MAX_BANKS:
+            _banks.popitem(last=False)
+    return bank
+
+
+def _read_only(array):
+    """
+    Returns a read-only view of an array, so arrays shared between classifiers cannot be modified through it.
+    """
+    array = array.view()
+    array.flags.writeable = False
+    return array
+
+
+class ReferenceBank:
+    """
+    Sine/cosine reference signals for a set of target frequencies, served for any window length.
+
+    All references are slices of one master table that grows as longer windows are requested, and the
+    orthonormal (QR) bases used by the CCA backends are cached per window length with LRU eviction.
+    Returned arrays are shared, read-only views.
+
+    Attributes:
+        frequencies (tuple): The target frequencies in Hz.
+        harmonics (tuple): The harmonics generated for each frequency.
+        sampling_rate (float): The sampling rate of the EEG data.
+    """
+
+    def __init__(self, frequencies, harmonics, sampling_rate):
+        """
+        Initializes an empty ReferenceBank. Use get_reference_bank() to share banks between classifiers.
+
+        Args:
+            frequencies (tuple): The target frequencies in Hz.
+            harmonics (tuple): The harmonics generated for each frequency.
+            sampling_rate (float): The sampling rate of the EEG data.
+        """
+        self.frequencies = tuple(frequencies)
+        self.harmonics = tuple(harmonics)
+        self.sampling_rate = sampling_rate
+        self._master = np.empty((len(self.frequencies), 0, 2 * len(self.harmonics)))
+        self._bases = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # The lock cannot be pickled (e.g. when classifiers are sent to worker processes); caches are rebuilt on demand
+        state = self.__dict__.copy()
+        del state['_lock']
+        state['_bases'] = OrderedDict()
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._master = _read_only(self._master)  # Unpickled arrays are writeable
+        self._lock = threading.Lock()
+
+    def _grow(self, n_samples):
+        """
+        Regenerates the master table so it holds at least n_samples samples (at least doubling its length).
+
+        Args:
+            n_samples (int): The minimum number of samples needed.
+        """
+        length = max(n_samples, 2 * self._master.shape[1])
+        time = np.arange(length) / self.sampling_rate
+        phase = 2 * np.pi * np.multiply.outer(np.outer(self.frequencies, self.harmonics), time)  # (targets, harmonics, samples)
+        master = np.empty((len(self.frequencies), length, 2 * len(self.harmonics)))
+        master[:, :, 0::2] = np.sin(phase).transpose(0, 2, 1)
+        master[:, :, 1::2] = np.cos(phase).transpose(0, 2, 1)
+        self._master = _read_only(master)
+
+    def preload(self, references, bases=None, n_harmonics=None):
+        """
+        Seeds the bank with saved references (and bases), e.g. from a classifier bundle, so they are not recomputed.
+
+        Args:
+            references (np.ndarray): The references of every target, as returned by references(n_samples).
+            bases (np.ndarray): The matching orthonormal bases, as returned by bases(n_samples, n_harmonics), or None.
+            n_harmonics (int): The number of harmonics the bases use. Defaults to all of them.
+
+        Raises:
+            ValueError: If the references or bases do not have the shape this bank's targets and harmonics give.
+        """
+        n_harmonics = len(self.harmonics) if n_harmonics is None else n_harmonics
+        expected = (len(self.frequencies), references.shape[1], 2 * len(self.harmonics))
+        if references.shape != expected:
+            raise ValueError(f"References of shape {references.shape} do not match the bank, expected {expected}")
+        if bases is not None and bases.shape != expected[:2] + (2 * n_harmonics,):
+            raise ValueError(f"Bases of shape {bases.shape} do not match the bank, "
+                             f"expected {expected[:2] + (2 * n_harmonics,)}")
+        with self._lock:
+            if references.shape[1] > self._master.shape[1]:
+                self._master = _read_only(references)
+            if bases is not None:
+                self._bases[(references.shape[1], n_harmonics)] = _read_only(bases)
+                while len(self._bases) > MAX_BASES:
+                    self._bases.popitem(last=False)
+
+    def references(self, n_samples):
+        """
+        Returns the stacked reference signals of every target for a window of n_samples.
+
+        Columns are ordered sin/cos per harmonic: [sin(h1), cos(h1), sin(h2), cos(h2), ...].
+
+        Args:
+            n_samples (int): The window length in samples.
+
+        Returns:
+            np.ndarray: A view of shape (n_targets, n_samples, 2 * n_harmonics).
+        """
+        with self._lock:
+            if n_samples > self._master.shape[1]:
+                self._grow(n_samples)
+            return self._master[:, :n_samples, :]
+
+    def rotation(self, offset):
+        """
+        Returns the matrices that shift every target's references by offset samples.
+
+        A time shift only changes the phase of each sine/cosine pair, so the references of a window starting
+        at sample offset are references(n_samples) @ rotation(offset): a 2x2 rotation per harmonic. Only
+        2 * n_targets * n_harmonics sines and cosines are evaluated, whatever the window length.
+
+        Args:
+            offset (int): The start of the window, in samples from time zero.
+
+        Returns:
+            np.ndarray: Block-diagonal rotations, shape (n_targets, 2 * n_harmonics, 2 * n_harmonics).
+        """
+        cycles = np.outer(self.frequencies, self.harmonics) * offset / self.sampling_rate
+        phase = 2 * np.pi * (cycles % 1)  # Reduced first so long-running offsets keep full precision
+        cos, sin = np.cos(phase), np.sin(phase)
+        n_harmonics = len(self.harmonics)
+        rotation = np.zeros((len(self.frequencies), 2 * n_harmonics, 2 * n_harmonics))
+        index = np.arange(n_harmonics)
+        rotation[:, 2 * index, 2 * index] = cos
+        rotation[:, 2 * index, 2 * index + 1] = -sin
+        rotation[:, 2 * index + 1, 2 * index] = sin
+        rotation[:, 2 * index + 1, 2 * index + 1] = cos
+        return rotation
+
+    def references_at(self, offset, n_samples):
+        """
+        Returns the references of every target for the n_samples starting at sample offset.
+
+        Args:
+            offset (int): The start of the window, in samples from time zero.
+            n_samples (int): The window length in samples.
+
+        Returns:
+            np.ndarray: The references, shape (n_targets, n_samples, 2 * n_harmonics).
+        """
+        return self.references(n_samples) @ self.rotation(offset)
+
+    def project_at(self, data, offset):
+        """
+        Returns the projection of data onto the references of the window starting at sample offset.
+
+        The data is projected onto the unshifted references and the small result is rotated, so no
+        references are generated for the offset.
+
+        Args:
+            data (np.ndarray): The data, shape (n_channels, n_samples).
+            offset (int): The sample index of the first column of data.
+
+        Returns:
+            np.ndarray: data @ references_at(offset, n_samples), shape (n_targets, n_channels, 2 * n_harmonics).
+        """
+        return (data @ self.references(data.shape[1])) @ self.rotation(offset)
+
+    def bases(self, n_samples, n_harmonics=None):
+        """
+        Returns the orthonormal bases of every target's references for a window of n_samples.
+
+        Args:
+            n_samples (int): The window length in samples.
+            n_harmonics (int): Only use the first n_harmonics harmonics. Defaults to all of them.
+
+        Returns:
+            np.ndarray: The bases, shape (n_targets, n_samples, 2 * n_harmonics).
+        """
+        n_harmonics = len(self.harmonics) if n_harmonics is None else n_harmonics
+        key = (n_samples, n_harmonics)
+        with self._lock:
+            bases = self._bases.pop(key, None)
+        if bases is None:
+            bases = _read_only(orthonormal_basis(self.references(n_samples)[:, :, :2 * n_harmonics]))
+        with self._lock:
+            self._bases[key] = bases
+            while len(self._bases) > MAX_BASES:
+                self._bases.popitem(last=False)
+        return bases
@@ -1,35 +1,128 @@
 import numpy as np
 from mvlearn.embed import CCA
-from scipy.signal import welch, butter, filtfilt
+from scipy.signal import welch, filtfilt
+from scipy.linalg import eigh
 import matplotlib.pyplot as plt
 import matplotlib
+from .filter_design import design_filter
+from .cca import CCA_BACKENDS, orthonormal_basis, canonical_correlations, canonical_weights, \
+    covariance_canonical_correlations, stacked_max_canonical_correlations
+from .references import get_reference_bank
+from .persistence import bundle_params, save_bundle, load_bundle
 
 matplotlib.use('Agg')  # Use a non-GUI backend
 
+def _best_target(frequencies, scores):
+    """
+    Returns the frequency with the highest positive score and that score, or (None, 0) if no score is positive.
+    """
+    max_corr = 0
+    target_freq = None
+    for freq, corr in zip(frequencies, scores):
+        if corr > max_corr:
+            max_corr = corr
+            target_freq = freq
+    return target_freq, max_corr
+
+def _best_targets(frequencies, scores):
+    """
+    Vectorized _best_target for a stack of score vectors, shape (n_trials, n_targets).
+    Returns the detected frequencies (NaN where no score is positive) and the score vectors.
+    """
+    best = np.argmax(scores, axis=-1)
+    best_scores = np.take_along_axis(scores, best[..., None], axis=-1)[..., 0]
+    predictions = np.where(best_scores > 0, np.asarray(frequencies, dtype=float)[best], np.nan)
+    return predictions, scores
+
+def fbcca_subbands(sampling_rate, num_subbands, low=6, high=40):
+    """
+    Returns the (low, high) edges of the FBCCA subbands in Hz, laid out as in Chen et al. (2015): subband n starts
+    at n * low Hz and all subbands share the high edge, so the lower subbands keep the fundamental of every target
+    and the higher ones its harmonics. This is the layout the standard subband weights n^-1.25 + 0.25 are designed for.
+    """
+    high = min(high, 0.5 * sampling_rate)
+    if num_subbands * low >= high:
+        raise ValueError(f"{num_subbands} subbands starting every {low} Hz do not fit below {high} Hz")
+    return [(n * low, high) for n in range(1, num_subbands + 1)]
+
+def fbcca_filter_bank(sampling_rate, num_subbands, low=6, high=40):
+    """
+    Returns the (b, a) coefficients of the FBCCA subband filters, see fbcca_subbands().
+    """
+    return [design_filter(sampling_rate, list(band), 4, btype='band')
+            for band in fbcca_subbands(sampling_rate, num_subbands, low, high)]
+
+def _normalize_rows(data):
+    """
+    Centres each row of data and scales it to unit norm, so row dot products are Pearson correlations.
+    """
+    data = data - data.mean(axis=-1, keepdims=True)
+    return data / np.linalg.norm(data, axis=-1, keepdims=True)
+
+def _preload_references(params, arrays, n_harmonics=None):
+    """
+    Seeds the shared reference bank of a loaded classifier with its saved references and bases.
+    """
+    if 'references' in arrays:
+        bank = get_reference_bank(params['frequencies'], params['harmonics'], params['sampling_rate'])
+        bank.preload(arrays['references'], arrays.get('reference_bases'), n_harmonics)
+
 class SSVEP_SNR:
     """
     A class to calculate and plot Signal-to-Noise Ratio (SNR) for SSVEP signals.
+
+    The SNR of a bin is its power over the mean power of the other bins within noise_bandwidth Hz. The PSD is
+    computed once per signal, and the noise of every bin comes from one cumulative sum over the spectrum.
+    The signal may be a stack (e.g. (n_windows, n_channels, n_samples)); everything is computed along the last axis.
     """
-    def __init__(self, signal, fs, noise_bandwidth=1):
+    def __init__(self, signal, fs, noise_bandwidth=1, nperseg=1024):
         self.signal = signal
         self.fs = fs
         self.noise_bandwidth = noise_bandwidth
+        self.nperseg = nperseg
+        self._psd = None
 
     def calculate_psd(self):
-        freqs, psd = welch(self.signal, self.fs, nperseg=1024)
-        return freqs, psd
+        if self._psd is None:
+            self._psd = welch(self.signal, self.fs, nperseg=min(self.nperseg, np.shape(self.signal)[-1]), axis=-1)
+        return self._psd
+
+    def _noise_power(self, freqs, psd, bins):
+        """
+        Returns the mean power of the neighbouring bins (within noise_bandwidth, excluding the bin itself) of each bin in bins.
+        """
+        n_bins = psd.shape[-1]
+        resolution = freqs[1] - freqs[0]  # Welch bins are evenly spaced
+        half_width = int(np.floor(self.noise_bandwidth / resolution + 1e-9))
+        lower = np.maximum(bins - half_width, 0)
+        upper = np.minimum(bins + half_width, n_bins - 1)
+        cumulative = np.concatenate([np.zeros(psd.shape[:-1] + (1,)), np.cumsum(psd, axis=-1)], axis=-1)
+        noise_sum = cumulative[..., upper + 1] - cumulative[..., lower] - psd[..., bins]
+        return noise_sum / (upper - lower)
 
     def calculate_snr(self):
         freqs, psd = self.calculate_psd()
-        snr = np.zeros_like(psd)
-        for i in range(len(freqs)):
-            noise_range = np.logical_and(freqs >= freqs[i] - self.noise_bandwidth, freqs <= freqs[i] + self.noise_bandwidth)
-            noise_range[i] = False  # Exclude the signal frequency itself
-            signal_power = psd[i]
-            noise_power = np.mean(psd[noise_range])
-            snr[i] = 10 * np.log10(signal_power / noise_power)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            snr = 10 * np.log10(psd / self._noise_power(freqs, psd, np.arange(psd.shape[-1])))
         return freqs, snr
 
+    def target_powers(self, target_freqs):
+        """
+        Returns the power of the bins nearest to the target frequencies and their neighbourhood noise power,
+        each shape (..., n_targets), without computing the full SNR spectrum.
+        """
+        freqs, psd = self.calculate_psd()
+        bins = np.argmin(np.abs(freqs[:, None] - np.asarray(target_freqs)[None, :]), axis=0)
+        return psd[..., bins], self._noise_power(freqs, psd, bins)
+
+    def target_snr(self, target_freqs):
+        """
+        Returns the SNR (dB) of the bins nearest to the target frequencies only, shape (..., n_targets).
+        """
+        signal_power, noise_power = self.target_powers(target_freqs)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return 10 * np.log10(signal_power / noise_power)
+
     def plot_snr(self, filename='snr_plot.png', fmin=1.0, fmax=50.0):
         freqs, psd = self.calculate_psd()
         freqs, snr = self.calculate_snr()
@@ -47,47 +140,94 @@ class SSVEP_SNR:
         plt.close()
 
 class ClassifySSVEP:
-    def __init__(self, frequencies, harmonics, sampling_rate, n_samples, stack_harmonics=True):
+    def __init__(self, frequencies, harmonics, sampling_rate, n_samples, stack_harmonics=True, backend='batched'):
+        if backend not in CCA_BACKENDS:
+            raise ValueError(f"Unknown CCA backend '{backend}', expected one of {CCA_BACKENDS}")
         self.frequencies = frequencies
         self.harmonics = harmonics
         self.sampling_rate = sampling_rate
         self.n_samples = n_samples
         self.stack_harmonics = stack_harmonics
+        self.backend = backend
+        self.reference_bank = get_reference_bank(frequencies, harmonics, sampling_rate)
         self.reference_signals = self._generate_reference_signals()
+        self.reference_basis_stack = self._reference_basis_stack(n_samples)
+        self.reference_bases = dict(zip(self.frequencies, self.reference_basis_stack))
 
     def _generate_reference_signals(self):
+        """
+        Returns views of the shared reference bank: (n_samples, 2 * n_harmonics) per frequency when stacked,
+        (2 * n_harmonics, n_samples) otherwise.
+        """
         reference_signals = {}
-        time = np.linspace(0, self.n_samples / self.sampling_rate, self.n_samples, endpoint=False)
-        for freq in self.frequencies:
-            signals = []
-            for harmon in self.harmonics:
-                sine_wave = np.sin(2 * np.pi * harmon * freq * time)
-                cosine_wave = np.cos(2 * np.pi * harmon * freq * time)
-                signals.append(sine_wave)
-                signals.append(cosine_wave)
-            if self.stack_harmonics:
-                reference_signals[freq] = np.vstack(signals).T
-            else:
-                reference_signals[freq] = np.array(signals)
+        for freq, ref in zip(self.frequencies, self.reference_bank.references(self.n_samples)):
+            reference_signals[freq] = ref if self.stack_harmonics else ref.T
         return reference_signals
 
+    def _reference_basis_stack(self, n_samples):
+        """
+        Returns the cached QR bases of every target's references for a window of n_samples.
+        Unstacked analysis only scores the fundamental sine/cosine pair (see _mvlearn_correlations), so only that pair is used.
+        """
+        return self.reference_bank.bases(n_samples, None if self.stack_harmonics else 1)
+
     def get_reference_signals(self, frequency):
         return self.reference_signals.get(frequency, None)
 
     def cca_analysis(self, eeg_data):
+        return _best_target(self.frequencies, self.score(eeg_data))
+
+    def score(self, eeg_data):
+        """
+        Returns the CCA correlation of the EEG data with every target's references, in self.frequencies order.
+        Windows of any length are supported; references for other lengths come from the shared reference bank.
+        A stack of windows, shape (n_trials, n_channels, n_samples), gives shape (n_trials, n_targets).
+        """
+        n_samples = eeg_data.shape[-1]
+        if self.backend == 'mvlearn':
+            if eeg_data.ndim == 3:
+                return np.array([self._mvlearn_correlations(trial) for trial in eeg_data])
+            return self._mvlearn_correlations(eeg_data)
+        basis_stack = self.reference_basis_stack if n_samples == self.n_samples else self._reference_basis_stack(n_samples)
+        if self.backend == 'batched':
+            # One window is scored as a stack of one, so a window gets the same scores whichever entry point it goes through
+            stacked = np.swapaxes(eeg_data, -1, -2).reshape(-1, n_samples, eeg_data.shape[-2])
+            return stacked_max_canonical_correlations(stacked, basis_stack).reshape(eeg_data.shape[:-2] + (len(self.frequencies),))
+        # 'qr': the EEG is QR-decomposed once per window (rank-aware, see orthonormal_basis) and each frequency
+        # only costs the SVD of a small (n_channels x n_references) matrix
+        eeg_basis = orthonormal_basis(np.swapaxes(eeg_data, -1, -2))
+        correlations = np.zeros(eeg_data.shape[:-2] + (len(self.frequencies),))
+        for target, ref_basis in enumerate(basis_stack):
+            correlations[..., target] = canonical_correlations(eeg_basis, ref_basis)[..., 0]
+        return correlations
+
+    def classify_batch(self, eeg_batch, batch_size=256):
+        """
+        Classifies a stack of trials with batched linear algebra.
+
+        Args:
+            eeg_batch (np.ndarray): The trials, shape (n_trials, n_channels, n_samples).
+            batch_size (int): The number of trials scored at once, which bounds the memory used.
+
+        Returns:
+            tuple: The detected frequency of every trial (NaN where no correlation is positive), shape (n_trials,),
+                and the correlations, shape (n_trials, n_targets).
+        """
+        scores = np.concatenate([self.score(eeg_batch[start:start + batch_size])
+                                 for start in range(0, len(eeg_batch), batch_size)] or [np.zeros((0, len(self.frequencies)))])
+        return _best_targets(self.frequencies, scores)
+
+    def _mvlearn_correlations(self, eeg_data):
         cca = CCA(n_components=1)
-        max_corr = 0
-        target_freq = None
-        for freq, ref in self.reference_signals.items():
+        correlations = np.zeros(len(self.frequencies))
+        references = self.reference_bank.references(eeg_data.shape[1])
+        for target, ref in enumerate(references):
             if self.stack_harmonics:
-                if eeg_data.shape[1] != ref.shape[0]:
-                    raise ValueError("EEG data and reference signals must have the same number of samples")
                 cca.fit([eeg_data.T, ref])
                 U, V = cca.transform([eeg_data.T, ref])
             else:
                 U, V = None, None
-                if eeg_data.shape[1] != ref.shape[1]:
-                    raise ValueError("EEG data and reference signals must have the same number of samples")
+                ref = ref.T
                 for i in range(ref.shape[0] // 2):
                     cca.fit([eeg_data.T, ref[2*i:2*i+2, :].T])
                     U_tmp, V_tmp = cca.transform([eeg_data.T, ref[2*i:2*i+2, :].T])
@@ -96,58 +236,339 @@ class ClassifySSVEP:
                     else:
                         U = np.hstack((U, U_tmp))
                         V = np.hstack((V, V_tmp))
-            corr = np.corrcoef(U[:, 0], V[:, 0])[0, 1]
-            if corr > max_corr:
-                max_corr = corr
-                target_freq = freq
-        return target_freq, max_corr
+            correlations[target] = np.corrcoef(U[:, 0], V[:, 0])[0, 1]
+        return correlations
 
     def check_snr(self, eeg_data):
-        signal = eeg_data.flatten()  # Assuming eeg_data is 2D: (n_channels, n_samples)
-        snr_calculator = SSVEP_SNR(signal, self.sampling_rate)
-        freqs, snr_values = snr_calculator.calculate_snr()
-        snr_results = {}
-        for freq in self.frequencies:
-            target_idx = np.argmin(np.abs(freqs - freq))
-            snr_results[freq] = snr_values[target_idx]
-        return snr_results
+        """
+        Returns the channel-combined SNR (dB) of each target frequency, see channel_snr.
+        """
+        _, combined = self.channel_snr(eeg_data)
+        return dict(zip(self.frequencies, combined))
 
-class FBCCA:
-    def __init__(self, frequencies, harmonics, sampling_rate, n_samples, num_subbands=5):
+    def channel_snr(self, eeg_data):
+        """
+        Calculates the SNR of every target on every channel with one Welch call along the sample axis.
+
+        Args:
+            eeg_data (np.ndarray): A window, shape (n_channels, n_samples), or a stack of windows, shape (n_windows, n_channels, n_samples).
+
+        Returns:
+            tuple: The SNR in dB per channel, shape (..., n_channels, n_targets), and the channel-combined SNR in dB
+                (target power over noise power, both averaged over channels), shape (..., n_targets).
+        """
+        signal_power, noise_power = SSVEP_SNR(eeg_data, self.sampling_rate).target_powers(self.frequencies)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            snr = 10 * np.log10(signal_power / noise_power)
+            combined = 10 * np.log10(signal_power.mean(axis=-2) / noise_power.mean(axis=-2))
+        return snr, combined
+
+    def save(self, path):
+        """
+        Saves the parameters, references and QR bases of the classifier to one bundle, see persistence.save_bundle().
+        """
+        params = bundle_params(frequencies=self.frequencies, harmonics=self.harmonics, sampling_rate=self.sampling_rate,
+                                n_samples=self.n_samples, stack_harmonics=self.stack_harmonics, backend=self.backend)
+        save_bundle(path, type(self).__name__, params, {'references': self.reference_bank.references(self.n_samples),
+                                                        'reference_bases': self.reference_basis_stack})
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Loads a classifier saved with save(), reusing the saved references and bases instead of recomputing them.
+
+        Args:
+            path (str): The path of the bundle.
+            mmap (bool): Whether to memory-map the large arrays instead of reading them.
+        """
+        _, params, arrays = load_bundle(path, cls.__name__, mmap)
+        _preload_references(params, arrays, None if params['stack_harmonics'] else 1)
+        return cls(**params)
+
+class StreamingCCA:
+    """
+    Stacked-harmonics CCA scorer for overlapping sliding windows that is updated incrementally.
+
+    The running sums of the EEG, the references and their products are kept for the current window. Each update
+    adds the new samples and subtracts the ones that slid out, so the cost per hop is proportional to the hop
+    length, and scoring solves CCA from the small covariance matrices (see covariance_canonical_correlations).
+    References are evaluated at absolute sample times by rotating the shared reference bank (see ReferenceBank.rotation):
+    a phase shift does not change the span of a sine/cosine pair, so the correlations equal those of
+    ClassifySSVEP(stack_harmonics=True) on the same window, and no sinusoids are generated per hop.
+    The sums are recomputed from the window every refresh_interval updates to stop rounding errors from accumulating,
+    and as soon as subtracting expired samples has cancelled a channel's variance down to rounding error (e.g. when the
+    window goes flat). The EEG is accumulated relative to a per-channel offset taken from the window, so a large DC
+    level (e.g. a railed channel) does not cancel catastrophically either.
+    """
+    def __init__(self, frequencies, harmonics, sampling_rate, n_samples, n_channels, refresh_interval=100):
         self.frequencies = frequencies
         self.harmonics = harmonics
         self.sampling_rate = sampling_rate
         self.n_samples = n_samples
-        self.num_subbands = num_subbands
-        self.reference_signals = self._generate_reference_signals()
+        self.n_channels = n_channels
+        self.refresh_interval = refresh_interval
+        self.reference_bank = get_reference_bank(frequencies, harmonics, sampling_rate)
+        self._window = np.zeros((n_channels, n_samples))  # Circular; sample t is stored at column t % n_samples
+        self._offset = np.zeros(n_channels)
+        self.reset()
+
+    def reset(self):
+        """
+        Forgets all samples (e.g. after a gap in the stream).
+        """
+        n_targets, n_refs = len(self.frequencies), 2 * len(self.harmonics)
+        self.n_seen = 0  # Absolute index of the next sample
+        self.n_filled = 0
+        self._updates = 0
+        self._sx = np.zeros(self.n_channels)
+        self._sxx = np.zeros((self.n_channels, self.n_channels))
+        self._sy = np.zeros((n_targets, n_refs))
+        self._syy = np.zeros((n_targets, n_refs, n_refs))
+        self._sxy = np.zeros((n_targets, self.n_channels, n_refs))
+        self._removed = np.zeros(self.n_channels)  # Energy of each channel subtracted since the sums were recomputed
+
+    def _accumulate(self, data, start, sign=1):
+        """
+        Adds (sign=1) or subtracts (sign=-1) the contribution of data, whose first column is absolute sample start.
+        """
+        references = self.reference_bank.references(data.shape[1])
+        rotation = self.reference_bank.rotation(start)
+        rotation_t = np.swapaxes(rotation, 1, 2)
+        data = data - self._offset[:, None]
+        if sign < 0:
+            self._removed += np.einsum('cs,cs->c', data, data)
+        self._sx += sign * data.sum(axis=1)
+        self._sxx += sign * (data @ data.T)
+        self._sy += sign * np.einsum('tk,tkj->tj', references.sum(axis=1), rotation)
+        self._syy += sign * (rotation_t @ (np.swapaxes(references, 1, 2) @ references) @ rotation)
+        self._sxy += sign * ((data @ references) @ rotation)
+
+    def _window_samples(self, start, n_samples):
+        """
+        Returns n_samples of the circular window from absolute sample start on.
+        """
+        return self._window[:, np.arange(start, start + n_samples) % self.n_samples]
+
+    def update(self, chunk):
+        """
+        Adds new samples to the window, dropping the oldest ones once it is full.
+
+        Args:
+            chunk (np.ndarray): The new (filtered) EEG samples, shape (n_channels, n_new).
+        """
+        chunk = np.asarray(chunk, dtype=float)
+        self.n_seen += chunk.shape[1] - min(chunk.shape[1], self.n_samples)  # Samples older than one window are skipped
+        chunk = chunk[:, -self.n_samples:]
+        n_new = chunk.shape[1]
+        n_expired = max(0, self.n_filled + n_new - self.n_samples)
+        oldest = self.n_seen - self.n_filled
+        self._updates += 1
+        if self.n_filled == 0:
+            self._offset = chunk.mean(axis=1)
+        refresh = n_new == self.n_samples or self._updates >= self.refresh_interval
+        if n_expired and not refresh:
+            self._accumulate(self._window_samples(oldest, n_expired), oldest, -1)
+        self._window[:, np.arange(self.n_seen, self.n_seen + n_new) % self.n_samples] = chunk
+        self.n_filled = min(self.n_samples, self.n_filled + n_new)
+        self.n_seen += n_new
+        if refresh:
+            self.refresh()
+        else:
+            self._accumulate(chunk, self.n_seen - n_new)
+
+    def refresh(self):
+        """
+        Recomputes the running sums from the samples in the window.
+        """
+        filled, seen = self.n_filled, self.n_seen
+        window = self._window_samples(seen - filled, filled)
+        self.reset()
+        self.n_filled, self.n_seen = filled, seen
+        if filled:
+            self._offset = window.mean(axis=1)
+        self._accumulate(window, seen - filled)
+
+    def score(self):
+        """
+        Returns the canonical correlation of the current window with every target's references, in self.frequencies order.
+        """
+        n = self.n_filled
+        if n <= max(self.n_channels, self._sy.shape[1]):
+            return np.zeros(len(self.frequencies))  # Not enough samples for the covariances to be full rank
+        cxx, cyy, cxy = self._covariances()
+        if np.any((self._removed > 0) & (np.diag(cxx) * n <= 1e-8 * self._removed)):
+            # Subtracting expired samples left only rounding error in some channel's variance
+            self.refresh()
+            cxx, cyy, cxy = self._covariances()
+        if np.trace(cxx) <= 0:
+            return np.zeros(len(self.frequencies))  # Flat window
+        return covariance_canonical_correlations(cxx, cyy, cxy)
+
+    def _covariances(self):
+        """
+        Returns the EEG covariance, the reference covariances and the cross-covariances of the current window.
+        """
+        n = self.n_filled
+        mean_x = self._sx / n
+        mean_y = self._sy / n
+        cxx = self._sxx / n - np.outer(mean_x, mean_x)
+        cyy = self._syy / n - mean_y[:, :, None] * mean_y[:, None, :]
+        cxy = self._sxy / n - mean_x[None, :, None] * mean_y[:, None, :]
+        return cxx, cyy, cxy
+
+    def cca_analysis(self, chunk=None):
+        """
+        Optionally adds a chunk of new samples, then returns the detected frequency and its correlation.
+        """
+        if chunk is not None:
+            self.update(chunk)
+        return _best_target(self.frequencies, self.score())
+
+
+class ExtendedCCA:
+    """
+    Extended CCA classifier that combines individual calibration templates with sine/cosine references.
+
+    fit() learns, per target, the CCA spatial filters between the template (mean calibration trial) and the
+    references, and between single trials and the template. The filters and the filtered templates and
+    references are cached, so scoring a window is a few projections and correlations with no CCA solve.
+    Each target's score combines the three correlations as sum(sign(r) * r ** 2).
+    """
+    def __init__(self, frequencies, harmonics, sampling_rate, n_samples):
+        self.frequencies = frequencies
+        self.harmonics = harmonics
+        self.sampling_rate = sampling_rate
+        self.n_samples = n_samples
+        self.reference_bank = get_reference_bank(frequencies, harmonics, sampling_rate)
+        self.templates = None  # (n_targets, n_channels, n_samples)
+        self.reference_filters = None  # Spatial filters from template vs references, (n_targets, n_channels)
+        self.template_filters = None  # Spatial filters from single trials vs template, (n_targets, n_channels)
+        self.reference_weights = None  # Reference weights from template vs references, (n_targets, 2 * n_harmonics)
+        self._cached = None
+
+    def fit(self, epochs, labels):
+        """
+        Learns the spatial filters and templates from calibration trials.
+
+        Args:
+            epochs (np.ndarray): Calibration trials, shape (n_trials, n_channels, n_samples).
+            labels (list): The target frequency of each trial.
+        """
+        epochs = np.asarray(epochs, dtype=float)[:, :, :self.n_samples]
+        labels = np.asarray(labels)
+        n_trials, n_channels, n_samples = epochs.shape
+        references = self.reference_bank.references(n_samples)
+        self.templates = np.zeros((len(self.frequencies), n_channels, n_samples))
+        self.reference_filters = np.zeros((len(self.frequencies), n_channels))
+        self.template_filters = np.zeros((len(self.frequencies), n_channels))
+        self.reference_weights = np.zeros((len(self.frequencies), references.shape[2]))
+        for target, freq in enumerate(self.frequencies):
+            trials = epochs[labels == freq]
+            if len(trials) == 0:
+                raise ValueError(f"ExtendedCCA needs at least one calibration trial for {freq} Hz")
+            template = trials.mean(axis=0)
+            self.templates[target] = template
+            self.reference_filters[target], self.reference_weights[target] = canonical_weights(template.T, references[target])
+            concatenated = np.concatenate(trials, axis=1).T
+            self.template_filters[target], _ = canonical_weights(concatenated, np.tile(template, len(trials)).T)
+        self._cached = self._project(n_samples)
+        return self
+
+    def _project(self, n_samples):
+        """
+        Returns the normalized filtered references and templates for windows of n_samples.
+        """
+        references = self.reference_bank.references(n_samples)
+        templates = self.templates[:, :, :n_samples]
+        return (_normalize_rows(np.einsum('ksh,kh->ks', references, self.reference_weights)),
+                _normalize_rows(np.einsum('kc,kcs->ks', self.reference_filters, templates)),
+                _normalize_rows(np.einsum('kc,kcs->ks', self.template_filters, templates)))
+
+    def score(self, eeg_data):
+        """
+        Returns the combined extended-CCA score of every target, in self.frequencies order.
+        Windows up to the calibration length are supported.
+        """
+        if self.templates is None:
+            raise ValueError("ExtendedCCA must be fitted before use")
+        n_samples = eeg_data.shape[1]
+        if n_samples > self.templates.shape[2]:
+            raise ValueError("EEG data is longer than the calibration trials")
+        references, reference_templates, templates = self._cached if n_samples == self.templates.shape[2] else self._project(n_samples)
+        reference_projection = _normalize_rows(self.reference_filters @ eeg_data)
+        template_projection = _normalize_rows(self.template_filters @ eeg_data)
+        correlations = np.stack([np.einsum('ks,ks->k', reference_projection, references),
+                                 np.einsum('ks,ks->k', reference_projection, reference_templates),
+                                 np.einsum('ks,ks->k', template_projection, templates)])
+        return (np.sign(correlations) * correlations ** 2).sum(axis=0)
+
+    def ecca_analysis(self, eeg_data):
+        return _best_target(self.frequencies, self.score(eeg_data))
+
+    def save(self, path):
+        """
+        Saves the parameters, references, templates and spatial filters of the classifier to one bundle.
+        """
+        params = bundle_params(frequencies=self.frequencies, harmonics=self.harmonics, sampling_rate=self.sampling_rate,
+                                n_samples=self.n_samples)
+        arrays = {}
+        if self.templates is not None:
+            arrays = {'references': self.reference_bank.references(self.templates.shape[2]), 'templates': self.templates,
+                      'reference_filters': self.reference_filters, 'template_filters': self.template_filters,
+                      'reference_weights': self.reference_weights}
+        save_bundle(path, type(self).__name__, params, arrays)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Loads a classifier saved with save(), fitted if it was saved fitted.
+
+        Args:
+            path (str): The path of the bundle.
+            mmap (bool): Whether to memory-map the large arrays (e.g. the templates) instead of reading them.
+        """
+        _, params, arrays = load_bundle(path, cls.__name__, mmap)
+        _preload_references(params, arrays)
+        classifier = cls(**params)
+        if 'templates' in arrays:
+            classifier.templates = arrays['templates']
+            classifier.reference_filters = arrays['reference_filters']
+            classifier.template_filters = arrays['template_filters']
+            classifier.reference_weights = arrays['reference_weights']
+            classifier._cached = classifier._project(classifier.templates.shape[2])
+        return classifier
+
+
+class FBCCA:
+    def __init__(self, frequencies, harmonics, sampling_rate, n_samples, num_subbands=5, backend='batched',
+                 weight_a=1.25, weight_b=0.25):
+        self._configure(frequencies, harmonics, sampling_rate, n_samples, num_subbands, backend, weight_a, weight_b)
         self.filters = self._generate_filters()
 
-    def _generate_reference_signals(self):
-        reference_signals = {}
-        time = np.linspace(0, self.n_samples / self.sampling_rate, self.n_samples, endpoint=False)
-        for freq in self.frequencies:
-            signals = []
-            for harmon in self.harmonics:
-                sine_wave = np.sin(2 * np.pi * harmon * freq * time)
-                cosine_wave = np.cos(2 * np.pi * harmon * freq * time)
-                signals.append(sine_wave)
-                signals.append(cosine_wave)
-            reference_signals[freq] = np.vstack(signals).T
-        return reference_signals
+    def _configure(self, frequencies, harmonics, sampling_rate, n_samples, num_subbands=5, backend='batched',
+                   weight_a=1.25, weight_b=0.25):
+        """
+        Sets up everything but the filter bank, which load() restores from the bundle instead of designing it.
+        """
+        if backend not in CCA_BACKENDS:
+            raise ValueError(f"Unknown CCA backend '{backend}', expected one of {CCA_BACKENDS}")
+        self.frequencies = frequencies
+        self.harmonics = harmonics
+        self.sampling_rate = sampling_rate
+        self.n_samples = n_samples
+        self.num_subbands = num_subbands
+        self.backend = backend
+        # Standard FBCCA subband weights w(n) = n^-a + b (Chen et al., 2015)
+        self.weight_a = weight_a
+        self.weight_b = weight_b
+        self.subband_weights = np.arange(1, num_subbands + 1) ** -weight_a + weight_b
+        self.reference_bank = get_reference_bank(frequencies, harmonics, sampling_rate)
+        self.reference_signals = dict(zip(self.frequencies, self.reference_bank.references(n_samples)))
+        self.reference_basis_stack = self.reference_bank.bases(n_samples)
+        self.reference_bases = dict(zip(self.frequencies, self.reference_basis_stack))
 
     def _generate_filters(self):
-        filters = []
-        nyquist = 0.5 * self.sampling_rate
-        low = 6 / nyquist
-        high = 40 / nyquist
-        subband_width = (high - low) / self.num_subbands
-        for i in range(self.num_subbands):
-            band = [low + i * subband_width, low + (i + 1) * subband_width]
-            if band[1] > 1.0:
-                band[1] = 1.0
-            b, a = butter(4, band, btype='band')
-            filters.append((b, a))
-        return filters
+        return fbcca_filter_bank(self.sampling_rate, self.num_subbands)
 
     def filter_data(self, data):
         filtered_data = []
@@ -156,22 +577,217 @@ class FBCCA:
         return np.array(filtered_data)
 
     def fbcca_analysis(self, eeg_data):
-        max_corr = 0
-        target_freq = None
-        for freq, ref in self.reference_signals.items():
-            corr = 0
-            filtered_data = self.filter_data(eeg_data)
-            for subband_data in filtered_data:
-                cca = CCA(n_components=1)
-                cca.fit([subband_data.T, ref])
-                U, V = cca.transform([subband_data.T, ref])
-                subband_corr = np.corrcoef(U[:, 0], V[:, 0])[0, 1]
-                corr += subband_corr
-            corr /= self.num_subbands
-            if corr > max_corr:
-                max_corr = corr
-                target_freq = freq
-        return target_freq, max_corr
+        """
+        Returns the target frequency with the highest weighted subband score, sum_n w(n) * rho_n^2.
+        """
+        return _best_target(self.frequencies, self.score(eeg_data))
+
+    def score(self, eeg_data):
+        """
+        Filters the window through the filter bank once and returns the weighted score of every target,
+        in self.frequencies order. A stack of windows, shape (n_trials, n_channels, n_samples), gives shape (n_trials, n_targets).
+        """
+        return self.score_filtered(self.filter_data(eeg_data))
+
+    def score_filtered(self, filtered_data):
+        """
+        Returns the weighted score of every target for data already split by the filter bank, e.g. a whole recording
+        decomposed once and windowed afterwards, shape (num_subbands, n_channels, n_samples) or
+        (num_subbands, n_trials, n_channels, n_samples).
+        """
+        subband_correlations = self.subband_correlations(filtered_data)
+        return np.tensordot(self.subband_weights, subband_correlations ** 2, axes=1)
+
+    def classify_filtered(self, filtered_batch):
+        """
+        Classifies a stack of trials already split by the filter bank, shape (num_subbands, n_trials, n_channels, n_samples).
+
+        Returns:
+            tuple: The detected frequency of every trial (NaN where no score is positive), and the scores.
+        """
+        return _best_targets(self.frequencies, self.score_filtered(filtered_batch))
+
+    def classify_batch(self, eeg_batch, batch_size=64):
+        """
+        Filters and classifies a stack of trials with broadcasting and batched linear algebra.
+
+        Args:
+            eeg_batch (np.ndarray): The trials, shape (n_trials, n_channels, n_samples).
+            batch_size (int): The number of trials filtered and scored at once, which bounds the memory used.
+
+        Returns:
+            tuple: The detected frequency of every trial (NaN where no score is positive), shape (n_trials,),
+                and the scores, shape (n_trials, n_targets).
+        """
+        scores = np.concatenate([self.score(eeg_batch[start:start + batch_size])
+                                 for start in range(0, len(eeg_batch), batch_size)] or [np.zeros((0, len(self.frequencies)))])
+        return _best_targets(self.frequencies, scores)
+
+    def subband_correlations(self, filtered_data):
+        """
+        Returns the CCA correlation of every (subband, target) pair, shape (num_subbands, n_targets).
+
+        Args:
+            filtered_data (np.ndarray): The filter bank output, shape (num_subbands, n_channels, n_samples),
+                or (num_subbands, n_trials, n_channels, n_samples) for a stack, giving (num_subbands, n_trials, n_targets).
+        """
+        if filtered_data.ndim == 4 and self.backend != 'batched':
+            return np.stack([self.subband_correlations(filtered_data[:, trial]) for trial in range(filtered_data.shape[1])], axis=1)
+        n_samples = filtered_data.shape[-1]
+        if n_samples == self.n_samples:
+            references, basis_stack = self.reference_signals.values(), self.reference_basis_stack
+        else:
+            references, basis_stack = self.reference_bank.references(n_samples), self.reference_bank.bases(n_samples)
+        if self.backend == 'batched':
+            stacked = np.swapaxes(filtered_data, -1, -2).reshape(-1, n_samples, filtered_data.shape[-2])
+            return stacked_max_canonical_correlations(stacked, basis_stack).reshape(filtered_data.shape[:-2] + (-1,))
+        correlations = np.zeros((len(filtered_data), len(self.frequencies)))
+        for band, subband_data in enumerate(filtered_data):
+            if self.backend == 'qr':
+                subband_basis = orthonormal_basis(subband_data.T)
+            for target, ref in enumerate(references):
+                if self.backend == 'qr':
+                    correlations[band, target] = canonical_correlations(subband_basis, basis_stack[target])[0]
+                else:
+                    cca = CCA(n_components=1)
+                    cca.fit([subband_data.T, ref])
+                    U, V = cca.transform([subband_data.T, ref])
+                    correlations[band, target] = np.corrcoef(U[:, 0], V[:, 0])[0, 1]
+        return correlations
+
+    def save(self, path):
+        """
+        Saves the parameters, references, QR bases and subband filter coefficients of the classifier to one bundle.
+        """
+        params = bundle_params(frequencies=self.frequencies, harmonics=self.harmonics, sampling_rate=self.sampling_rate,
+                                n_samples=self.n_samples, num_subbands=self.num_subbands, backend=self.backend,
+                                weight_a=self.weight_a, weight_b=self.weight_b)
+        arrays = {'references': self.reference_bank.references(self.n_samples), 'reference_bases': self.reference_basis_stack,
+                  'filter_b': np.array([b for b, _ in self.filters]), 'filter_a': np.array([a for _, a in self.filters])}
+        save_bundle(path, type(self).__name__, params, arrays)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Loads a classifier saved with save(), reusing the saved references, bases and filter coefficients
+        without designing the filter bank.
+
+        Args:
+            path (str): The path of the bundle.
+            mmap (bool): Whether to memory-map the large arrays instead of reading them.
+        """
+        _, params, arrays = load_bundle(path, cls.__name__, mmap)
+        _preload_references(params, arrays)
+        classifier = cls.__new__(cls)
+        classifier._configure(**params)
+        classifier.filters = list(zip(arrays['filter_b'], arrays['filter_a']))
+        return classifier
+
+class TRCA:
+    """
+    Task-related component analysis (TRCA) classifier, optionally as ensemble TRCA.
+
+    fit() learns one spatial filter per target that maximizes the reproducibility of calibration trials,
+    and caches the spatially filtered template (mean trial) of every target. Inference is one projection
+    of the window plus a correlation against the cached templates; no model is fitted per window.
+    """
+    def __init__(self, frequencies, sampling_rate, n_samples, ensemble=True):
+        self.frequencies = frequencies
+        self.sampling_rate = sampling_rate
+        self.n_samples = n_samples
+        self.ensemble = ensemble
+        self.spatial_filters = None  # (n_targets, n_channels)
+        self.templates = None  # (n_targets, n_channels, n_samples)
+        self._projected_templates = None  # Normalized filtered templates for n_samples-long windows
+
+    def fit(self, epochs, labels, regularization=1e-10):
+        """
+        Learns the spatial filters and templates from calibration trials.
+
+        Args:
+            epochs (np.ndarray): Calibration trials, shape (n_trials, n_channels, n_samples).
+            labels (list): The target frequency of each trial.
+            regularization (float): Ridge added to the diagonal of the trial covariance, relative to its mean,
+                so flat or linearly dependent channels (e.g. a disconnected electrode) keep it positive definite.
+        """
+        epochs = np.asarray(epochs, dtype=float)[:, :, :self.n_samples]
+        epochs = epochs - epochs.mean(axis=-1, keepdims=True)
+        labels = np.asarray(labels)
+        n_channels = epochs.shape[1]
+        self.spatial_filters = np.zeros((len(self.frequencies), n_channels))
+        self.templates = np.zeros((len(self.frequencies), n_channels, epochs.shape[2]))
+        for target, freq in enumerate(self.frequencies):
+            trials = epochs[labels == freq]
+            if len(trials) < 2:
+                raise ValueError(f"TRCA needs at least two calibration trials for {freq} Hz")
+            trial_sum = trials.sum(axis=0)
+            Q = np.einsum('tcs,tds->cd', trials, trials)
+            S = trial_sum @ trial_sum.T - Q  # Sum of cross-covariances between every pair of different trials
+            Q += (regularization * np.trace(Q) / n_channels + np.finfo(float).tiny) * np.eye(n_channels)
+            _, eigenvectors = eigh(S, Q)
+            self.spatial_filters[target] = eigenvectors[:, -1]
+            self.templates[target] = trials.mean(axis=0)
+        self._projected_templates = self._project_templates(self.templates.shape[2])
+        return self
+
+    def _project_templates(self, n_samples):
+        """
+        Returns the spatially filtered templates, centred and scaled to unit norm, for windows of n_samples.
+        """
+        templates = self.templates[:, :, :n_samples]
+        if self.ensemble:
+            projected = np.einsum('fc,kcs->kfs', self.spatial_filters, templates).reshape(len(templates), -1)
+        else:
+            projected = np.einsum('kc,kcs->ks', self.spatial_filters, templates)
+        return _normalize_rows(projected)
+
+    def score(self, eeg_data):
+        """
+        Returns the correlation between the spatially filtered window and every target's template,
+        in self.frequencies order. Windows up to the calibration length are supported.
+        """
+        if self.templates is None:
+            raise ValueError("TRCA must be fitted before use")
+        n_samples = eeg_data.shape[1]
+        if n_samples > self.templates.shape[2]:
+            raise ValueError("EEG data is longer than the calibration trials")
+        templates = self._projected_templates if n_samples == self.templates.shape[2] else self._project_templates(n_samples)
+        eeg_data = eeg_data - eeg_data.mean(axis=1, keepdims=True)
+        projected = self.spatial_filters @ eeg_data  # (n_filters, n_samples)
+        if self.ensemble:
+            return templates @ _normalize_rows(projected.ravel())
+        return np.einsum('ks,ks->k', templates, _normalize_rows(projected))
+
+    def trca_analysis(self, eeg_data):
+        return _best_target(self.frequencies, self.score(eeg_data))
+
+    def save(self, path):
+        """
+        Saves the parameters, spatial filters and templates of the classifier to one bundle.
+        """
+        params = bundle_params(frequencies=self.frequencies, sampling_rate=self.sampling_rate, n_samples=self.n_samples,
+                                ensemble=self.ensemble)
+        arrays = {}
+        if self.templates is not None:
+            arrays = {'spatial_filters': self.spatial_filters, 'templates': self.templates}
+        save_bundle(path, type(self).__name__, params, arrays)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Loads a classifier saved with save(), fitted if it was saved fitted.
+
+        Args:
+            path (str): The path of the bundle.
+            mmap (bool): Whether to memory-map the large arrays (e.g. the templates) instead of reading them.
+        """
+        _, params, arrays = load_bundle(path, cls.__name__, mmap)
+        classifier = cls(**params)
+        if 'templates' in arrays:
+            classifier.spatial_filters = arrays['spatial_filters']
+            classifier.templates = arrays['templates']
+            classifier._projected_templates = classifier._project_templates(classifier.templates.shape[2])
+        return classifier
 
 
     
@@ -1,5 +1,124 @@
+import threading
+import numpy as np
+import time
 import brainflow
-from brainflow.board_shim import BoardShim, BrainFlowInputParams, BrainFlowError
+from brainflow.board_shim import BoardShim, BrainFlowInputParams, BrainFlowError, BoardIds
+from .recorder import SESSION_EXTENSION, load_session
+
+class RingBuffer:
+    """
+    A preallocated circular buffer for multichannel streaming data.
+
+    Every sample is written twice (at index i and i + capacity), so the latest N samples
+    are always contiguous in memory and can be handed out as a view without copying.
+
+    Attributes:
+        n_channels (int): The number of rows (channels) stored in the buffer.
+        capacity (int): The maximum number of samples held before the oldest are overwritten.
+        n_written (int): The total number of samples written since the buffer was created.
+    """
+
+    def __init__(self, n_channels, capacity, dtype=np.float64):
+        """
+        Initializes the RingBuffer with the given size.
+
+        Args:
+            n_channels (int): The number of rows (channels) to store.
+            capacity (int): The number of samples to keep.
+            dtype (np.dtype): The data type of the stored samples.
+        """
+        self.n_channels = n_channels
+        self.capacity = int(capacity)
+        self._data = np.zeros((n_channels, 2 * self.capacity), dtype=dtype)
+        self._head = 0  # Position (mod capacity) where the next sample is written
+        self.n_written = 0
+        self._lock = threading.Condition()
+
+    def write(self, chunk):
+        """
+        Appends a chunk of samples to the buffer, overwriting the oldest samples when full.
+
+        Args:
+            chunk (np.ndarray): The new samples, shape (n_channels, n_new_samples).
+        """
+        n_new = chunk.shape[1]
+        if n_new == 0:
+            return
+        if n_new > self.capacity:
+            chunk = chunk[:, -self.capacity:]
+        n = chunk.shape[1]
+        with self._lock:
+            head = self._head
+            first = min(n, self.capacity - head)
+            for offset in (0, self.capacity):
+                self._data[:, offset + head:offset + head + first] = chunk[:, :first]
+                self._data[:, offset:offset + n - first] = chunk[:, first:]
+            self._head = (head + n) % self.capacity
+            self.n_written += n_new
+            self._lock.notify_all()
+
+    def wait_for(self, n_total, timeout=None):
+        """
+        Blocks until at least n_total samples have been written since the buffer was created.
+
+        Args:
+            n_total (int): The total sample count to wait for.
+            timeout (float): The maximum time to wait in seconds, or None to wait indefinitely.
+
+        Returns:
+            bool: True if the sample count was reached, False if the wait timed out.
+        """
+        with self._lock:
+            return self._lock.wait_for(lambda: self.n_written >= n_total, timeout=timeout)
+
+    def latest(self, n_samples, copy=False):
+        """
+        Returns the latest samples held in the buffer.
+
+        The returned view stays valid until another (capacity - n_samples) samples have been written;
+        pass copy=True if the data needs to be kept for longer than that.
+
+        Args:
+            n_samples (int): The number of samples to return.
+            copy (bool): Whether to return a contiguous copy instead of a read-only view.
+
+        Returns:
+            np.ndarray: The latest samples, shape (n_channels, n_samples), or None if fewer samples are available.
+        """
+        with self._lock:
+            if n_samples > min(self.n_written, self.capacity):
+                return None
+            end = self._head + self.capacity
+            window = self._data[:, end - n_samples:end]
+            if copy:
+                return window.copy()
+        window = window.view()
+        window.flags.writeable = False
+        return window
+
+    def window(self, end, n_samples, copy=False):
+        """
+        Returns the samples in [end - n_samples, end), counted from the first sample ever written.
+
+        Args:
+            end (int): The absolute sample count at which the window ends (exclusive).
+            n_samples (int): The number of samples in the window.
+            copy (bool): Whether to return a contiguous copy instead of a read-only view.
+
+        Returns:
+            np.ndarray: The window, shape (n_channels, n_samples), or None if it is not (or no longer) held in the buffer.
+        """
+        with self._lock:
+            oldest = max(0, self.n_written - self.capacity)
+            if end > self.n_written or end - n_samples < oldest:
+                return None
+            stop = self._head + self.capacity - (self.n_written - end)
+            window = self._data[:, stop - n_samples:stop]
+            if copy:
+                return window.copy()
+        window = window.view()
+        window.flags.writeable = False
+        return window
 
 class BrainFlowBoardSetup:
     """
@@ -17,6 +136,9 @@ class BrainFlowBoardSetup:
         setup(): Prepares the session and starts the data stream from the BrainFlow board.
         stop(): Stops the data stream and releases the session of the BrainFlow board.
         get_board_data(): Retrieves the current data from the BrainFlow board.
+        start_acquisition(): Starts a background thread that moves EEG data from BrainFlow into a ring buffer.
+        stop_acquisition(): Stops the background acquisition thread.
+        get_latest_eeg(): Returns the latest EEG samples held in the ring buffer.
         show_params(): Prints the current parameters of the BrainFlowInputParams instance.
     """
 
@@ -35,6 +157,8 @@ class BrainFlowBoardSetup:
         self.params.serial_port = self.serial_port
         self.eeg_channels = BoardShim.get_eeg_channels(self.board_id)
         self.sampling_rate = BoardShim.get_sampling_rate(self.board_id)
+        self.timestamp_channel = BoardShim.get_timestamp_channel(self.board_id)
+        self.marker_channel = BoardShim.get_marker_channel(self.board_id)
         
         # Set additional parameters if provided
         for key, value in kwargs.items():
@@ -46,6 +170,14 @@ class BrainFlowBoardSetup:
         self.board = None
         self.session_prepared = False
         self.streaming = False
+        self.ring_buffer = None
+        self.filtered_buffer = None
+        self.timestamp_buffer = None
+        self.stream_filter = None
+        self._listeners = []
+        self._filtered_listeners = []
+        self._acquisition_thread = None
+        self._acquisition_stop = threading.Event()
 
     def setup(self):
         """
@@ -88,13 +220,165 @@ class BrainFlowBoardSetup:
             print("Board is not set up")
             return None
     
+    def start_acquisition(self, buffer_duration=30, poll_interval=0.02, stream_filter=None):
+        """
+        Starts a background thread that regularly pulls new samples out of BrainFlow's buffer
+        and appends the EEG rows to a preallocated ring buffer.
+
+        Once acquisition is running, BrainFlow's internal buffer is drained by the thread,
+        so data should be read with get_latest_eeg() instead of get_current_board_data().
+
+        Args:
+            buffer_duration (float): The number of seconds of EEG data to keep in the ring buffer.
+            poll_interval (float): The time in seconds to wait between pulls from BrainFlow.
+            stream_filter (StreamingFilter): If given, each new chunk is also filtered as it arrives and
+                kept in filtered_buffer, so filtered windows can be read without refiltering.
+        """
+        if not self.streaming:
+            print("Board is not set up")
+            return
+        if self._acquisition_thread is not None:
+            return
+        self._create_buffers(buffer_duration, stream_filter)
+        self._acquisition_stop.clear()
+        self._acquisition_thread = threading.Thread(target=self._acquire, args=(poll_interval,), daemon=True)
+        self._acquisition_thread.start()
+
+    def _create_buffers(self, buffer_duration, stream_filter):
+        """
+        Allocates the raw (and, with a stream filter, filtered) EEG ring buffers, and a ring buffer of the
+        BrainFlow timestamps of the same samples when the board has a timestamp channel.
+
+        Args:
+            buffer_duration (float): The number of seconds of EEG data to keep.
+            stream_filter (StreamingFilter): The filter applied to new chunks, or None.
+        """
+        capacity = int(buffer_duration * self.sampling_rate)
+        self.ring_buffer = RingBuffer(len(self.eeg_channels), capacity)
+        if stream_filter is None and self._filtered_listeners:
+            raise ValueError("Filtered listeners need a stream_filter")
+        self.stream_filter = stream_filter
+        if stream_filter is not None:
+            self.filtered_buffer = RingBuffer(len(self.eeg_channels), capacity)
+        if self.timestamp_channel is not None:
+            self.timestamp_buffer = RingBuffer(1, capacity)
+
+    def _acquire(self, poll_interval):
+        """
+        Acquisition loop run by the background thread.
+
+        Args:
+            poll_interval (float): The time in seconds to wait between pulls from BrainFlow.
+        """
+        while not self._acquisition_stop.is_set():
+            try:
+                data = self.get_board_data()
+            except BrainFlowError as e:
+                print(f"Error reading board data: {e}")
+                break
+            if data.shape[1] > 0:
+                self._handle_chunk(data)
+            self._acquisition_stop.wait(poll_interval)
+
+    def _handle_chunk(self, data):
+        """
+        Passes a newly acquired chunk (all board rows) to the listeners and appends its EEG rows to the ring buffer.
+
+        Args:
+            data (np.ndarray): The new samples, shape (n_rows, n_new_samples).
+        """
+        for listener in self._listeners:
+            listener(data)
+        eeg = data[self.eeg_channels]
+        if self.stream_filter is not None:
+            filtered = self.stream_filter.process(eeg)
+            for listener in self._filtered_listeners:
+                listener(filtered)
+            # Written before the raw buffer, whose sample count is what consumers wait on
+            self.filtered_buffer.write(filtered)
+        if self.timestamp_buffer is not None:
+            self.timestamp_buffer.write(data[self.timestamp_channel][None, :])
+        self.ring_buffer.write(eeg)
+
+    def add_listener(self, callback, filtered=False):
+        """
+        Registers a callback that receives every chunk of raw board data (all rows) pulled by the acquisition thread.
+
+        Callbacks run on the acquisition thread, so they should only hand the data off (e.g. to a queue)
+        or do work that costs O(1) per sample.
+
+        Args:
+            callback (callable): A function taking an np.ndarray of shape (n_rows, n_new_samples).
+            filtered (bool): If True, the callback instead receives the stream-filtered EEG rows of each chunk,
+                shape (n_eeg_channels, n_new_samples). Requires a stream_filter in start_acquisition().
+        """
+        if filtered:
+            self._filtered_listeners.append(callback)
+        else:
+            self._listeners.append(callback)
+
+    def wait_for_samples(self, n_total, timeout=None):
+        """
+        Blocks until the acquisition ring buffer has received at least n_total samples in total.
+
+        Args:
+            n_total (int): The total sample count to wait for.
+            timeout (float): The maximum time to wait in seconds, or None to wait indefinitely.
+
+        Returns:
+            bool: True if the sample count was reached, False if the wait timed out.
+        """
+        return self.ring_buffer.wait_for(n_total, timeout=timeout)
+
+    def stop_acquisition(self):
+        """
+        Stops the background acquisition thread. The ring buffer keeps the data acquired so far.
+        """
+        if self._acquisition_thread is not None:
+            self._acquisition_stop.set()
+            self._acquisition_thread.join()
+            self._acquisition_thread = None
+
+    def get_latest_eeg(self, n_samples, copy=False):
+        """
+        Returns the latest EEG samples from the ring buffer filled by the acquisition thread.
+
+        Args:
+            n_samples (int): The number of samples to return.
+            copy (bool): Whether to return a contiguous copy instead of a read-only view.
+
+        Returns:
+            np.ndarray: The EEG data, shape (n_eeg_channels, n_samples), or None if not enough data is available.
+        """
+        if self.ring_buffer is None:
+            print("Acquisition is not running")
+            return None
+        return self.ring_buffer.latest(n_samples, copy=copy)
+
+    def sample_timestamp(self, index):
+        """
+        Returns the BrainFlow timestamp of an acquired sample, e.g. to measure the latency from sample to decision.
+
+        Args:
+            index (int): The absolute index of the sample, counted from the first sample acquired.
+
+        Returns:
+            float: The UNIX timestamp in seconds of the sample, or None if the board has no timestamp channel
+                or the sample is not (or no longer) held in the buffer.
+        """
+        if self.timestamp_buffer is None:
+            return None
+        window = self.timestamp_buffer.window(index + 1, 1)
+        return None if window is None else float(window[0, 0])
+
     def stop(self):
         """
-        Stops the data stream and releases the session of the BrainFlow board.
+        Stops the acquisition thread and data stream, and releases the session of the BrainFlow board.
 
         This method stops the data stream and releases the session. If an error occurs,
         it prints the error message, unless the error is "BOARD_NOT_CREATED_ERROR:15 unable to stop streaming session".
         """
+        self.stop_acquisition()
         try:
             if self.board is not None:
                 if self.streaming:
@@ -131,3 +415,163 @@ class BrainFlowBoardSetup:
         and releases the session if the board is set up.
         """
         self.stop()
+
+
+class ReplayBoard(BrainFlowBoardSetup):
+    """
+    A stand-in for BrainFlowBoardSetup that streams a saved recording instead of a live board.
+
+    Samples are released either at the board's sampling rate (optionally sped up), or, with speed=None,
+    as fast as the consumer asks for them, which makes it possible to load-test the full pipeline
+    without a Cyton dongle.
+
+    Attributes:
+        data (np.ndarray): The recording, shape (n_rows, n_samples).
+        speed (float): The replay speed relative to real time, or None to replay as fast as possible.
+        chunk_size (int): The number of samples released per pull when replaying as fast as possible.
+        exhausted (bool): Whether every sample in the recording has been released.
+    """
+
+    def __init__(self, recording, board_id=BoardIds.CYTON_BOARD, speed=1.0, chunk_duration=0.04):
+        """
+        Initializes the ReplayBoard with a recording.
+
+        Args:
+            recording (str or np.ndarray): A path to a .npy/.csv/.rec file or an array of shape (n_rows, n_samples).
+                If the number of rows matches the board's full row layout, the board's EEG rows are used;
+                otherwise every row is treated as an EEG channel (e.g. sim_ssvep_data.npy).
+            board_id (int): The BrainFlow board the recording was made with (sets the sampling rate).
+            speed (float): The replay speed relative to real time, or None to replay as fast as possible.
+            chunk_duration (float): The duration in seconds of each chunk released when replaying as fast as possible.
+        """
+        super().__init__(board_id, serial_port='')
+        self.data = self._load(recording)
+        if self.data.shape[0] != BoardShim.get_num_rows(board_id):
+            self.eeg_channels = list(range(self.data.shape[0]))
+            self.timestamp_channel = None
+            self.marker_channel = None
+        self.speed = speed
+        self.chunk_size = max(1, int(chunk_duration * self.sampling_rate))
+        self._released = 0  # Samples that have "arrived" so far
+        self._consumed = 0  # Samples already handed out by get_board_data()
+        self._start_time = None
+
+    @staticmethod
+    def _load(recording):
+        """
+        Loads a recording from disk if a path is given.
+
+        Args:
+            recording (str or np.ndarray): A path to a .npy/.csv/.rec file or an array.
+
+        Returns:
+            np.ndarray: The recording, shape (n_rows, n_samples).
+        """
+        if isinstance(recording, np.ndarray):
+            return recording
+        if str(recording).endswith(SESSION_EXTENSION):
+            return load_session(recording).data
+        if str(recording).endswith('.csv'):
+            return np.loadtxt(recording, delimiter=',', ndmin=2)
+        return np.load(recording, mmap_mode='r')
+
+    @property
+    def exhausted(self):
+        """
+        Whether every sample in the recording has been released.
+        """
+        return self._released >= self.data.shape[1]
+
+    def setup(self):
+        """
+        Rewinds the recording and starts the replay clock.
+        """
+        self._released = 0
+        self._consumed = 0
+        self._start_time = time.perf_counter()
+        self.session_prepared = True
+        self.streaming = True
+        print(f"Replaying {self.data.shape[1] / self.sampling_rate:.1f} s of data at "
+              f"{'maximum' if self.speed is None else f'{self.speed}x'} speed")
+
+    def _release(self):
+        """
+        Advances the number of released samples according to the replay clock.
+        """
+        if self.speed is None:
+            target = self._released + self.chunk_size
+        else:
+            target = int((time.perf_counter() - self._start_time) * self.sampling_rate * self.speed)
+        self._released = min(max(self._released, target), self.data.shape[1])
+
+    def get_board_data(self):
+        """
+        Returns the samples released since the last call and removes them from the replay buffer.
+
+        Returns:
+            numpy.ndarray: The new samples, shape (n_rows, n_new_samples), or None if the replay is not running.
+        """
+        if not self.streaming:
+            print("Board is not set up")
+            return None
+        self._release()
+        data = np.array(self.data[:, self._consumed:self._released])
+        self._consumed = self._released
+        return data
+
+    def get_current_board_data(self, num_samples):
+        """
+        Returns the latest released samples without removing them.
+
+        Args:
+            num_samples (int): The maximum number of samples to return.
+
+        Returns:
+            numpy.ndarray: The latest samples, shape (n_rows, <= num_samples).
+        """
+        self._release()
+        return np.array(self.data[:, max(0, self._released - num_samples):self._released])
+
+    def start_acquisition(self, buffer_duration=30, poll_interval=0.02, stream_filter=None):
+        """
+        Starts filling the EEG ring buffer from the recording.
+
+        At a fixed replay speed a background thread is used, exactly as for a live board. When replaying
+        as fast as possible no thread is started; samples are pushed on demand by wait_for_samples().
+
+        Args:
+            buffer_duration (float): The number of seconds of EEG data to keep in the ring buffer.
+            poll_interval (float): The time in seconds to wait between pulls (fixed speed only).
+            stream_filter (StreamingFilter): If given, new chunks are also filtered into filtered_buffer.
+        """
+        if self.speed is not None:
+            super().start_acquisition(buffer_duration, poll_interval, stream_filter)
+        elif self.streaming:
+            self._create_buffers(buffer_duration, stream_filter)
+
+    def wait_for_samples(self, n_total, timeout=None):
+        """
+        Blocks until the ring buffer has received at least n_total samples in total.
+
+        Args:
+            n_total (int): The total sample count to wait for.
+            timeout (float): The maximum time to wait in seconds (fixed speed only).
+
+        Returns:
+            bool: True if the sample count was reached, False on timeout or at the end of the recording.
+        """
+        if self.speed is not None:
+            return super().wait_for_samples(n_total, timeout=timeout)
+        while self.ring_buffer.n_written < n_total and not self.exhausted:
+            self._handle_chunk(self.get_board_data())
+        return self.ring_buffer.n_written >= n_total
+
+    def stop(self):
+        """
+        Stops the acquisition thread and the replay.
+        """
+        self.stop_acquisition()
+        if self.streaming:
+            self.streaming = False
+            self.session_prepared = False
+            print("\nReplay stopped")
@@ -0,0 +1,290 @@
+import hashlib
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from scipy.signal import filtfilt
+from .evaluation import window_recording
+from .metrics import information_transfer_rate
+from .preprocessing import StreamingFilter
+from .ssvep_handler import FBCCA, fbcca_filter_bank, fbcca_subbands
+
+# The values main.py uses, for any parameter the grid leaves out
+DEFAULT_GRID = {
+    'harmonics': [5],
+    'segment_duration': [5.0],
+    'band': [(0.5, 30.0)],
+    'num_subbands': [5],
+}
+RANK_METRICS = ('itr', 'accuracy')
+
+
+def expand_grid(grid):
+    """
+    Returns every combination of the grid's parameter values, filling in DEFAULT_GRID for missing parameters.
+
+    Args:
+        grid (dict): Lists of values for 'harmonics' (the number of harmonics), 'segment_duration' (seconds),
+            'band' ((lowcut, highcut) of the stream filter in Hz) and 'num_subbands' (of the FBCCA filter bank).
+
+    Returns:
+        list: One dict of parameter values per configuration.
+    """
+    unknown = set(grid) - set(DEFAULT_GRID)
+    if unknown:
+        raise ValueError(f"Unknown sweep parameters {sorted(unknown)}, expected some of {list(DEFAULT_GRID)}")
+    grid = dict(DEFAULT_GRID, **grid)
+    return [dict(zip(grid, values)) for values in itertools.product(*grid.values())]
+
+
+def _digest(*parts):
+    """
+    Returns a short hash of JSON-serializable parts and arrays, used to name cached files.
+    """
+    digest = hashlib.sha1()
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            part = np.ascontiguousarray(part)
+            digest.update(f"{part.shape}{part.dtype.str}".encode())
+            digest.update(part.view(np.uint8).ravel())
+        else:
+            digest.update(json.dumps(part).encode())
+    return digest.hexdigest()[:16]
+
+
+def _cache_array(path, array):
+    """
+    Saves an array to the cache unless it is already there.
+    """
+    if not os.path.exists(path):
+        temporary = f"{path}.{os.getpid()}.tmp.npy"
+        np.save(temporary, array)
+        os.replace(temporary, path)  # Concurrent readers never see a partial file
+    return path
+
+
+def _band_filter(raw_path, band_path, sampling_rate, band):
+    """
+    Filters a cached raw recording with the online stream filter (causal, as main.py sees it) and caches the result.
+    """
+    if not os.path.exists(band_path):
+        raw = np.load(raw_path, mmap_mode='r')
+        stream_filter = StreamingFilter(raw.shape[0], sampling_rate, lowcut=band[0], highcut=band[1])
+        _cache_array(band_path, stream_filter.process(raw))
+    return band_path
+
+
+def _subband_decompose(band_path, subband_path, sampling_rate, num_subbands):
+    """
+    Splits a cached band-filtered recording through the FBCCA filter bank and caches the result,
+    shape (num_subbands, n_channels, n_samples). The subbands are written one at a time to bound the memory used.
+    """
+    if not os.path.exists(subband_path):
+        band_data = np.load(band_path, mmap_mode='r')
+        temporary = f"{subband_path}.{os.getpid()}.tmp.npy"
+        subbands = np.lib.format.open_memmap(temporary, mode='w+', dtype=np.float64, shape=(num_subbands,) + band_data.shape)
+        for i, (b, a) in enumerate(fbcca_filter_bank(sampling_rate, num_subbands)):
+            subbands[i] = filtfilt(b, a, band_data, axis=-1)
+        subbands.flush()
+        del subbands
+        os.replace(temporary, subband_path)
+    return subband_path
+
+
+def _config_fbcca(config, frequencies, sampling_rate, backend):
+    """
+    Returns the FBCCA classifier of one configuration and its window length in samples.
+    """
+    n_samples = int(config['segment_duration'] * sampling_rate)
+    fbcca = FBCCA(frequencies, np.arange(1, config['harmonics'] + 1), sampling_rate, n_samples,
+                  num_subbands=config['num_subbands'], backend=backend)
+    return fbcca, n_samples
+
+
+def _evaluate_config(config, frequencies, sampling_rate, hop_samples, backend, recordings, chunk_size):
+    """
+    Classifies every fully labelled window of the cached recordings with the FBCCA of one configuration.
+
+    Args:
+        recordings (list): The (band-filtered path, subband path, labels path) of each recording in the cache.
+
+    Returns:
+        tuple: The number of windows, the number classified correctly, and the band-filtered path of the first
+            recording at least one window long, to time the configuration on (None if no recording is).
+    """
+    fbcca, n_samples = _config_fbcca(config, frequencies, sampling_rate, backend)
+    n_windows, n_correct, timing_path = 0, 0, None
+    for band_path, subband_path, labels_path in recordings:
+        subbands = np.load(subband_path, mmap_mode='r')
+        if subbands.shape[-1] < n_samples:
+            continue
+        timing_path = timing_path or band_path
+        # Window all subbands at once by flattening them into channels (a view of the memory-mapped cache)
+        flat = subbands.reshape(-1, subbands.shape[-1])
+        indices, windows, window_labels = window_recording(flat, np.load(labels_path), n_samples, hop_samples)
+        for start in range(0, len(indices), chunk_size):
+            chunk = windows[indices[start:start + chunk_size]]
+            batch = chunk.reshape(len(chunk), len(subbands), -1, n_samples).swapaxes(0, 1)
+            predictions = fbcca.classify_filtered(batch)[0]
+            n_correct += int(np.sum(predictions == window_labels[start:start + chunk_size]))
+        n_windows += len(indices)
+    return n_windows, n_correct, timing_path
+
+
+def _time_config(config, frequencies, sampling_rate, backend, timing_path, n_timing):
+    """
+    Returns the median time in seconds the FBCCA of one configuration takes on one band-filtered window online
+    (filter bank included), or NaN without a recording to time it on.
+    """
+    if timing_path is None:
+        return float('nan')
+    fbcca, n_samples = _config_fbcca(config, frequencies, sampling_rate, backend)
+    window = np.array(np.load(timing_path, mmap_mode='r')[:, :n_samples])
+    timings = []
+    for _ in range(n_timing + 1):  # The first call warms up the filter design and reference caches
+        start = time.perf_counter()
+        fbcca.fbcca_analysis(window)
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings[1:]))
+
+
+class ParameterSweep:
+    """
+    Evaluates FBCCA over a grid of harmonics, window lengths, stream-filter bands and subband counts on labelled
+    recordings, and ranks the configurations by accuracy or ITR against their compute cost per window.
+
+    Preprocessing is cached on disk in stages, each keyed by the recording's content and the parameters it depends on:
+    the raw recording, the recording band-filtered with the online stream filter, and its FBCCA subband decomposition.
+    Configurations sharing a band (and subband count) reuse the same files, as do later sweeps over the same recordings.
+    Each stage and then the grid points run in parallel on a process pool; the workers read the cached arrays through
+    memory maps, so the recordings are never pickled. The cost of each configuration is timed afterwards in the
+    calling process, one configuration at a time, so it is not skewed by the other grid points running concurrently.
+
+    Unlike online FBCCA, which filters each window through the filter bank, the sweep decomposes whole recordings once,
+    so the windows are free of filter edge effects and accuracies are slightly optimistic. The reported cost is the
+    online one: FBCCA (filter bank included) on one band-filtered window.
+
+    Attributes:
+        frequencies (list): The target frequencies in Hz.
+        sampling_rate (int): The sampling rate of the recordings.
+        cache_dir (str): The directory holding the cached preprocessing.
+        hop_samples (int): The number of samples between the starts of consecutive windows.
+        n_workers (int): The number of worker processes (0 or 1 runs in the calling process).
+        backend (str): The CCA backend of the FBCCA classifiers.
+    """
+
+    def __init__(self, frequencies, sampling_rate, cache_dir, hop_duration=0.5, n_workers=None, backend='batched',
+                 chunk_size=256, n_timing=5):
+        """
+        Initializes the ParameterSweep.
+
+        Args:
+            frequencies (list): The target frequencies in Hz.
+            sampling_rate (int): The sampling rate of the recordings.
+            cache_dir (str): The directory holding the cached preprocessing (created if needed).
+            hop_duration (float): The time in seconds between the starts of consecutive windows.
+            n_workers (int): The number of worker processes. Defaults to the number of CPUs.
+            backend (str): The CCA backend of the FBCCA classifiers.
+            chunk_size (int): The maximum number of windows classified at once, which bounds the memory used.
+            n_timing (int): The number of timed FBCCA calls the cost per window is the median of.
+        """
+        self.frequencies = frequencies
+        self.sampling_rate = sampling_rate
+        self.cache_dir = cache_dir
+        self.hop_samples = max(1, int(hop_duration * sampling_rate))
+        self.n_workers = n_workers if n_workers is not None else os.cpu_count()
+        self.backend = backend
+        self.chunk_size = chunk_size
+        self.n_timing = n_timing
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, stage, *parts):
+        return os.path.join(self.cache_dir, f"{stage}-{_digest(*parts)}.npy")
+
+    def _map(self, pool, function, tasks):
+        """
+        Runs function(*task) for every task, on the pool if there is one, and returns the results in order.
+        """
+        if pool is None:
+            return [function(*task) for task in tasks]
+        futures = [pool.submit(function, *task) for task in tasks]
+        return [future.result() for future in futures]
+
+    def run(self, grid, recordings, inter_trial_interval=0.0, rank_by='itr'):
+        """
+        Evaluates every configuration of the grid on the recordings.
+
+        Args:
+            grid (dict): Lists of parameter values, see expand_grid().
+            recordings (list): The (raw EEG, shape (n_channels, n_samples), per-sample labels with NaN where there is
+                no target) pair of each recording.
+            inter_trial_interval (float): Time in seconds between selections added to the window length for the ITR.
+            rank_by (str): 'itr' or 'accuracy'.
+
+        Returns:
+            list: One dict per configuration, best first: its parameters, the number of windows, the accuracy,
+                the ITR (bits/min), the cost per window in ms, and whether it is on the Pareto front of rank_by
+                against cost (no other configuration is at least as good on both and better on one). Configurations
+                without any window have NaN accuracy, ITR and cost, and are never on the front.
+        """
+        if rank_by not in RANK_METRICS:
+            raise ValueError(f"Unknown ranking metric '{rank_by}', expected one of {RANK_METRICS}")
+        configs = expand_grid(grid)
+        cached = []
+        for data, labels in recordings:
+            data = np.asarray(data, dtype=np.float64)
+            labels = np.asarray(labels, dtype=float)
+            raw_digest = _digest(data)
+            cached.append((raw_digest, _cache_array(self._path('raw', raw_digest), data),
+                           _cache_array(self._path('labels', labels), labels)))
+
+        def band_path(raw_digest, band):
+            return self._path('band', raw_digest, self.sampling_rate, list(band))
+
+        def subband_path(raw_digest, band, num_subbands):
+            # Keyed on the subband edges so a cache written with another filter bank layout is never reused
+            return self._path('subbands', raw_digest, self.sampling_rate, list(band),
+                              [list(edges) for edges in fbcca_subbands(self.sampling_rate, num_subbands)])
+
+        bands = sorted({tuple(config['band']) for config in configs})
+        decompositions = sorted({(tuple(config['band']), config['num_subbands']) for config in configs})
+        pool = ProcessPoolExecutor(max_workers=self.n_workers) if self.n_workers > 1 else None
+        try:
+            self._map(pool, _band_filter, [
+                (raw_path, band_path(raw_digest, band), self.sampling_rate, band)
+                for raw_digest, raw_path, _ in cached for band in bands
+                if not os.path.exists(band_path(raw_digest, band))])
+            self._map(pool, _subband_decompose, [
+                (band_path(raw_digest, band), subband_path(raw_digest, band, num_subbands), self.sampling_rate, num_subbands)
+                for raw_digest, _, _ in cached for band, num_subbands in decompositions
+                if not os.path.exists(subband_path(raw_digest, band, num_subbands))])
+            outcomes = self._map(pool, _evaluate_config, [
+                (config, self.frequencies, self.sampling_rate, self.hop_samples, self.backend,
+                 [(band_path(raw_digest, config['band']), subband_path(raw_digest, config['band'], config['num_subbands']),
+                   labels_path) for raw_digest, _, labels_path in cached],
+                 self.chunk_size)
+                for config in configs])
+        finally:
+            if pool is not None:
+                pool.shutdown(wait=True)
+        # Timed one configuration at a time once the pool is idle, so the cost does not depend on the machine load
+        costs = [_time_config(config, self.frequencies, self.sampling_rate, self.backend, timing_path, self.n_timing)
+                 for config, (_, _, timing_path) in zip(configs, outcomes)]
+
+        results = []
+        for config, (n_windows, n_correct, _), cost in zip(configs, outcomes, costs):
+            accuracy = n_correct / n_windows if n_windows else float('nan')
+            results.append(dict(config, n_windows=n_windows, accuracy=accuracy, cost_ms=1000 * cost,
+                                itr=information_transfer_rate(len(self.frequencies), accuracy,
+                                                              config['segment_duration'] + inter_trial_interval)))
+        scored = [result for result in results if not np.isnan(result[rank_by]) and not np.isnan(result['cost_ms'])]
+        for result in results:
+            result['pareto'] = False
+        for result in scored:
+            result['pareto'] = not any(
+                other[rank_by] >= result[rank_by] and other['cost_ms'] <= result['cost_ms']
+                and (other[rank_by] > result[rank_by] or other['cost_ms'] < result['cost_ms'])
+                for other in scored)
+        return sorted(results, key=lambda result: (-np.nan_to_num(result[rank_by], nan=-np.inf), result['cost_ms']))
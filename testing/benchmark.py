@@ -0,0 +1,198 @@
+"""
+Benchmarks the signal-processing hot paths and compares benchmark runs.
+
+Usage (from the repository root):
+    python testing/benchmark.py run [--quick] [--output benchmark.json]
+    python testing/benchmark.py compare baseline.json current.json [--tolerance 1.2]
+
+`run` times PreProcess.filter_data, ClassifySSVEP.cca_analysis (stacked and unstacked harmonics), FBCCA.fbcca_analysis,
+SSVEP_SNR.calculate_snr and ClassifySSVEP.check_snr per window over a grid of channel counts, window lengths, numbers
+of targets, harmonics and subbands, and also records the accuracy of the classifiers on synthetic SSVEP trials.
+`compare` lists every benchmark whose median latency grew by more than the tolerance and exits with status 1 if any did.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import sys
+import time
+import timeit
+import numpy as np
+from brainflow.board_shim import BoardIds
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))  # Run as a script from anywhere
+from modules.preprocessing import PreProcess
+from modules.stream_data import ReplayBoard
+from modules.ssvep_handler import ClassifySSVEP, FBCCA, SSVEP_SNR
+
+SAMPLING_RATE = 250  # Cyton
+FULL_GRID = {
+    'channels': [8, 16],
+    'window': [1.0, 2.0, 4.0],
+    'targets': [4, 12, 40],
+    'harmonics': [3, 5],
+    'subbands': [3, 5],
+}
+QUICK_GRID = {
+    'channels': [8],
+    'window': [2.0],
+    'targets': [4, 40],
+    'harmonics': [3],
+    'subbands': [5],
+}
+
+
+def target_frequencies(n_targets):
+    """
+    Returns n_targets stimulus frequencies spread over 8-15.8 Hz, like a typical SSVEP speller layout.
+    """
+    return list(np.round(np.linspace(8.0, 15.8, n_targets), 2))
+
+
+def synthetic_trials(frequencies, n_channels, n_samples, trials_per_target=2, seed=0):
+    """
+    Returns noisy synthetic SSVEP trials (a sinusoid and its 2nd harmonic at a random phase on every channel) and their labels.
+    """
+    rng = np.random.default_rng(seed)
+    time_axis = np.arange(n_samples) / SAMPLING_RATE
+    trials, labels = [], []
+    for freq in frequencies:
+        for _ in range(trials_per_target):
+            phase = rng.uniform(0, 2 * np.pi)
+            gains = rng.uniform(0.5, 1.0, (n_channels, 1))
+            signal = np.sin(2 * np.pi * freq * time_axis + phase) + 0.5 * np.sin(4 * np.pi * freq * time_axis + 2 * phase)
+            trials.append(gains * signal + rng.normal(0, 2.0, (n_channels, n_samples)))
+            labels.append(freq)
+    return np.array(trials), labels
+
+
+def time_call(function, repeat):
+    """
+    Times function() and returns the median and minimum time per call in milliseconds.
+    """
+    function()  # Warm up caches (filter designs, reference bases) before timing
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    times = np.array(timer.repeat(repeat=repeat, number=number)) / number
+    return float(np.median(times) * 1000), float(times.min() * 1000)
+
+
+def accuracy(analysis, trials, labels):
+    """
+    Returns the fraction of trials for which analysis(trial) detects the labelled frequency.
+    """
+    return float(np.mean([analysis(trial)[0] == label for trial, label in zip(trials, labels)]))
+
+
+def snr_analysis(classifier):
+    """
+    Returns an analysis function that detects the target with the highest check_snr SNR.
+    """
+    def analysis(eeg_data):
+        snr = classifier.check_snr(eeg_data)
+        best = max(snr, key=snr.get)
+        return best, snr[best]
+    return analysis
+
+
+def benchmark_cases(grid, backend):
+    """
+    Yields (benchmark name, parameters, function to time, accuracy or None) for every case of the grid.
+    """
+    for channels, window in itertools.product(grid['channels'], grid['window']):
+        n_samples = int(window * SAMPLING_RATE)
+        eeg = np.random.default_rng(1).normal(size=(channels, n_samples))
+        segmenter = PreProcess(ReplayBoard(eeg, BoardIds.CYTON_BOARD), segment_duration=window)
+        params = {'channels': channels, 'window': window}
+        yield 'filter_data', params, lambda: segmenter.filter_data(eeg), None
+        yield 'calculate_snr', params, lambda: SSVEP_SNR(eeg, SAMPLING_RATE).calculate_snr(), None
+
+        for n_targets, n_harmonics in itertools.product(grid['targets'], grid['harmonics']):
+            frequencies = target_frequencies(n_targets)
+            harmonics = np.arange(1, n_harmonics + 1)
+            trials, labels = synthetic_trials(frequencies, channels, n_samples)
+            window_data = trials[0]
+            params = {'channels': channels, 'window': window, 'targets': n_targets, 'harmonics': n_harmonics}
+            for stacked in (True, False):
+                classifier = ClassifySSVEP(frequencies, harmonics, SAMPLING_RATE, n_samples, stack_harmonics=stacked, backend=backend)
+                name = 'cca_analysis_stacked' if stacked else 'cca_analysis_unstacked'
+                yield name, params, lambda c=classifier: c.cca_analysis(window_data), accuracy(classifier.cca_analysis, trials, labels)
+            yield 'check_snr', params, lambda c=classifier: c.check_snr(window_data), accuracy(snr_analysis(classifier), trials, labels)
+            for n_subbands in grid['subbands']:
+                fbcca = FBCCA(frequencies, harmonics, SAMPLING_RATE, n_samples, num_subbands=n_subbands, backend=backend)
+                yield 'fbcca_analysis', dict(params, subbands=n_subbands), lambda f=fbcca: f.fbcca_analysis(window_data), \
+                    accuracy(fbcca.fbcca_analysis, trials, labels)
+
+
+def run(args):
+    grid = QUICK_GRID if args.quick else FULL_GRID
+    results = []
+    for name, params, function, case_accuracy in benchmark_cases(grid, args.backend):
+        median_ms, min_ms = time_call(function, args.repeat)
+        result = {'benchmark': name, 'params': params, 'median_ms': median_ms, 'min_ms': min_ms}
+        if case_accuracy is not None:
+            result['accuracy'] = case_accuracy
+        results.append(result)
+        extra = f"  accuracy {case_accuracy:.2f}" if case_accuracy is not None else ""
+        print(f"{name:24s} {json.dumps(params):80s} {median_ms:9.3f} ms{extra}")
+    meta = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'backend': args.backend,
+        'grid': grid,
+    }
+    with open(args.output, 'w') as f:
+        json.dump({'meta': meta, 'results': results}, f, indent=2)
+    print(f"Saved {len(results)} results to {args.output}")
+
+
+def compare(args):
+    def load(filename):
+        with open(filename) as f:
+            results = json.load(f)['results']
+        return {(result['benchmark'], json.dumps(result['params'], sort_keys=True)): result for result in results}
+
+    baseline, current = load(args.baseline), load(args.current)
+    regressions = 0
+    for key in sorted(baseline.keys() & current.keys()):
+        ratio = current[key]['median_ms'] / baseline[key]['median_ms']
+        flag = ''
+        if ratio > args.tolerance:
+            flag = '  REGRESSION'
+            regressions += 1
+        elif ratio < 1 / args.tolerance:
+            flag = '  faster'
+        print(f"{key[0]:24s} {key[1]:80s} {baseline[key]['median_ms']:9.3f} -> {current[key]['median_ms']:9.3f} ms "
+              f"(x{ratio:.2f}){flag}")
+    missing = len(baseline.keys() - current.keys())
+    if missing:
+        print(f"{missing} baseline benchmark(s) missing from {args.current}")
+    print(f"{regressions} regression(s) over x{args.tolerance}")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run', help='Run the benchmarks and save the results as JSON')
+    run_parser.add_argument('--quick', action='store_true', help='Run a small grid (a few seconds)')
+    run_parser.add_argument('--output', default='benchmark.json', help='The JSON file the results are written to')
+    run_parser.add_argument('--backend', default='batched', choices=['batched', 'qr', 'mvlearn'], help='The CCA backend')
+    run_parser.add_argument('--repeat', type=int, default=5, help='The number of timing repeats per benchmark')
+    compare_parser = commands.add_parser('compare', help='Compare two benchmark result files')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--tolerance', type=float, default=1.2, help='Slowdown ratio reported as a regression')
+    args = parser.parse_args()
+    if args.command == 'run':
+        run(args)
+    else:
+        sys.exit(compare(args))
+
+
+if __name__ == "__main__":
+    main()
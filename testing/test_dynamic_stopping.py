@@ -0,0 +1,64 @@
+import os
+import numpy as np
+import pytest
+
+from modules.ssvep_handler import ClassifySSVEP
+from modules.dynamic_stopping import DynamicStoppingDecoder
+from modules.metrics import information_transfer_rate
+
+SIM_DATA = os.path.join(os.path.dirname(__file__), '..', 'tinkering', 'sim_ssvep_data.npy')
+FREQUENCIES = [9.25, 11.25, 13.25, 15.25]
+SAMPLING_RATE = 250
+
+
+def sim_trials():
+    data = np.load(SIM_DATA)
+    for target_index, freq in enumerate(FREQUENCIES):
+        start = target_index * 10 * SAMPLING_RATE
+        yield data[:, start:start + 4 * SAMPLING_RATE], freq
+
+
+def test_information_transfer_rate():
+    assert information_transfer_rate(4, 1.0, 1.0) == pytest.approx(120.0)
+    assert information_transfer_rate(4, 0.25, 1.0) == 0.0
+    assert information_transfer_rate(4, 0.9, 2.0) == pytest.approx(30 * (2 + 0.9 * np.log2(0.9) + 0.1 * np.log2(0.1 / 3)))
+
+
+def test_decide_stops_early_on_clear_trials():
+    classifier = ClassifySSVEP(FREQUENCIES, [1, 2], SAMPLING_RATE, 4 * SAMPLING_RATE)
+    decoder = DynamicStoppingDecoder(classifier, SAMPLING_RATE, max_duration=4.0, threshold=0.2)
+    for trial, freq in sim_trials():
+        detected_freq, _, decision_time = decoder.decide(trial, label=freq)
+        assert detected_freq == freq
+        assert decision_time < 4.0
+
+    stats = decoder.summary()
+    assert stats['accuracy'] == 1.0 and stats['n_decisions'] == 4
+    assert stats['itr'] == pytest.approx(information_transfer_rate(4, 1.0, stats['mean_decision_time']))
+
+
+def test_update_matches_decide_and_falls_back_to_max_duration():
+    classifier = ClassifySSVEP(FREQUENCIES, [1, 2], SAMPLING_RATE, 4 * SAMPLING_RATE)
+    online = DynamicStoppingDecoder(classifier, SAMPLING_RATE, max_duration=2.0, criterion='probability', threshold=0.9)
+    offline = DynamicStoppingDecoder(classifier, SAMPLING_RATE, max_duration=2.0, criterion='probability', threshold=0.9)
+    trial, freq = next(sim_trials())
+
+    decision = None
+    for end in range(50, trial.shape[1], 50):
+        decision = online.update(trial[:, :end])
+        if decision is not None:
+            break
+    assert decision == offline.decide(trial)
+
+    never_confident = DynamicStoppingDecoder(classifier, SAMPLING_RATE, max_duration=1.5, threshold=1.1)
+    assert never_confident.decide(trial)[2] == 1.5
+
+
+def test_decide_rejects_trials_shorter_than_the_first_checkpoint():
+    classifier = ClassifySSVEP(FREQUENCIES, [1, 2], SAMPLING_RATE, 4 * SAMPLING_RATE)
+    decoder = DynamicStoppingDecoder(classifier, SAMPLING_RATE, min_duration=0.5)
+    trial, _ = next(sim_trials())
+    with pytest.raises(ValueError):
+        decoder.decide(trial[:, :100])
+    assert decoder.decide(trial[:, :200])[2] == 0.5  # Shorter than max_duration: decided at the last checkpoint
+    assert decoder.decision_times == [0.5]
@@ -0,0 +1,45 @@
+import os
+import numpy as np
+import pytest
+
+from modules.ensemble import ClassifierEnsemble
+from modules.ssvep_handler import ClassifySSVEP, FBCCA
+
+SIM_DATA = os.path.join(os.path.dirname(__file__), '..', 'tinkering', 'sim_ssvep_data.npy')
+FREQUENCIES = [9.25, 11.25, 13.25, 15.25]
+SAMPLING_RATE = 250
+N_SAMPLES = 500
+
+
+@pytest.mark.parametrize('executor', ['thread', 'process'])
+def test_ensemble_matches_serial_results(executor):
+    window = np.load(SIM_DATA)[:, SAMPLING_RATE:SAMPLING_RATE + N_SAMPLES]
+    classifier = ClassifySSVEP(FREQUENCIES, [1, 2, 3], SAMPLING_RATE, N_SAMPLES, stack_harmonics=False)
+    classifier_stacked = ClassifySSVEP(FREQUENCIES, [1, 2, 3], SAMPLING_RATE, N_SAMPLES)
+    fbcca = FBCCA(FREQUENCIES, [1, 2, 3], SAMPLING_RATE, N_SAMPLES)
+    ensemble = ClassifierEnsemble(executor, fusion='vote')
+    ensemble.register('cca', classifier, 'cca_analysis')
+    ensemble.register('stacked', classifier_stacked, 'cca_analysis')
+    ensemble.register('fbcca', fbcca, 'fbcca_analysis')
+    ensemble.register('snr', classifier_stacked, 'check_snr', vote=False)
+    try:
+        for _ in range(2):  # The second run reuses the pool and the shared memory
+            results = ensemble.run(window)
+    finally:
+        ensemble.close()
+    assert results['cca'] == pytest.approx(classifier.cca_analysis(window))
+    assert results['stacked'] == pytest.approx(classifier_stacked.cca_analysis(window))
+    assert results['fbcca'] == pytest.approx(fbcca.fbcca_analysis(window))
+    assert results['snr'] == pytest.approx(classifier_stacked.check_snr(window))
+    assert results['fused'] == (9.25, 3)
+    assert ensemble.voters == ('cca', 'stacked', 'fbcca')
+    assert set(ensemble.last_timings) == {'cca', 'stacked', 'fbcca', 'snr'}
+    assert all(ensemble.total_timings[name] >= ensemble.last_timings[name] > 0 for name in ensemble.last_timings)
+
+
+def test_vote_breaks_ties_by_registration_order():
+    ensemble = ClassifierEnsemble(fusion='vote')
+    for name in ('a', 'b', 'c', 'd'):
+        ensemble.register(name, None, 'cca_analysis')
+    assert ensemble.vote({'a': (11.25, 0.3), 'b': (9.25, 0.5), 'c': (9.25, 0.4), 'd': (11.25, 0.2)}) == (11.25, 2)
+    assert ensemble.vote({'a': (None, 0), 'b': (None, 0), 'c': (None, 0), 'd': (None, 0)}) == (None, 0)
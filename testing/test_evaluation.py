@@ -0,0 +1,45 @@
+import os
+import numpy as np
+
+from modules.evaluation import Evaluator, window_recording
+from modules.ssvep_handler import ClassifySSVEP, FBCCA
+
+SIM_DATA = os.path.join(os.path.dirname(__file__), '..', 'tinkering', 'sim_ssvep_data.npy')
+FREQUENCIES = [9.25, 11.25, 13.25, 15.25]  # Simulated target changes every 10 s in this order
+SAMPLING_RATE = 250
+
+
+def sim_recording():
+    data = np.load(SIM_DATA)[:, :4 * 10 * SAMPLING_RATE]
+    labels = np.repeat(FREQUENCIES, 10 * SAMPLING_RATE).astype(float)
+    labels[:SAMPLING_RATE] = np.nan  # Unlabelled rest at the start
+    return data, labels
+
+
+def test_window_recording_is_zero_copy_and_skips_mixed_windows():
+    data, labels = sim_recording()
+    indices, windows, window_labels = window_recording(data, labels, 500, 250)
+    assert np.shares_memory(windows, data)
+    assert windows.shape == (39, data.shape[0], 500)
+    np.testing.assert_array_equal(windows[3], data[:, 750:1250])
+    # Window 0 overlaps the rest, and the window straddling each target change is dropped
+    assert 0 not in indices and 9 not in indices and 10 in indices
+    np.testing.assert_array_equal(window_labels, labels[indices * 250])
+
+
+def test_process_pool_evaluation_matches_in_process():
+    data, labels = sim_recording()
+    classifiers = {'cca': ClassifySSVEP(FREQUENCIES, [1, 2, 3], SAMPLING_RATE, 500),
+                   'fbcca': FBCCA(FREQUENCIES, [1, 2, 3], SAMPLING_RATE, 500)}
+    with Evaluator(classifiers, SAMPLING_RATE, window_duration=2.0, hop_duration=0.5, n_workers=1) as evaluator:
+        serial = evaluator.evaluate(data, labels)
+    with Evaluator(classifiers, SAMPLING_RATE, window_duration=2.0, hop_duration=0.5, n_workers=2) as evaluator:
+        parallel = evaluator.evaluate(data, labels)
+        again = evaluator.evaluate(data[:, :2 * 10 * SAMPLING_RATE], labels[:2 * 10 * SAMPLING_RATE])  # Reuses the pool
+    for name in classifiers:
+        np.testing.assert_array_equal(parallel[name]['confusion'], serial[name]['confusion'])
+        assert parallel[name]['n_windows'] == serial[name]['n_windows'] == serial[name]['confusion'].sum()
+        assert parallel[name]['latency'] > 0
+    assert serial['cca']['accuracy'] == 1.0
+    assert serial['cca']['itr'] == 60.0  # log2(4) bits every 2 s
+    assert again['cca']['n_windows'] < serial['cca']['n_windows']
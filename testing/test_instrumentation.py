@@ -0,0 +1,69 @@
+import json
+import time
+import numpy as np
+from brainflow.board_shim import BoardIds, BoardShim
+
+from modules.instrumentation import LatencyHistogram, LatencyMonitor
+from modules.preprocessing import PreProcess
+from modules.stream_data import ReplayBoard
+
+
+def test_histogram_percentiles_are_within_one_bucket():
+    latencies = np.random.default_rng(0).lognormal(np.log(0.01), 1.0, 5000)
+    histogram = LatencyHistogram()
+    for latency in latencies:
+        histogram.add(latency)
+    assert histogram.count == len(latencies)
+    assert np.isclose(histogram.mean, latencies.mean())
+    assert histogram.minimum == latencies.min() and histogram.maximum == latencies.max()
+    bucket_ratio = 10 ** (1 / histogram.buckets_per_decade)
+    for percent in (50, 90, 99):
+        exact = np.percentile(latencies, percent)
+        assert exact / bucket_ratio <= histogram.percentile(percent) <= exact * bucket_ratio
+    assert np.isnan(LatencyHistogram().percentile(50))
+
+
+def test_monitor_times_stages_and_dumps_a_summary(tmp_path):
+    dump_file = tmp_path / 'latency.json'
+    monitor = LatencyMonitor(dump_file=str(dump_file), dump_interval=3600)
+    for _ in range(3):
+        with monitor.stage('get_segment'):
+            time.sleep(0.002)
+    assert monitor.timed('filter_data', np.negative)(np.ones(3)).tolist() == [-1, -1, -1]
+    monitor.record_decision(time.time() - 0.1)
+    monitor.record_decision(None)
+    summary = monitor.summary()
+    assert summary['get_segment']['count'] == 3 and summary['get_segment']['min_ms'] >= 2
+    assert summary['filter_data']['count'] == 1
+    assert summary['decision']['count'] == 1 and 100 <= summary['decision']['p50_ms'] < 200
+    monitor.dump()
+    with open(dump_file) as f:
+        assert json.load(f)['stages'].keys() == summary.keys()
+
+
+def test_disabled_monitor_is_a_no_op():
+    monitor = LatencyMonitor(enabled=False)
+    assert monitor.timed('filter_data', np.negative) is np.negative
+    with monitor.stage('get_segment'):
+        pass
+    monitor.record('cca', 0.01)
+    monitor.record_decision(time.time())
+    assert monitor.summary() == {}
+
+
+def test_board_reports_the_timestamp_of_the_newest_sample_in_each_window():
+    board_id = BoardIds.CYTON_BOARD
+    data = np.random.default_rng(0).normal(size=(BoardShim.get_num_rows(board_id), 2000))
+    data[BoardShim.get_timestamp_channel(board_id)] = 1.7e9 + np.arange(2000) / 250
+    board = ReplayBoard(data, board_id, speed=None)
+    board.setup()
+    board.start_acquisition(buffer_duration=4)
+    segmenter = PreProcess(board, segment_duration=1.0, hop_duration=0.5)
+    try:
+        segment = segmenter.get_next_segment()
+        assert segment is not None
+        end = segmenter.segment_end
+        assert board.sample_timestamp(end - 1) == data[BoardShim.get_timestamp_channel(board_id), end - 1]
+        assert board.sample_timestamp(board.ring_buffer.n_written) is None
+    finally:
+        board.stop()
@@ -0,0 +1,50 @@
+import os
+import numpy as np
+import pytest
+from brainflow.board_shim import BoardIds
+
+from modules.lock_in import LockInDetector
+from modules.preprocessing import StreamingFilter
+from modules.stream_data import ReplayBoard
+
+SIM_DATA = os.path.join(os.path.dirname(__file__), '..', 'tinkering', 'sim_ssvep_data.npy')
+FREQUENCIES = [9.25, 11.25, 13.25, 15.25]  # Simulated target changes every 10 s in this order
+SAMPLING_RATE = 250
+
+
+def test_lock_in_tracks_the_simulated_target_from_a_filtered_listener():
+    board = ReplayBoard(SIM_DATA, BoardIds.CYTON_BOARD, speed=None)
+    detector = LockInDetector(FREQUENCIES, [1, 2], SAMPLING_RATE, len(board.eeg_channels))
+    board.add_listener(detector.process, filtered=True)
+    board.setup()
+    board.start_acquisition(buffer_duration=10, stream_filter=StreamingFilter(len(board.eeg_channels), SAMPLING_RATE, 0.5, 30.0))
+    try:
+        for target_index, freq in enumerate(FREQUENCIES):
+            board.wait_for_samples((target_index * 10 + 8) * SAMPLING_RATE)
+            assert detector.detect(threshold=6.0)[0] == freq
+    finally:
+        board.stop()
+    assert detector.amplitude().shape == (len(board.eeg_channels), len(FREQUENCIES), 2)
+
+
+def test_lock_in_is_independent_of_chunking():
+    data = np.load(SIM_DATA)[:, :2000]
+    whole = LockInDetector(FREQUENCIES, [1, 2, 3], SAMPLING_RATE, data.shape[0])
+    whole.process(data)
+    chunked = LockInDetector(FREQUENCIES, [1, 2, 3], SAMPLING_RATE, data.shape[0])
+    for start in range(0, data.shape[1], 7):
+        chunked.process(data[:, start:start + 7])
+    np.testing.assert_allclose(chunked.snr(), whole.snr())
+    np.testing.assert_allclose(chunked.amplitude(), whole.amplitude())
+    chunked.reset()
+    assert chunked.detect(threshold=-np.inf)[0] is None
+    assert not chunked.amplitude().any()
+
+
+def test_filtered_listeners_need_a_stream_filter():
+    board = ReplayBoard(SIM_DATA, BoardIds.CYTON_BOARD, speed=None)
+    board.add_listener(lambda chunk: None, filtered=True)
+    board.setup()
+    with pytest.raises(ValueError):
+        board.start_acquisition(buffer_duration=10)
+    board.stop()
@@ -0,0 +1,112 @@
+import os
+import numpy as np
+import pytest
+
+from modules.persistence import bundle_matches, load_bundle, save_bundle, CLASSIFIER_VERSION
+from modules import references
+from modules.references import get_reference_bank
+from modules.ssvep_handler import ClassifySSVEP, FBCCA, TRCA, ExtendedCCA
+
+SIM_DATA = os.path.join(os.path.dirname(__file__), '..', 'tinkering', 'sim_ssvep_data.npy')
+FREQUENCIES = [9.25, 11.25, 13.25, 15.25]  # Simulated target changes every 10 s in this order
+SAMPLING_RATE = 250
+N_SAMPLES = 500
+
+
+def sim_epochs():
+    # Trials start 4 s apart, a whole number of cycles of every target, so they are phase-locked
+    data = np.load(SIM_DATA)
+    epochs, labels = [], []
+    for target_index, freq in enumerate(FREQUENCIES):
+        for trial in range(2):
+            start = target_index * 10 * SAMPLING_RATE + trial * 4 * SAMPLING_RATE
+            epochs.append(data[:, start:start + N_SAMPLES])
+            labels.append(freq)
+    return np.array(epochs), labels
+
+
+def test_bundle_round_trip_memory_maps_large_arrays(tmp_path):
+    path = str(tmp_path / 'model.clf')
+    large, small = np.random.default_rng(0).normal(size=(64, 1024)), np.arange(5, dtype=np.int32)
+    save_bundle(path, 'Model', {'n_samples': 500}, {'large': large, 'small': small, 'empty': np.zeros((0, 3))})
+    kind, params, arrays = load_bundle(path, 'Model')
+    assert kind == 'Model' and params == {'n_samples': 500}
+    assert isinstance(arrays['large'], np.memmap) and not arrays['large'].flags.writeable
+    assert arrays['large'].ctypes.data % 64 == 0
+    assert not isinstance(arrays['small'], np.memmap)
+    np.testing.assert_array_equal(arrays['large'], large)
+    np.testing.assert_array_equal(arrays['small'], small)
+    assert arrays['empty'].shape == (0, 3)
+    assert not isinstance(load_bundle(path, mmap=False)[2]['large'], np.memmap)
+    with pytest.raises(ValueError):
+        load_bundle(path, 'FBCCA')
+
+
+def test_bundle_rejects_newer_versions_and_other_files(tmp_path):
+    path = str(tmp_path / 'model.clf')
+    save_bundle(path, 'Model', {}, {})
+    with open(path, 'rb') as f:
+        content = f.read()
+    with open(path, 'wb') as f:
+        f.write(content.replace(f'"version": {CLASSIFIER_VERSION}'.encode(), f'"version": {CLASSIFIER_VERSION + 1}'.encode()))
+    with pytest.raises(ValueError):
+        load_bundle(path)
+    np.save(tmp_path / 'array.npy', np.zeros(3))
+    with pytest.raises(ValueError):
+        load_bundle(str(tmp_path / 'array.npy'))
+
+
+@pytest.mark.parametrize('make', [
+    lambda: ClassifySSVEP(FREQUENCIES, np.arange(1, 4), SAMPLING_RATE, N_SAMPLES),
+    lambda: ClassifySSVEP(FREQUENCIES, np.arange(1, 4), SAMPLING_RATE, N_SAMPLES, stack_harmonics=False, backend='qr'),
+    lambda: FBCCA(FREQUENCIES, np.arange(1, 4), SAMPLING_RATE, N_SAMPLES, num_subbands=3),
+    lambda: TRCA(FREQUENCIES, SAMPLING_RATE, N_SAMPLES).fit(*sim_epochs()),
+    lambda: ExtendedCCA(FREQUENCIES, np.arange(1, 4), SAMPLING_RATE, N_SAMPLES).fit(*sim_epochs()),
+])
+def test_loaded_classifiers_score_bit_identically(tmp_path, make):
+    classifier = make()
+    path = str(tmp_path / 'classifier.clf')
+    classifier.save(path)
+    loaded = type(classifier).load(path)
+    windows = np.load(SIM_DATA)[:, :10 * N_SAMPLES].reshape(-1, 10, N_SAMPLES).transpose(1, 0, 2)
+    for window in windows:
+        np.testing.assert_array_equal(loaded.score(window), classifier.score(window))
+
+
+def test_loading_reuses_saved_references_and_filters(tmp_path, monkeypatch):
+    classifier = FBCCA(FREQUENCIES, [1, 2], SAMPLING_RATE, 123)
+    path = str(tmp_path / 'fbcca.clf')
+    classifier.save(path)
+    bank = get_reference_bank(FREQUENCIES, [1, 2], SAMPLING_RATE)
+    bank.__init__(FREQUENCIES, [1, 2], SAMPLING_RATE)  # Empty the shared bank
+
+    def recompute(*args):
+        raise AssertionError("references were recomputed")
+    monkeypatch.setattr(references, 'orthonormal_basis', recompute)
+    monkeypatch.setattr(bank, '_grow', recompute)
+    monkeypatch.setattr(FBCCA, '_generate_filters', recompute)
+    loaded = FBCCA.load(path)
+    np.testing.assert_array_equal(loaded.reference_basis_stack, classifier.reference_basis_stack)
+    assert [(b.tolist(), a.tolist()) for b, a in loaded.filters] == [(b.tolist(), a.tolist()) for b, a in classifier.filters]
+
+
+def test_bundles_match_only_the_same_constructor_parameters(tmp_path):
+    path = str(tmp_path / 'fbcca.clf')
+    FBCCA(FREQUENCIES, np.arange(1, 4), SAMPLING_RATE, N_SAMPLES, num_subbands=3).save(path)
+    assert bundle_matches(path, FBCCA, FREQUENCIES, [1, 2, 3], SAMPLING_RATE, N_SAMPLES, num_subbands=3)
+    assert not bundle_matches(path, FBCCA, FREQUENCIES, [1, 2, 3], SAMPLING_RATE, N_SAMPLES)  # Default num_subbands=5
+    assert not bundle_matches(path, FBCCA, FREQUENCIES, [1, 2, 3], 500, N_SAMPLES, num_subbands=3)
+    assert not bundle_matches(path, FBCCA, FREQUENCIES, [1, 2, 3], SAMPLING_RATE, N_SAMPLES, 3, backend='qr')
+    assert not bundle_matches(path, ClassifySSVEP, FREQUENCIES, [1, 2, 3], SAMPLING_RATE, N_SAMPLES)
+
+
+def test_preload_rejects_references_of_other_targets():
+    bank = references.ReferenceBank(FREQUENCIES, [1, 2], SAMPLING_RATE)
+    with pytest.raises(ValueError, match="References"):
+        bank.preload(np.zeros((3, 100, 4)))
+    with pytest.raises(ValueError, match="References"):
+        bank.preload(np.zeros((4, 100, 6)))
+    with pytest.raises(ValueError, match="Bases"):
+        bank.preload(np.zeros((4, 100, 4)), np.zeros((4, 100, 4)), n_harmonics=1)
+    bank.preload(np.zeros((4, 100, 4)), np.zeros((4, 100, 2)), n_harmonics=1)
+    assert bank.references(100).shape == (4, 100, 4)
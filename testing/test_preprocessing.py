@@ -0,0 +1,89 @@
+import numpy as np
+from brainflow.board_shim import BoardIds
+
+from modules.stream_data import RingBuffer
+from modules.preprocessing import PreProcess
+
+
+class RingOnlyBoard:
+    """Minimal stand-in exposing the attributes PreProcess reads from BrainFlowBoardSetup."""
+    board_id = BoardIds.CYTON_BOARD
+
+    def __init__(self, capacity):
+        self.ring_buffer = RingBuffer(n_channels=2, capacity=capacity)
+
+    def wait_for_samples(self, n_total, timeout=None):
+        return self.ring_buffer.wait_for(n_total, timeout=timeout)
+
+
+def test_sliding_windows_advance_by_hop():
+    board = RingOnlyBoard(capacity=2500)
+    segmenter = PreProcess(board, segment_duration=1, hop_duration=0.2)  # 250 samples, hop 50
+    data = np.tile(np.arange(400, dtype=float), (2, 1))
+    board.ring_buffer.write(data[:, :300])
+
+    first = segmenter.get_next_segment(timeout=0)
+    np.testing.assert_array_equal(first[0], np.arange(50, 300))
+    assert segmenter.get_next_segment(timeout=0) is None
+
+    board.ring_buffer.write(data[:, 300:350])
+    second = segmenter.get_next_segment(timeout=0)
+    np.testing.assert_array_equal(second[0], np.arange(100, 350))
+    assert segmenter.dropped_windows == 0
+
+
+def test_sliding_windows_count_dropped_hops():
+    board = RingOnlyBoard(capacity=2500)
+    segmenter = PreProcess(board, segment_duration=1, hop_duration=0.2)
+    board.ring_buffer.write(np.zeros((2, 250)))
+    segmenter.get_next_segment(timeout=0)
+
+    board.ring_buffer.write(np.zeros((2, 170)))  # three full hops arrived while busy
+    segment = segmenter.get_next_segment(timeout=0)
+    assert segment.shape == (2, 250)
+    assert segmenter.dropped_windows == 2
+
+
+def test_streaming_filter_matches_filtering_whole_stream():
+    from scipy.signal import sosfilt, sosfilt_zi
+    from modules.preprocessing import StreamingFilter
+
+    rng = np.random.default_rng(0)
+    data = rng.standard_normal((3, 1000)) + 50.0
+    stream_filter = StreamingFilter(3, 250)
+    chunks = [stream_filter.process(data[:, i:i + 23]) for i in range(0, 1000, 23)]
+
+    zi = sosfilt_zi(stream_filter.sos)[:, None, :] * data[:, 0][None, :, None]
+    expected, _ = sosfilt(stream_filter.sos, data, axis=-1, zi=zi)
+    np.testing.assert_allclose(np.hstack(chunks), expected, atol=1e-10)
+
+
+def test_filtered_windows_come_from_filtered_ring_buffer():
+    from modules.preprocessing import StreamingFilter
+    from modules.stream_data import ReplayBoard
+
+    recording = np.random.default_rng(1).standard_normal((8, 1500))
+    board = ReplayBoard(recording, BoardIds.CYTON_BOARD, speed=None)
+    board.setup()
+    stream_filter = StreamingFilter(8, board.sampling_rate)
+    board.start_acquisition(buffer_duration=10, stream_filter=stream_filter)
+    segmenter = PreProcess(board, segment_duration=2, hop_duration=1)
+
+    window = segmenter.get_next_segment(filtered=True)
+    reference = StreamingFilter(8, board.sampling_rate).process(recording[:, :board.ring_buffer.n_written])
+    np.testing.assert_allclose(window, reference[:, -500:], atol=1e-10)
+    board.stop()
+
+
+def test_filter_design_is_cached_and_vectorised_filtering_matches_per_channel():
+    from scipy.signal import butter, lfilter
+    from modules.filter_design import design_filter
+
+    assert design_filter(250, [0.5, 30.0], 5) is design_filter(250.0, (0.5, 30), 5)
+    assert design_filter(250, [0.5, 30.0], 5, output='sos').shape == (5, 6)
+
+    segmenter = PreProcess(RingOnlyBoard(capacity=10), segment_duration=1)
+    data = np.random.default_rng(2).standard_normal((8, 500))
+    b, a = butter(5, [0.5 / 125, 30.0 / 125], btype='band')
+    expected = np.array([lfilter(b, a, channel) for channel in data])
+    np.testing.assert_allclose(segmenter.filter_data(data), expected, atol=1e-12)
@@ -0,0 +1,58 @@
+import numpy as np
+
+from modules.recorder import SessionRecorder, load_session, HEADER_SIZE
+
+
+def make_chunks(n_rows=4, n_samples=1000, chunk=37):
+    data = np.random.randn(n_rows, n_samples)
+    data[3] = 1000.0 + np.arange(n_samples) / 250  # timestamp row
+    data[2] = 0
+    data[2, [100, 640]] = [1, 2]  # marker row
+    return data, [data[:, i:i + chunk] for i in range(0, n_samples, chunk)]
+
+
+def test_recorded_session_round_trips_through_memmap(tmp_path):
+    filename = str(tmp_path / 'session.rec')
+    data, chunks = make_chunks()
+    recorder = SessionRecorder(filename, board_id=0, sampling_rate=250, channel_mapping={'1': 'O1'},
+                               eeg_channels=[0, 1], timestamp_channel=3, marker_channel=2, chunk_duration=0.4)
+    for chunk in chunks:
+        recorder.write(chunk)
+    recorder.add_marker(7, sample_index=500)
+    recorder.close()
+
+    session = load_session(filename)
+    assert isinstance(session.data.base, np.memmap)
+    np.testing.assert_array_equal(session.data, data)
+    assert session.sampling_rate == 250 and session.channel_mapping == {'1': 'O1'}
+    np.testing.assert_array_equal(session.time_slice(1.0, 2.0), data[:2, 250:500])
+    np.testing.assert_array_equal(session.markers, [[100, 1], [500, 7], [640, 2]])
+    assert session.timestamps[0].tolist() == [0, 1000.0]
+    assert session.timestamps[1, 0] == 37
+
+
+def test_unclosed_session_recovers_complete_blocks(tmp_path):
+    filename = str(tmp_path / 'crashed.rec')
+    data, chunks = make_chunks()
+    recorder = SessionRecorder(filename, board_id=0, sampling_rate=250, chunk_duration=0.4)
+    for chunk in chunks:
+        recorder.write(chunk)
+    recorder._queue.put(None)
+    recorder._thread.join()
+    recorder._file.close()  # simulate a crash: no final flush, header or index
+
+    session = load_session(filename)
+    assert session.n_samples == 1000 - 1000 % 100
+    np.testing.assert_array_equal(session.data, data[:, :session.n_samples])
+    assert (tmp_path / 'crashed.rec').stat().st_size == HEADER_SIZE + session.data.nbytes
+
+
+def test_empty_session_round_trips(tmp_path):
+    filename = str(tmp_path / 'empty.rec')
+    recorder = SessionRecorder(filename, board_id=0, sampling_rate=250)
+    recorder.add_marker(3, sample_index=0)
+    recorder.close()
+
+    session = load_session(filename)
+    assert session.n_samples == 0 and session.sampling_rate == 250
+    np.testing.assert_array_equal(session.markers, [[0, 3]])
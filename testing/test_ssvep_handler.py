@@ -0,0 +1,300 @@
+import os
+import numpy as np
+import pytest
+
+from modules.ssvep_handler import ClassifySSVEP, FBCCA, TRCA, ExtendedCCA, StreamingCCA, SSVEP_SNR, fbcca_subbands
+from modules.cca import orthonormal_basis, canonical_correlations, canonical_weights
+
+SIM_DATA = os.path.join(os.path.dirname(__file__), '..', 'tinkering', 'sim_ssvep_data.npy')
+FREQUENCIES = [9.25, 11.25, 13.25, 15.25]  # Simulated target changes every 10 s in this order
+SAMPLING_RATE = 250
+N_SAMPLES = 500
+
+
+def sim_window(target_index):
+    data = np.load(SIM_DATA)
+    start = target_index * 10 * SAMPLING_RATE + SAMPLING_RATE
+    return data[:, start:start + N_SAMPLES]
+
+
+@pytest.mark.parametrize('backend', ['qr', 'batched'])
+@pytest.mark.parametrize('stack_harmonics', [True, False])
+def test_native_backends_match_mvlearn(stack_harmonics, backend):
+    harmonics = np.arange(1, 4)
+    qr = ClassifySSVEP(FREQUENCIES, harmonics, SAMPLING_RATE, N_SAMPLES, stack_harmonics, backend=backend)
+    reference = ClassifySSVEP(FREQUENCIES, harmonics, SAMPLING_RATE, N_SAMPLES, stack_harmonics, backend='mvlearn')
+    for target_index, freq in enumerate(FREQUENCIES):
+        window = sim_window(target_index)
+        detected_freq, corr = qr.cca_analysis(window)
+        expected_freq, expected_corr = reference.cca_analysis(window)
+        assert detected_freq == expected_freq == freq
+        assert corr == pytest.approx(expected_corr, abs=1e-8)
+        np.testing.assert_allclose(qr.score(window), reference.score(window), atol=1e-8)
+
+
+@pytest.mark.parametrize('backend', ['qr', 'batched'])
+def test_fbcca_native_backends_match_mvlearn(backend):
+    harmonics = np.arange(1, 3)
+    native = FBCCA(FREQUENCIES, harmonics, SAMPLING_RATE, N_SAMPLES, backend=backend)
+    reference = FBCCA(FREQUENCIES, harmonics, SAMPLING_RATE, N_SAMPLES, backend='mvlearn')
+    for target_index, freq in enumerate(FREQUENCIES):
+        window = sim_window(target_index)
+        detected_freq, score = native.fbcca_analysis(window)
+        expected_freq, expected_score = reference.fbcca_analysis(window)
+        assert detected_freq == expected_freq == freq
+        assert score == pytest.approx(expected_score, abs=1e-8)
+
+
+def test_fbcca_combines_subbands_with_standard_weights():
+    fbcca = FBCCA(FREQUENCIES, [1, 2], SAMPLING_RATE, N_SAMPLES, num_subbands=3, weight_a=1.0, weight_b=0.5)
+    np.testing.assert_allclose(fbcca.subband_weights, [1.5, 1.0, 1 / 3 + 0.5])
+    window = sim_window(0)
+    rho = fbcca.subband_correlations(fbcca.filter_data(window))
+    np.testing.assert_allclose(fbcca.score(window), (fbcca.subband_weights[:, None] * rho ** 2).sum(axis=0))
+
+
+def test_fbcca_is_at_least_as_accurate_as_cca_above_the_first_subband():
+    # Targets above 13 Hz, whose fundamental is outside an equal-width first subband of 6-40 Hz
+    frequencies = [13.25, 17.25, 21.25, 25.25]
+    rng = np.random.default_rng(0)
+    time_axis = np.arange(N_SAMPLES) / SAMPLING_RATE
+    trials, labels = [], []
+    for freq in frequencies:
+        for _ in range(6):
+            phase = rng.uniform(0, 2 * np.pi)
+            signal = np.sin(2 * np.pi * freq * time_axis + phase) + 0.5 * np.sin(4 * np.pi * freq * time_axis + 2 * phase)
+            trials.append(rng.uniform(0.5, 1.0, (8, 1)) * signal + rng.normal(0, 2.0, (8, N_SAMPLES)))
+            labels.append(freq)
+    fbcca = FBCCA(frequencies, [1, 2, 3], SAMPLING_RATE, N_SAMPLES)
+    cca = ClassifySSVEP(frequencies, [1, 2, 3], SAMPLING_RATE, N_SAMPLES)
+    fbcca_accuracy = np.mean(fbcca.classify_batch(np.array(trials))[0] == labels)
+    cca_accuracy = np.mean(cca.classify_batch(np.array(trials))[0] == labels)
+    assert fbcca_accuracy >= cca_accuracy
+
+
+def test_fbcca_subbands_share_the_high_edge():
+    assert fbcca_subbands(SAMPLING_RATE, 5) == [(6, 40), (12, 40), (18, 40), (24, 40), (30, 40)]
+    with pytest.raises(ValueError):
+        fbcca_subbands(SAMPLING_RATE, 7)
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError):
+        ClassifySSVEP(FREQUENCIES, [1], SAMPLING_RATE, N_SAMPLES, backend='sklearn')
+
+
+def test_classifiers_share_one_reference_bank():
+    from modules.references import get_reference_bank
+
+    unstacked = ClassifySSVEP(FREQUENCIES, [1, 2, 3], SAMPLING_RATE, N_SAMPLES, stack_harmonics=False)
+    stacked = ClassifySSVEP(FREQUENCIES, np.arange(1, 4), SAMPLING_RATE, N_SAMPLES, stack_harmonics=True)
+    fbcca = FBCCA(FREQUENCIES, np.arange(1, 4), SAMPLING_RATE, N_SAMPLES)
+    bank = get_reference_bank(FREQUENCIES, [1, 2, 3], SAMPLING_RATE)
+    assert unstacked.reference_bank is stacked.reference_bank is fbcca.reference_bank is bank
+
+    ref = stacked.get_reference_signals(11.25)
+    assert np.shares_memory(ref, unstacked.get_reference_signals(11.25))
+    time = np.arange(N_SAMPLES) / SAMPLING_RATE
+    np.testing.assert_allclose(ref[:, 2], np.sin(2 * np.pi * 2 * 11.25 * time), atol=1e-9)
+    np.testing.assert_allclose(unstacked.get_reference_signals(11.25)[1], np.cos(2 * np.pi * 11.25 * time), atol=1e-9)
+
+
+def test_shared_references_and_bases_are_read_only():
+    import pickle
+    classifier = ClassifySSVEP(FREQUENCIES, [1, 2, 3], SAMPLING_RATE, N_SAMPLES)
+    bank = pickle.loads(pickle.dumps(classifier.reference_bank))  # As sent to worker processes
+    for shared in (classifier.get_reference_signals(9.25), classifier.reference_basis_stack,
+                   bank.references(N_SAMPLES), bank.bases(N_SAMPLES, 2), bank.references(4 * N_SAMPLES)):
+        with pytest.raises(ValueError):
+            shared[0, 0] = 1.0
+
+
+@pytest.mark.parametrize('backend', ['mvlearn', 'batched'])
+def test_any_window_length_matches_a_classifier_built_for_it(backend):
+    window = sim_window(1)[:, :300]
+    long = ClassifySSVEP(FREQUENCIES, [1, 2], SAMPLING_RATE, N_SAMPLES, backend=backend)
+    exact = ClassifySSVEP(FREQUENCIES, [1, 2], SAMPLING_RATE, 300, backend=backend)
+    np.testing.assert_allclose(long.score(window), exact.score(window), atol=1e-10)
+    assert long.cca_analysis(window)[0] == 11.25
+
+
+def sim_epochs(trial_indices):
+    # Trials start 4 s apart, a whole number of cycles of every target, so they are phase-locked like stimulus-onset epochs
+    data = np.load(SIM_DATA)
+    epochs, labels = [], []
+    for target_index, freq in enumerate(FREQUENCIES):
+        for trial in trial_indices:
+            start = target_index * 10 * SAMPLING_RATE + trial * 4 * SAMPLING_RATE
+            epochs.append(data[:, start:start + N_SAMPLES])
+            labels.append(freq)
+    return np.array(epochs), labels
+
+
+@pytest.mark.parametrize('ensemble', [True, False])
+def test_trca_classifies_held_out_trials(ensemble):
+    train, train_labels = sim_epochs([0, 1])
+    test, test_labels = sim_epochs([2])
+    trca = TRCA(FREQUENCIES, SAMPLING_RATE, N_SAMPLES, ensemble=ensemble).fit(train, train_labels)
+    assert trca.spatial_filters.shape == (len(FREQUENCIES), test.shape[1])
+    for window, label in zip(test, test_labels):
+        detected_freq, corr = trca.trca_analysis(window)
+        assert detected_freq == label
+        assert 0 < corr <= 1
+    short = trca.score(test[0][:, :N_SAMPLES // 2])
+    assert short.shape == (len(FREQUENCIES),)
+
+
+def test_trca_fits_with_a_flat_channel():
+    train, train_labels = sim_epochs([0, 1])
+    test, test_labels = sim_epochs([2])
+    train[:, 3] = 0  # Disconnected electrode during calibration
+    test[:, 3] = 0
+    trca = TRCA(FREQUENCIES, SAMPLING_RATE, N_SAMPLES).fit(train, train_labels)
+    assert np.isfinite(trca.spatial_filters).all()
+    for window, label in zip(test, test_labels):
+        assert trca.trca_analysis(window)[0] == label
+
+
+def test_trca_requires_fit_and_calibration_trials():
+    trca = TRCA(FREQUENCIES, SAMPLING_RATE, N_SAMPLES)
+    with pytest.raises(ValueError):
+        trca.score(sim_window(0))
+    train, labels = sim_epochs([0])
+    with pytest.raises(ValueError):
+        trca.fit(train, labels)
+
+
+def test_canonical_weights_give_the_first_canonical_correlation():
+    window = sim_window(1).T
+    references = ClassifySSVEP(FREQUENCIES, [1, 2], SAMPLING_RATE, N_SAMPLES).reference_bank.references(N_SAMPLES)[1]
+    x_weights, y_weights = canonical_weights(window, references)
+    corr = abs(np.corrcoef(window @ x_weights, references @ y_weights)[0, 1])
+    expected = canonical_correlations(orthonormal_basis(window), orthonormal_basis(references))[0]
+    assert corr == pytest.approx(expected, abs=1e-8)
+
+
+def svd_canonical_correlations(x, y):
+    # Reference CCA: orthonormal bases from an SVD that drops the directions the data does not span
+    bases = []
+    for data in (x - x.mean(axis=0), y - y.mean(axis=0)):
+        u, s, _ = np.linalg.svd(data, full_matrices=False)
+        bases.append(u[:, s > 1e-10 * s.max()] if s.max() > 0 else u[:, :0])
+    return np.linalg.svd(bases[0].T @ bases[1], compute_uv=False)
+
+
+@pytest.mark.parametrize('backend', ['qr', 'batched'])
+def test_cca_is_correct_for_rank_deficient_windows(backend):
+    window = np.random.default_rng(0).normal(size=(8, N_SAMPLES))
+    window[4:] = 0  # Unplugged channels
+    classifier = ClassifySSVEP(FREQUENCIES, [1, 2, 3], SAMPLING_RATE, N_SAMPLES, backend=backend)
+    references = classifier.reference_bank.references(N_SAMPLES)
+    expected = [svd_canonical_correlations(window.T, ref)[0] for ref in references]
+    np.testing.assert_allclose(classifier.score(window), expected, atol=1e-6)
+    np.testing.assert_allclose(classifier.score(np.vstack([window[:4], window[:4]])), expected, atol=1e-6)  # Duplicated channels
+    raw = window + np.random.default_rng(1).uniform(-1e5, 1e5, (8, 1))  # Raw, DC-offset window
+    raw[4:] = 187500  # Railed channels
+    np.testing.assert_allclose(classifier.score(raw), expected, atol=1e-6)
+    assert classifier.cca_analysis(np.zeros((8, N_SAMPLES))) == (None, 0)
+
+
+def test_extended_cca_classifies_held_out_trials():
+    train, train_labels = sim_epochs([0, 1])
+    test, test_labels = sim_epochs([2])
+    ecca = ExtendedCCA(FREQUENCIES, [1, 2], SAMPLING_RATE, N_SAMPLES).fit(train, train_labels)
+    for window, label in zip(test, test_labels):
+        assert ecca.ecca_analysis(window)[0] == label
+        assert ecca.ecca_analysis(window[:, :N_SAMPLES // 2])[0] == label
+    with pytest.raises(ValueError):
+        ExtendedCCA(FREQUENCIES, [1, 2], SAMPLING_RATE, N_SAMPLES).score(test[0])
+
+
+def test_streaming_cca_matches_full_window_cca():
+    data = np.load(SIM_DATA)[:, :4 * 10 * SAMPLING_RATE]
+    harmonics = np.arange(1, 4)
+    streaming = StreamingCCA(FREQUENCIES, harmonics, SAMPLING_RATE, N_SAMPLES, data.shape[0], refresh_interval=20)
+    classifier = ClassifySSVEP(FREQUENCIES, harmonics, SAMPLING_RATE, N_SAMPLES)
+    end = 0
+    for hop in [7, 25, 40, 13] * 60:  # Uneven hops, crossing several refreshes
+        streaming.update(data[:, end:end + hop])
+        end += hop
+        if end >= N_SAMPLES:
+            np.testing.assert_allclose(streaming.score(), classifier.score(data[:, end - N_SAMPLES:end]), atol=1e-6)
+    detected_freq, _ = streaming.cca_analysis(data[:, end:end + 2 * N_SAMPLES])  # Longer than the window
+    end += 2 * N_SAMPLES
+    assert detected_freq == classifier.cca_analysis(data[:, end - N_SAMPLES:end])[0]
+    streaming.reset()
+    assert not streaming.score().any()
+
+
+def test_streaming_cca_survives_flat_stretches():
+    data = np.load(SIM_DATA)[:, 9000:11500]  # The simulated recording is all zeros from about sample 10010
+    data = np.hstack([data, np.random.default_rng(0).normal(size=(data.shape[0], 1000))])
+    data[2, 1500:] = 187500  # Railed channel
+    harmonics = np.arange(1, 3)
+    streaming = StreamingCCA(FREQUENCIES, harmonics, SAMPLING_RATE, N_SAMPLES, data.shape[0])
+    classifier = ClassifySSVEP(FREQUENCIES, harmonics, SAMPLING_RATE, N_SAMPLES, backend='qr')
+    for end in range(25, data.shape[1] + 1, 25):
+        streaming.update(data[:, end - 25:end])
+        if end >= N_SAMPLES:
+            np.testing.assert_allclose(streaming.score(), classifier.score(data[:, end - N_SAMPLES:end]), atol=1e-6)
+
+
+def test_reference_bank_rotates_references_to_any_offset():
+    from modules.references import get_reference_bank
+    bank = get_reference_bank(FREQUENCIES, [1, 2, 3], SAMPLING_RATE)
+    offset = 1234
+    expected = bank.references(offset + N_SAMPLES)[:, offset:, :]
+    np.testing.assert_allclose(bank.references_at(offset, N_SAMPLES), expected, atol=1e-9)
+    window = sim_window(2)
+    np.testing.assert_allclose(bank.project_at(window, offset), window @ expected, atol=1e-8)
+
+
+@pytest.mark.parametrize('noise_bandwidth', [0.5, 1, 2])
+def test_snr_matches_per_bin_neighbourhood_loop(noise_bandwidth):
+    signal = np.load(SIM_DATA)[:, :4000].flatten()
+    calculator = SSVEP_SNR(signal, SAMPLING_RATE, noise_bandwidth)
+    freqs, snr = calculator.calculate_snr()
+    _, psd = calculator.calculate_psd()
+    expected = np.zeros_like(psd)
+    for i in range(len(freqs)):
+        noise_range = np.logical_and(freqs >= freqs[i] - noise_bandwidth, freqs <= freqs[i] + noise_bandwidth)
+        noise_range[i] = False
+        expected[i] = 10 * np.log10(psd[i] / np.mean(psd[noise_range]))
+    np.testing.assert_allclose(snr, expected, atol=1e-9)
+    target_bins = [np.argmin(np.abs(freqs - freq)) for freq in FREQUENCIES]
+    np.testing.assert_allclose(calculator.target_snr(FREQUENCIES), expected[target_bins], atol=1e-9)
+
+
+def test_channel_snr_is_batched_over_windows_and_channels():
+    data = np.load(SIM_DATA)
+    classifier = ClassifySSVEP(FREQUENCIES, [1, 2], SAMPLING_RATE, N_SAMPLES)
+    windows = np.stack([sim_window(target_index) for target_index in range(len(FREQUENCIES))])
+    snr, combined = classifier.channel_snr(windows)
+    assert snr.shape == (len(FREQUENCIES), data.shape[0], len(FREQUENCIES))
+    assert combined.shape == (len(FREQUENCIES), len(FREQUENCIES))
+    for target_index, window in enumerate(windows):
+        window_snr, window_combined = classifier.channel_snr(window)
+        np.testing.assert_allclose(window_snr, snr[target_index])
+        np.testing.assert_allclose(window_combined, combined[target_index])
+        np.testing.assert_allclose(window_snr[3], SSVEP_SNR(window[3], SAMPLING_RATE).target_snr(FREQUENCIES))
+        check = classifier.check_snr(window)
+        assert max(check, key=check.get) == FREQUENCIES[target_index]
+
+
+@pytest.mark.parametrize('backend', ['qr', 'batched'])
+def test_classify_batch_matches_per_trial_analysis(backend):
+    data = np.load(SIM_DATA)
+    trials = np.stack([data[:, start:start + N_SAMPLES] for start in range(0, 9000, 300)] + [np.zeros((data.shape[0], N_SAMPLES))])
+    classifier = ClassifySSVEP(FREQUENCIES, [1, 2, 3], SAMPLING_RATE, N_SAMPLES, backend=backend)
+    fbcca = FBCCA(FREQUENCIES, [1, 2, 3], SAMPLING_RATE, N_SAMPLES, backend=backend)
+    for model, analysis in [(classifier, classifier.cca_analysis), (fbcca, fbcca.fbcca_analysis)]:
+        predictions, scores = model.classify_batch(trials, batch_size=7)
+        assert scores.shape == (len(trials), len(FREQUENCIES))
+        np.testing.assert_allclose(scores, [model.score(trial) for trial in trials], atol=1e-6)
+        assert [None if np.isnan(p) else p for p in predictions] == [analysis(trial)[0] for trial in trials]
+        assert np.isnan(predictions[-1])  # A flat trial has no detection
+    # Both backends agree, including on a window with a flat channel
+    trials[:, 0] = 0
+    other = ClassifySSVEP(FREQUENCIES, [1, 2, 3], SAMPLING_RATE, N_SAMPLES, backend='qr' if backend == 'batched' else 'batched')
+    np.testing.assert_allclose(classifier.classify_batch(trials)[1], other.classify_batch(trials)[1], atol=1e-6)
+    np.testing.assert_allclose(classifier.score(trials[3]), other.score(trials[3]), atol=1e-6)
@@ -0,0 +1,99 @@
+import os
+import time
+import numpy as np
+from brainflow.board_shim import BoardIds
+
+from modules.stream_data import RingBuffer, BrainFlowBoardSetup
+
+SIM_DATA = os.path.join(os.path.dirname(__file__), '..', 'tinkering', 'sim_ssvep_data.npy')
+
+
+def test_ring_buffer_returns_latest_samples_in_order():
+    ring = RingBuffer(n_channels=2, capacity=10)
+    data = np.vstack((np.arange(25), -np.arange(25))).astype(float)
+    for start in range(0, 25, 7):
+        ring.write(data[:, start:start + 7])
+
+    assert ring.n_written == 25
+    np.testing.assert_array_equal(ring.latest(10), data[:, -10:])
+    np.testing.assert_array_equal(ring.latest(4), data[:, -4:])
+    assert ring.latest(11) is None
+
+
+def test_ring_buffer_views_are_read_only_and_copies_are_not():
+    ring = RingBuffer(n_channels=1, capacity=8)
+    ring.write(np.arange(20, dtype=float)[None, :])
+
+    view = ring.latest(5)
+    assert not view.flags.writeable
+    assert np.shares_memory(view, ring._data)
+
+    copy = ring.latest(5, copy=True)
+    assert copy.flags.writeable and copy.flags.c_contiguous
+    assert not np.shares_memory(copy, ring._data)
+
+
+def test_ring_buffer_keeps_tail_of_oversized_chunk():
+    ring = RingBuffer(n_channels=1, capacity=5)
+    ring.write(np.arange(12, dtype=float)[None, :])
+    np.testing.assert_array_equal(ring.latest(5)[0], np.arange(7, 12))
+
+
+def test_acquisition_thread_fills_eeg_ring_buffer():
+    board = BrainFlowBoardSetup(BoardIds.SYNTHETIC_BOARD, '')
+    board.setup()
+    try:
+        board.start_acquisition(buffer_duration=2, poll_interval=0.01)
+        time.sleep(0.5)
+        segment = board.get_latest_eeg(50)
+        assert segment.shape == (len(board.eeg_channels), 50)
+    finally:
+        board.stop()
+    assert board.get_latest_eeg(50) is not None
+
+
+def test_ring_buffer_window_by_absolute_sample_count():
+    ring = RingBuffer(n_channels=1, capacity=10)
+    ring.write(np.arange(23, dtype=float)[None, :])
+
+    np.testing.assert_array_equal(ring.window(20, 5)[0], np.arange(15, 20))
+    assert ring.window(24, 5) is None  # not written yet
+    assert ring.window(15, 5) is None  # already overwritten
+    assert ring.wait_for(23, timeout=0)
+    assert not ring.wait_for(24, timeout=0.01)
+
+
+def test_replay_board_as_fast_as_possible_feeds_sliding_windows():
+    from modules.preprocessing import PreProcess
+    from modules.stream_data import ReplayBoard
+
+    recording = np.tile(np.arange(2000, dtype=float), (8, 1))
+    board = ReplayBoard(recording, BoardIds.CYTON_BOARD, speed=None)
+    board.setup()
+    board.start_acquisition(buffer_duration=10)
+    segmenter = PreProcess(board, segment_duration=1, hop_duration=0.5)
+
+    ends = []
+    while True:
+        segment = segmenter.get_next_segment()
+        if segment is None:
+            break
+        ends.append(segment[0, -1])
+    board.stop()
+
+    assert board.exhausted
+    assert ends == list(np.arange(249, 2000, 125))
+    assert segmenter.dropped_windows == 0
+
+
+def test_replay_board_real_time_releases_samples_by_clock():
+    from modules.stream_data import ReplayBoard
+
+    board = ReplayBoard(SIM_DATA, BoardIds.CYTON_BOARD, speed=10.0)
+    assert board.eeg_channels == list(range(8))
+    board.setup()
+    time.sleep(0.2)  # ~500 samples at 10x speed
+    data = board.get_board_data()
+    assert 200 < data.shape[1] < 1500
+    assert board.get_board_data().shape[1] < data.shape[1]
+    board.stop()
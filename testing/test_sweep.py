@@ -0,0 +1,82 @@
+import os
+import numpy as np
+import pytest
+
+from modules.ssvep_handler import FBCCA
+from modules.sweep import ParameterSweep, expand_grid
+
+SIM_DATA = os.path.join(os.path.dirname(__file__), '..', 'tinkering', 'sim_ssvep_data.npy')
+FREQUENCIES = [9.25, 11.25, 13.25, 15.25]  # Simulated target changes every 10 s in this order
+SAMPLING_RATE = 250
+
+
+def sim_recording():
+    data = np.load(SIM_DATA)[:, :4 * 10 * SAMPLING_RATE]
+    labels = np.repeat(FREQUENCIES, 10 * SAMPLING_RATE).astype(float)
+    return data, labels
+
+
+def test_expand_grid_fills_defaults_and_rejects_unknown_parameters():
+    configs = expand_grid({'harmonics': [3, 5], 'segment_duration': [1.0, 2.0]})
+    assert len(configs) == 4
+    assert all(config['num_subbands'] == 5 and config['band'] == (0.5, 30.0) for config in configs)
+    with pytest.raises(ValueError):
+        expand_grid({'order': [4]})
+
+
+def test_classify_filtered_matches_classify_batch():
+    data, _ = sim_recording()
+    trials = np.stack([data[:, start:start + 500] for start in range(0, 10000, 2500)])
+    fbcca = FBCCA(FREQUENCIES, [1, 2, 3], SAMPLING_RATE, 500)
+    np.testing.assert_array_equal(fbcca.classify_filtered(fbcca.filter_data(trials))[0], fbcca.classify_batch(trials)[0])
+
+
+def test_sweep_ranks_configurations_and_reuses_the_cache(tmp_path):
+    grid = {'harmonics': [2, 3], 'segment_duration': [1.0, 2.0], 'band': [(0.5, 30.0), (6.0, 40.0)], 'num_subbands': [3]}
+    serial = ParameterSweep(FREQUENCIES, SAMPLING_RATE, str(tmp_path), hop_duration=1.0, n_workers=1, n_timing=1)
+    results = serial.run(grid, [sim_recording()])
+    assert len(results) == 8
+    itrs = [result['itr'] for result in results]
+    assert itrs == sorted(itrs, reverse=True)
+    assert results[0]['pareto'] and results[0]['accuracy'] > 0.9 and results[0]['cost_ms'] > 0
+    # One raw recording, its labels, two band-filtered copies and two subband decompositions
+    cached = sorted(os.listdir(tmp_path))
+    assert len(cached) == 6 and not any(name.endswith('.tmp.npy') for name in cached)
+    mtimes = {name: os.stat(tmp_path / name).st_mtime_ns for name in cached}
+
+    parallel = ParameterSweep(FREQUENCIES, SAMPLING_RATE, str(tmp_path), hop_duration=1.0, n_workers=2, n_timing=1)
+    again = parallel.run(grid, [sim_recording()], rank_by='accuracy')
+    assert {name: os.stat(tmp_path / name).st_mtime_ns for name in os.listdir(tmp_path)} == mtimes
+    key = lambda result: (result['harmonics'], result['segment_duration'], result['band'])
+    assert sorted((key(r), r['accuracy'], r['n_windows']) for r in again) == \
+        sorted((key(r), r['accuracy'], r['n_windows']) for r in results)
+
+
+def test_sweep_times_on_a_long_enough_recording_and_keeps_empty_configurations_off_the_front(tmp_path):
+    data, labels = sim_recording()
+    short = (data[:, :375], labels[:375])  # 1.5 s, shorter than the 2 s windows
+    sweep = ParameterSweep(FREQUENCIES, SAMPLING_RATE, str(tmp_path), hop_duration=1.0, n_workers=1, n_timing=1)
+    results = sweep.run({'harmonics': [2], 'segment_duration': [1.0, 2.0, 60.0], 'num_subbands': [3]},
+                        [short, sim_recording()])
+    by_duration = {result['segment_duration']: result for result in results}
+    assert by_duration[2.0]['n_windows'] > 0 and by_duration[2.0]['cost_ms'] > 0
+    empty = by_duration[60.0]
+    assert empty['n_windows'] == 0 and np.isnan(empty['itr']) and np.isnan(empty['cost_ms'])
+    assert not empty['pareto'] and results[-1] is empty
+    assert any(result['pareto'] for result in results)
+
+
+def test_sweep_times_configurations_serially_in_the_calling_process(tmp_path, monkeypatch):
+    from modules import sweep
+    timed = []
+    time_config = sweep._time_config
+
+    def record(*args):
+        timed.append(os.getpid())
+        return time_config(*args)
+    monkeypatch.setattr(sweep, '_time_config', record)
+    grid = {'harmonics': [2, 3], 'segment_duration': [1.0], 'num_subbands': [3]}
+    results = ParameterSweep(FREQUENCIES, SAMPLING_RATE, str(tmp_path), hop_duration=1.0, n_workers=2, n_timing=1).run(
+        grid, [sim_recording()])
+    assert timed == [os.getpid()] * 2
+    assert all(result['cost_ms'] > 0 for result in results)